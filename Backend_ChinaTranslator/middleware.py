@@ -0,0 +1,151 @@
+import time
+import asyncio
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from translate import profiling
+from translate.metrics import metrics, get_route, REQUEST_DURATION, PHASE_DURATION
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """WhiteNoise, поддерживающий асинхронную цепочку middleware
+
+    Исходный WhiteNoiseMiddleware только синхронный, поэтому под ASGI Django
+    выполняет всю цепочку после него в одном потоке и асинхронные запросы
+    обрабатываются строго по очереди"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        response = super().__call__(request)
+        if asyncio.iscoroutine(response):
+            response = await response
+        return response
+
+
+class MetricsMiddleware:
+    """Время обработки запросов и отрисовки ответов для /metrics
+
+    Время запроса записывается с маршрутом, методом и статусом ответа, время
+    отрисовки ответов DRF - как этап render. Должен быть первым в MIDDLEWARE,
+    чтобы учитывать время остальных middleware"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, start)
+        return response
+
+    @staticmethod
+    def observe(request, response, start):
+        metrics.observe(
+            REQUEST_DURATION, time.perf_counter() - start,
+            route=get_route(request), method=request.method, status=response.status_code
+        )
+
+    def process_template_response(self, request, response):
+        # Django отрисовывает ответ сразу после этого вызова и затем вызывает обработчики
+        start = time.perf_counter()
+        response.add_post_render_callback(lambda _: metrics.observe(
+            PHASE_DURATION, time.perf_counter() - start, route=get_route(request), phase="render"
+        ))
+        return response
+
+
+class ProfilingMiddleware:
+    """Профилирование выборки запросов
+
+    Профилируется доля TRANSLATE_PROFILE_RATE запросов и запросы администраторов
+    с заголовком TRANSLATE_PROFILE_HEADER (значение - режим cprofile или sample).
+    Профили сохраняются в TRANSLATE_PROFILE_DIR с маршрутом, словарями и длиной
+    текста в имени. Должен быть последним в MIDDLEWARE, чтобы профиль охватывал
+    представление. Под ASGI профилируется поток цикла событий, поэтому в профиль
+    попадают и параллельные запросы, а запрос, начатый во время чужого профиля,
+    не профилируется"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def get_mode(request):
+        mode = profiling.requested(request)
+        if mode is None and profiling.sampled():
+            mode = profiling.get_mode()
+        return mode
+
+    async def aget_mode(self, request):
+        """get_mode для ASGI: заголовок профиля проверяется по токену с запросом к базе,
+        поэтому такой запрос выполняется в потоке, а не в цикле событий"""
+        if request.META.get(profiling.get_header()):
+            return await sync_to_async(self.get_mode)(request)
+        return self.get_mode(request)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        mode = self.get_mode(request)
+        if mode is None:
+            return self.get_response(request)
+        tags = profiling.get_tags(request)
+        profile = profiling.Profile(mode).start()
+        if profile is None:
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.stop()
+        self.save(request, response, profile, tags)
+        return response
+
+    async def __acall__(self, request):
+        mode = await self.aget_mode(request)
+        if mode is None:
+            return await self.get_response(request)
+        tags = profiling.get_tags(request)
+        profile = profiling.Profile(mode).start()
+        if profile is None:
+            return await self.get_response(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            profile.stop()
+        self.save(request, response, profile, tags)
+        return response
+
+    @staticmethod
+    def save(request, response, profile, tags):
+        names = profiling.ProfileStore().save(profile, dict(tags, endpoint=get_route(request)))
+        response["X-Profile-Name"] = ", ".join(names)
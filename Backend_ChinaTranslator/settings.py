@@ -43,9 +43,11 @@ INSTALLED_APPS = [
     'crispy_forms',
     'corsheaders',
     'user',
+    'translate',
 ]
 
 MIDDLEWARE = [
+    'Backend_ChinaTranslator.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,6 +57,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'Backend_ChinaTranslator.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'Backend_ChinaTranslator.urls'
@@ -94,10 +97,29 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'translate': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'translate'),
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
 if 'test' in sys.argv:
     DATABASES['default'] = {
         'ENGINE': 'django.db.backends.sqlite3',
     }
+    CACHES['translate'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'translate',
+    }
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -158,10 +180,145 @@ REST_FRAMEWORK = {
 
 AUTH_USER_MODEL = 'user.MyUser'
 
+# Одновременно хэшируется и проверяется не больше AUTH_HASH_WORKERS паролей, поток запроса ждет
+# своего хэша. Стоимость хэша задается AUTH_PASSWORD_ITERATIONS, пароль с другой стоимостью
+# перехэшируется при входе
+PASSWORD_HASHERS = [
+    'user.hashing.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+AUTH_PASSWORD_ITERATIONS = 216000
+AUTH_HASH_WORKERS = 2
+
+# Генерация имен: файл слов строится командой build_words, пока его нет, слова читаются из базы
+USER_WORDS_ASSET = os.path.join(BASE_DIR, 'user', 'words.bin')
+USER_WORDS_DATABASE = 'words_database.db'
+# Неповторяющиеся имена: позиции перестановки имен забираются у курсора в базе блоками
+# по USER_NAME_BLOCK_SIZE, занятые имена отсеиваются фильтром Блума с долей ложных срабатываний
+# USER_NAME_BLOOM_ERROR_RATE. Курсор хранится в базе слов, если USER_NAME_CURSOR_DATABASE не задан
+USER_NAME_CURSOR_DATABASE = None
+USER_NAME_BLOCK_SIZE = 256
+USER_NAME_BLOOM_ERROR_RATE = 0.001
+# Массовый импорт пользователей: размер пачки и число процессов хэширования паролей (None - по числу ядер)
+USER_IMPORT_BATCH_SIZE = 500
+USER_IMPORT_WORKERS = None
+# Импорт через API выполняется в запросе без пула процессов, больший запрос отклоняется
+USER_IMPORT_API_MAX_SIZE = 16 * 1024
+
+# Кэш аутентификации: проверенные токены хранятся до истечения срока действия, но не дольше
+# AUTH_TOKEN_CACHE_TTL секунд, активные пользователи - AUTH_USER_CACHE_TTL секунд. Изменение пользователя
+# сбрасывает кэш своего процесса, остальные процессы увидят его не позже чем через AUTH_USER_CACHE_TTL
+AUTH_CACHE_ENABLED = True
+AUTH_TOKEN_CACHE_SIZE = 4096
+AUTH_TOKEN_CACHE_TTL = 5 * 60
+AUTH_USER_CACHE_SIZE = 1024
+AUTH_USER_CACHE_TTL = 60
+# Подписанные утверждения токена (имя, активность, права) действительны AUTH_CLAIMS_TTL секунд,
+# пока они действительны, представления только для чтения не загружают пользователя.
+# Список отключенных пользователей перечитывается из базы в фоне каждые AUTH_DENY_LIST_REFRESH секунд
+AUTH_CLAIMS_TTL = 60 * 60
+AUTH_DENY_LIST_REFRESH = 60
+
+# Translate
+# Размер общего пула потоков для параллельной загрузки словарей
+TRANSLATE_FETCH_WORKERS = 8
+# Адреса словарей, переопределяются переменными окружения для локальных заглушек
+TRANSLATE_UPSTREAM_URLS = {
+    "bkrs": os.environ.get("TRANSLATE_BKRS_URL", "https://bkrs.info/slovo.php?ch="),
+    "zhonga": os.environ.get("TRANSLATE_ZHONGA_URL", "https://www.zhonga.ru/search?q="),
+}
+# Пул keep-alive соединений с каждым словарем и таймауты запросов в секундах
+TRANSLATE_UPSTREAM_POOL_SIZE = 10
+TRANSLATE_UPSTREAM_CONNECT_TIMEOUT = 3.05
+TRANSLATE_UPSTREAM_READ_TIMEOUT = 10
+# Потоковая загрузка: страница разбирается по мере получения, загрузка прекращается, как только
+# получен результат. Ответ больше MAX_RESPONSE_SIZE байт отклоняется, недочитанный остаток
+# не больше DRAIN_SIZE байт дочитывается, чтобы соединение вернулось в пул
+TRANSLATE_UPSTREAM_STREAMING = True
+TRANSLATE_UPSTREAM_MAX_RESPONSE_SIZE = 2 * 1024 * 1024
+TRANSLATE_UPSTREAM_DRAIN_SIZE = 64 * 1024
+# Воркер gunicorn открывает соединения со словарями до приема запросов (см. gunicorn.conf.py),
+# соединение, не открывшееся за WARM_TIMEOUT секунд, откроется при первом запросе
+TRANSLATE_WARM_UPSTREAM = True
+TRANSLATE_WARM_TIMEOUT = 2
+# Кэш переводов: размер кэша в памяти процесса, псевдоним общего кэша из CACHES,
+# время жизни записей по словарям и время, в течение которого устаревшая запись
+# отдается, пока в фоне загружается новая (0 - отключено)
+TRANSLATE_CACHE_ENABLED = True
+TRANSLATE_CACHE_SIZE = 1024
+TRANSLATE_CACHE_ALIAS = 'translate'
+TRANSLATE_CACHE_TTL = {"bkrs": 7 * 24 * 60 * 60, "zhonga": 7 * 24 * 60 * 60}
+TRANSLATE_CACHE_STALE_TTL = 24 * 60 * 60
+# Сколько еще хранится просроченная запись, чтобы отдать ее, если словарь недоступен или перегружен
+TRANSLATE_CACHE_FALLBACK_TTL = 7 * 24 * 60 * 60
+# Одновременные запросы одного текста в процессе ждут одну загрузку страницы. С SHARED_LOCK
+# промах загружает один процесс, остальные ждут записи в общем кэше не дольше LOCK_TIMEOUT
+# секунд, проверяя ее каждые LOCK_POLL секунд. Блокировка строится на cache.add, строгая
+# гарантия нужна от кэша с атомарным add (memcached, redis), файловый кэш дает ее не всегда
+TRANSLATE_COALESCE = True
+TRANSLATE_CACHE_SHARED_LOCK = False
+TRANSLATE_CACHE_LOCK_TIMEOUT = 15
+TRANSLATE_CACHE_LOCK_POLL = 0.05
+# Устойчивость к сбоям словарей: срок выполнения запроса на перевод в секундах, после
+# CIRCUIT_FAILURES ошибок подряд словарь отключается на CIRCUIT_RESET секунд. С HEDGE запрос,
+# который отвечает дольше HEDGE_PERCENTILE перцентиля времени ответа словаря (по последним
+# запросам, не меньше HEDGE_MIN_SAMPLES), повторяется, используется первый полученный ответ
+TRANSLATE_DEADLINE = 8
+TRANSLATE_CIRCUIT_FAILURES = 5
+TRANSLATE_CIRCUIT_RESET = 30
+TRANSLATE_HEDGE = False
+TRANSLATE_HEDGE_PERCENTILE = 95
+TRANSLATE_HEDGE_MIN_SAMPLES = 20
+TRANSLATE_HEDGE_WORKERS = 8
+# Ограничение нагрузки на словари: частота запросов в секунду и пик по словарям, начальный
+# и предельные лимиты одновременных запросов (подстраиваются по AIMD), размер очереди
+# ожидающих запросов и время ожидания в ней в секундах
+TRANSLATE_RATE_LIMIT = {"bkrs": 10, "zhonga": 10}
+TRANSLATE_RATE_BURST = {"bkrs": 20, "zhonga": 20}
+TRANSLATE_CONCURRENCY_INITIAL = 4
+TRANSLATE_CONCURRENCY_MIN = 1
+TRANSLATE_CONCURRENCY_MAX = 16
+TRANSLATE_LIMIT_QUEUE_SIZE = 32
+TRANSLATE_LIMIT_QUEUE_TIMEOUT = 1.0
+# Пакетный перевод: максимальное количество текстов в запросе и одновременных запросов к словарям
+TRANSLATE_BATCH_MAX_ITEMS = 100
+TRANSLATE_BATCH_CONCURRENCY = 4
+# Индекс локального словаря, строится командой import_cedict
+TRANSLATE_LOCAL_DICTIONARY = os.path.join(BASE_DIR, 'dictionary', 'cedict.idx')
+# Профилирование: доля профилируемых запросов (0 - только по заголовку HEADER от администратора),
+# режим по умолчанию (cprofile или sample - выборка стеков каждые INTERVAL секунд с tracemalloc),
+# каталог профилей и сколько последних файлов в нем хранится
+TRANSLATE_PROFILE_RATE = 0.0
+TRANSLATE_PROFILE_HEADER = 'X-Profile'
+TRANSLATE_PROFILE_MODE = 'cprofile'
+TRANSLATE_PROFILE_INTERVAL = 0.005
+TRANSLATE_PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+TRANSLATE_PROFILE_KEEP = 100
+
 CORS_ORIGIN_ALLOW_ALL = False
 CORS_ALLOW_CREDENTIALS = True
 CORS_ORIGIN_WHITELIST = [
     "https://murahika.github.io"
 ]
 
-django_heroku.settings(locals())
\ No newline at end of file
+django_heroku.settings(locals())
+
+# Ошибки базы слов генерации имен записываются в sample.log. Обработчик добавляется только
+# логгеру модуля, логи остального приложения по-прежнему идут в консоль
+LOGGING['handlers']['sample'] = {
+    'level': 'ERROR',
+    'class': 'logging.FileHandler',
+    'filename': 'sample.log',
+    'delay': True,
+}
+LOGGING['loggers']['user.namegenerator'] = {'handlers': ['sample'], 'level': 'ERROR', 'propagate': False}
+
+# django_heroku добавляет синхронный WhiteNoiseMiddleware, который под ASGI
+# выполняет все запросы в одном потоке, заменяем его на асинхронный вариант
+MIDDLEWARE = [
+    'Backend_ChinaTranslator.middleware.StaticFilesMiddleware'
+    if middleware == 'whitenoise.middleware.WhiteNoiseMiddleware' else middleware
+    for middleware in MIDDLEWARE
+]
\ No newline at end of file
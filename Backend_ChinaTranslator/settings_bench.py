@@ -0,0 +1,25 @@
+"""
+Django settings for benchmarks and load tests.
+
+Uses a local sqlite database so that benchmarks do not need PostgreSQL:
+
+    python manage.py bench_async --settings=Backend_ChinaTranslator.settings_bench
+"""
+
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import os
+
+DEBUG = False
+
+ALLOWED_HOSTS = ['*']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get(
+            'BENCH_DATABASE', os.path.join(tempfile.gettempdir(), 'china_translator_bench.sqlite3')
+        ),
+    }
+}
@@ -15,10 +15,19 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from translate.views import ParserAPIView
+from translate.views import ParserAPIView, AsyncParserAPIView, BatchParserAPIView, StreamParserAPIView, \
+    CacheStatsAPIView, SourceStatsAPIView, ProfilesAPIView, ProfileAPIView, MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('user.urls')),
-    path('translate/', ParserAPIView.as_view())
+    path('translate/', ParserAPIView.as_view()),
+    path('translate/async/', AsyncParserAPIView.as_view()),
+    path('translate/batch/', BatchParserAPIView.as_view()),
+    path('translate/stream/', StreamParserAPIView.as_view()),
+    path('translate/cache-stats/', CacheStatsAPIView.as_view()),
+    path('translate/source-stats/', SourceStatsAPIView.as_view()),
+    path('translate/profiles/', ProfilesAPIView.as_view()),
+    path('translate/profiles/<str:name>/', ProfileAPIView.as_view()),
+    path('metrics/', MetricsView.as_view())
 ]
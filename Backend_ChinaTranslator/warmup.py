@@ -0,0 +1,72 @@
+"""Прогрев приложения для gunicorn, хуки вызываются из gunicorn.conf.py
+
+prebuild выполняется в мастере после загрузки приложения (preload_app), поэтому
+модули и неизменяемые структуры создаются один раз и разделяются воркерами
+копированием при записи. after_fork закрывает унаследованные от мастера
+соединения, warm_worker открывает соединения воркера до приема запросов"""
+import os
+import logging
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import connections
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def prebuild():
+    """Загружает в мастере все, что воркеры иначе загружали бы при первых запросах:
+    модули представлений, проверки текста и разбора страниц, маршруты, индекс
+    локального словаря и таблицы слов для имен"""
+    # Django импортирует ROOT_URLCONF, а с ним представления, сериализаторы, lxml, bs4
+    # и httpx, только при первом запросе. Разбор маршрутов заодно строит их обратные таблицы
+    resolver = get_resolver()
+    resolver.url_patterns
+    resolver.reverse_dict
+
+    # Выражения проверки текста и XPath разбора страниц скомпилированы при импорте представлений
+    from translate.dictionary import get_local_dictionary
+    get_local_dictionary()
+
+    # Таблицы слов для имен: из файла build_words или из базы слов. Если нет ни того, ни другого,
+    # таблицы не загружаются: sqlite создал бы пустую базу на месте отсутствующей
+    from user.namegenerator import get_word_tables
+    paths = (getattr(settings, "USER_WORDS_ASSET", None), getattr(settings, "USER_WORDS_DATABASE", None))
+    if any(path and os.path.exists(path) for path in paths):
+        get_word_tables()
+
+    # Соединения, открытые в мастере, нельзя использовать в нескольких процессах
+    connections.close_all()
+
+
+def after_fork():
+    """Сбрасывает в воркере соединения, унаследованные от мастера"""
+    from translate import upstream
+    for connection in connections.all():
+        # Закрытие сокета в воркере закрыло бы соединение мастера, поэтому оно только забывается
+        connection.connection = None
+    upstream.reset()
+
+
+def warm_worker():
+    """Открывает соединение с базой и keep-alive соединения со словарями до приема запросов
+    Соединение с базой хранится в потоке, поэтому переиспользуется только синхронным воркером,
+    соединения со словарями общие для процесса. Ошибки прогрева не мешают запуску воркера"""
+    from translate import upstream
+    for connection in connections.all():
+        try:
+            connection.ensure_connection()
+        except Exception:
+            logger.warning("Не удалось открыть соединение с базой %s", connection.alias, exc_info=True)
+
+    if not getattr(settings, "TRANSLATE_WARM_UPSTREAM", True):
+        return
+    session = upstream.get_session()
+    timeout = getattr(settings, "TRANSLATE_WARM_TIMEOUT", 2)
+    for scheme, host in {urlsplit(url)[:2] for url in settings.TRANSLATE_UPSTREAM_URLS.values()}:
+        try:
+            # Ответ HEAD без тела сразу возвращает соединение в пул сессии
+            session.head("%s://%s/" % (scheme, host), timeout=timeout).close()
+        except Exception:
+            logger.warning("Не удалось открыть соединение с %s", host, exc_info=True)
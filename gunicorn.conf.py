@@ -0,0 +1,32 @@
+"""Настройки gunicorn, адрес и число воркеров берутся из PORT и WEB_CONCURRENCY
+
+Приложение загружается в мастере до fork воркеров (GUNICORN_PRELOAD=0 отключает),
+неизменяемые структуры строятся там же и разделяются воркерами. Каждый воркер
+открывает соединения с базой и словарями до приема запросов (GUNICORN_WARM=0 отключает)"""
+import os
+import gc
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+warm = os.environ.get("GUNICORN_WARM", "1") == "1"
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from Backend_ChinaTranslator import warmup
+    warmup.prebuild()
+    # Сборщик мусора не обходит замороженные объекты и не пишет в их заголовки,
+    # поэтому страницы памяти мастера дольше остаются общими с воркерами
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from Backend_ChinaTranslator import warmup
+        warmup.after_fork()
+
+
+def post_worker_init(worker):
+    if warm:
+        from Backend_ChinaTranslator import warmup
+        warmup.warm_worker()
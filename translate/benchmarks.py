@@ -0,0 +1,255 @@
+import os
+import sys
+import json
+import time
+import socket
+import statistics
+import subprocess
+
+import requests
+from bs4 import BeautifulSoup
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from user.models import MyUser
+from .stats import percentile
+
+BENCH_MAIL = "bench@mail.ru"
+BENCH_PASSWORD = "Bench12345"
+# Приложение для gunicorn по классу воркеров: ASGI-воркерам нужен asgi.py
+WSGI_APP = "Backend_ChinaTranslator.wsgi"
+ASGI_APP = "Backend_ChinaTranslator.asgi:application"
+
+
+def summarize(latencies, elapsed: float, errors: int = 0):
+    """Сводка по прогону: количество запросов, пропускная способность и перцентили задержки в мс"""
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p90_ms": round(percentile(latencies, 90) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies, default=0) * 1000, 3),
+    }
+
+
+def check_database():
+    """Выбрасывает CommandError, если бенчмарк запущен не на sqlite
+    Бенчмарки применяют миграции и создают своего пользователя, поэтому не должны запускаться
+    на рабочей базе: настройки для них - Backend_ChinaTranslator.settings_bench"""
+    engine = settings.DATABASES["default"]["ENGINE"]
+    if engine != "django.db.backends.sqlite3":
+        raise CommandError(
+            "Бенчмарки запускаются только на sqlite, а не на %s: "
+            "укажите --settings=Backend_ChinaTranslator.settings_bench" % engine
+        )
+
+
+def prepare_database():
+    """Применяет миграции и возвращает токен пользователя для бенчмарков"""
+    check_database()
+    call_command("migrate", verbosity=0, interactive=False)
+    user = MyUser.objects.filter(mail=BENCH_MAIL).first()
+    if user is None:
+        user = MyUser.objects.create_user(BENCH_MAIL, "Bench", BENCH_PASSWORD)
+    return user.token
+
+
+def dump_report(report, stdout):
+    """Выводит отчет бенчмарка в формате json"""
+    stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def measure(call, iterations: int, warmup: int = 1):
+    """Медиана и 99-й перцентиль времени вызова call() в микросекундах"""
+    for _ in range(warmup):
+        call()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    return {
+        "median_us": round(statistics.median(timings) * 1000000, 2),
+        "p99_us": round(percentile(timings, 99) * 1000000, 2),
+    }
+
+
+def flatten(report, prefix: str = ""):
+    """Числовые значения вложенного отчета с ключами вида "e2e.p99_ms" """
+    values = {}
+    for key, value in report.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            values.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+    return values
+
+
+def direction(name: str):
+    """1, если рост значения - регрессия (время), -1, если регрессия - падение (пропускная способность),
+    None для значений, которые не сравниваются"""
+    metric = name.rsplit(".", 1)[-1]
+    if metric.endswith(("_ms", "_us", "_ns")) and not metric.startswith("max"):
+        return 1
+    if metric.endswith("_rps"):
+        return -1
+    return None
+
+
+def compare(report, baseline, threshold: float):
+    """Сравнивает отчет с базовым, возвращает регрессии больше threshold (доля, 0.2 - 20%)
+    Сравниваются время (медиана и перцентили) и пропускная способность, максимум не сравнивается,
+    потому что зависит от единичных выбросов"""
+    current = flatten(report)
+    regressions = []
+    for name, base in sorted(flatten(baseline).items()):
+        sign = direction(name)
+        if sign is None or name not in current or not base:
+            continue
+        change = (current[name] - base) / base
+        if change * sign > threshold:
+            regressions.append({"metric": name, "baseline": base, "current": current[name],
+                                "change": round(change, 4)})
+    return regressions
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Server:
+    """gunicorn с приложением в отдельном процессе и настройками из gunicorn.conf.py
+    Словари подменяются заглушкой через переменные окружения. preload загружает приложение
+    в мастере до fork воркеров, warm открывает соединения воркера до приема запросов"""
+
+    def __init__(self, stub, worker_class: str = "sync", workers: int = 2, threads: int = 1,
+                 preload: bool = False, warm: bool = None):
+        self.port = free_port()
+        self.url = "http://127.0.0.1:%s" % self.port
+        app = ASGI_APP if "uvicorn" in worker_class.lower() else WSGI_APP
+        self.command = [
+            sys.executable, "-m", "gunicorn", app,
+            "--config", os.path.join(settings.BASE_DIR, "gunicorn.conf.py"),
+            "--bind", "127.0.0.1:%s" % self.port,
+            "--workers", str(workers),
+            "--worker-class", worker_class,
+            "--threads", str(threads),
+            "--timeout", "60",
+            "--log-level", "warning",
+        ]
+        self.env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "Backend_ChinaTranslator.settings_bench"),
+            TRANSLATE_BKRS_URL=stub.urls["bkrs"],
+            TRANSLATE_ZHONGA_URL=stub.urls["zhonga"],
+            GUNICORN_PRELOAD="1" if preload else "0",
+            GUNICORN_WARM="1" if (preload if warm is None else warm) else "0",
+        )
+        self.process = None
+
+    def spawn(self):
+        """Запускает gunicorn, не дожидаясь готовности"""
+        self.process = subprocess.Popen(self.command, env=self.env, cwd=str(settings.BASE_DIR))
+        return self
+
+    def start(self, timeout: float = 60):
+        """Запускает gunicorn и ждет, пока он начнет отвечать"""
+        self.spawn()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            self.check()
+            try:
+                # Без preload воркер загружает приложение при первом запросе, поэтому ответ может быть долгим
+                requests.get(self.url + "/get-name/", timeout=10)
+                return self
+            except requests.RequestException:
+                time.sleep(0.1)
+        self.stop()
+        raise CommandError("gunicorn не начал отвечать за %s секунд" % timeout)
+
+    def check(self):
+        """Выбрасывает CommandError, если gunicorn завершился"""
+        if self.process.poll() is not None:
+            raise CommandError("gunicorn завершился с кодом %s" % self.process.returncode)
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+
+def bkrs_soup(source_text: str, content: bytes):
+    """Исходный разбор страницы bkrs через BeautifulSoup
+    Эталон для сравнения результата и производительности разбора lxml в тестах и бенчмарке"""
+    soup = BeautifulSoup(content, "lxml")
+    result = []
+    tables = soup.body("table", {"class": "tbl_bywords"})
+    if len(tables) > 0:
+        original_strings = []
+        pinyin_strings = []
+        translated_strings = []
+        for table in tables:
+            for count, row in enumerate(table('tr')):
+                for block in row('td'):
+                    if block.center:
+                        pinyin_strings.append([block.center.text])
+                    if count % 2 == 0:
+                        a = block('a')
+                        original_strings.append(a[0].contents if len(a) > 0 else block.contents)
+                    else:
+                        translated_strings.append(
+                            [data.text.strip() for data in block('div')] if len(block('div')) > 0 else [
+                                block.text.strip()])
+        for original, pinyin, translated in zip(original_strings, pinyin_strings, translated_strings):
+            result.append([original, pinyin, translated])
+    else:
+        original = [source_text]
+        pinyin = [soup.body.find("div", {"class": "py"}).text.strip()]
+        translated = [t.text.strip() for t in soup.body("div", {"class": "ru"})]
+        result.append(original)
+        result.append(pinyin)
+        result.append(translated)
+    return result
+
+
+def zhonga_soup(source_text: str, content: bytes):
+    """Исходный разбор страницы zhonga через BeautifulSoup
+    Эталон для сравнения результата и производительности разбора lxml в тестах и бенчмарке"""
+    original_strings = []
+    pinyin_strings = []
+    translated_strings = []
+    soup = BeautifulSoup(content, "lxml")
+    tables = soup.body("div", {"class": "segmented-unit"})
+    result = []
+    if len(tables) > 0:
+        for string in tables:
+            original_strings.append([string.find("div", {"class": "segmented-unit-value"}).a.text])
+            pinyin_strings.append([string.find("span", {"class": "pinyin"}).text.strip()])
+            try:
+                translate = string.find("div", {"class": "segmented-unit-dic-definitions"}).text.strip()
+                if string.find("div", {"class": "segmented-unit-user-definitions"}):
+                    translate += string.find("div", {"class": "segmented-unit-user-definitions"}).text.strip()
+            except Exception:
+                translate = string.find("div", {"class": "segmented-unit-user-definitions"}).text.strip()
+            translated_strings.append([translate])
+        for original, pinyin, translated in zip(original_strings, pinyin_strings, translated_strings):
+            result.append([original, pinyin, translated])
+    else:
+        original = [source_text]
+        pinyin = [soup.body.find("span", {"class": "pinyin"}).text.strip()]
+        translated = [t.text.strip() for t in soup.body("div", {"id": "unit-dic-definitions"})]
+        result.append(original)
+        result.append(pinyin)
+        result.append(translated)
+    return result
@@ -0,0 +1,299 @@
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from .resilience import Deadline, SourceUnavailable
+
+logger = logging.getLogger(__name__)
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш ограниченного размера
+    У записи может быть время жизни, просроченные записи не возвращаются"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TranslationCache:
+    """Двухуровневый кэш результатов перевода по ключу (текст, словарь)
+    L1 - LRU-кэш в памяти процесса, L2 - общий для процессов кэш Django
+    Пока запись свежая, она отдается из кэша. После истечения TTL словаря запись
+    еще TRANSLATE_CACHE_STALE_TTL секунд отдается устаревшей, а в фоне загружается новая
+    При TRANSLATE_CACHE_SHARED_LOCK промах загружает только один процесс: он берет блокировку
+    в общем кэше, остальные ждут появления записи. Просроченная запись хранится еще
+    TRANSLATE_CACHE_FALLBACK_TTL секунд и отдается, если словарь недоступен или перегружен"""
+
+    def __init__(self):
+        self.l1 = LRUCache(getattr(settings, "TRANSLATE_CACHE_SIZE", 1024))
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="translate-cache-refresh")
+        self._stats = dict.fromkeys(("l1_hits", "l2_hits", "stale_hits", "misses", "refreshes", "refresh_errors", "lock_waits", "fallbacks"), 0)
+
+    @property
+    def l2(self):
+        return caches[getattr(settings, "TRANSLATE_CACHE_ALIAS", "default")]
+
+    @staticmethod
+    def key(source: str, text: str):
+        """Ключ записи по точному тексту: текст отправляется словарю и возвращается в результате
+        без изменений, поэтому тексты, отличающиеся пробелами или формой записи символов,
+        не должны получать результат друг друга"""
+        return "translate:%s:%s" % (source, hashlib.sha1(text.encode("utf-8")).hexdigest())
+
+    @staticmethod
+    def ttl(source: str):
+        return getattr(settings, "TRANSLATE_CACHE_TTL", {}).get(source, 24 * 60 * 60)
+
+    @staticmethod
+    def stale_ttl():
+        return getattr(settings, "TRANSLATE_CACHE_STALE_TTL", 0)
+
+    @staticmethod
+    def fallback_ttl():
+        return getattr(settings, "TRANSLATE_CACHE_FALLBACK_TTL", 0)
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, "TRANSLATE_CACHE_ENABLED", True)
+
+    @staticmethod
+    def shared_lock():
+        return getattr(settings, "TRANSLATE_CACHE_SHARED_LOCK", False)
+
+    @staticmethod
+    def lock_timeout():
+        """Время жизни блокировки загрузки, после него ожидающие процессы загружают страницу сами"""
+        return getattr(settings, "TRANSLATE_CACHE_LOCK_TIMEOUT", 15)
+
+    def get_or_fetch(self, source: str, text: str, fetch, refresh=None, deadline: Deadline = None):
+        """Возвращает результат из кэша или вызывает fetch() и сохраняет его результат
+        refresh - функция для фонового обновления, по умолчанию fetch. Она выполняется после
+        ответа на запрос, поэтому не должна ничего передавать в этот запрос
+        deadline - срок запроса, дольше которого не ждется загрузка другим процессом"""
+        if not self.enabled():
+            return fetch()
+        key = self.key(source, text)
+        entry = self._lookup(key)
+        if entry is None or entry[2] <= time.time():
+            entry = self._lookup_l2(key, self.l2.get(key)) or entry
+        value = self._serve(source, text, entry, refresh or fetch)
+        if value is not None:
+            return value
+        try:
+            return self._fetch(key, source, text, fetch, deadline)
+        except SourceUnavailable:
+            if entry is None:
+                raise
+            return self._fallback(entry)
+
+    def _fetch(self, key, source, text, fetch, deadline: Deadline = None):
+        """Загружает значение при промахе, с TRANSLATE_CACHE_SHARED_LOCK - под блокировкой в общем кэше
+        Ожидание блокировки ограничено сроком запроса, по его истечении выбрасывается DeadlineExceeded
+        Если блокировку не удалось взять за lock_timeout, значение загружается без нее,
+        а чужая блокировка не снимается"""
+        if not self.shared_lock():
+            value = fetch()
+            self.set(source, text, value)
+            return value
+
+        lock = key + ":lock"
+        expires = time.monotonic() + self.lock_timeout()
+        locked = self.l2.add(lock, 1, self.lock_timeout())
+        while not locked and time.monotonic() < expires:
+            if deadline is not None:
+                deadline.check()
+            time.sleep(self._poll_interval(deadline))
+            entry = self.l2.get(key)
+            if entry is not None and entry[2] > time.time():
+                self._count("lock_waits")
+                return self._lookup_l2(key, entry)[0]
+            locked = self.l2.add(lock, 1, self.lock_timeout())
+        try:
+            value = fetch()
+            self.set(source, text, value)
+        finally:
+            if locked:
+                self.l2.delete(lock)
+        return value
+
+    @staticmethod
+    def _poll_interval(deadline: Deadline = None):
+        """Пауза между проверками блокировки, не превышающая оставшееся время запроса"""
+        interval = getattr(settings, "TRANSLATE_CACHE_LOCK_POLL", 0.05)
+        return min(interval, deadline.remaining()) if deadline is not None else interval
+
+    def _fallback(self, entry):
+        """Значение просроченной записи, которое отдается, если словарь недоступен"""
+        self._count("fallbacks")
+        return entry[0]
+
+    async def aget_or_fetch(self, source: str, text: str, afetch, fetch, deadline: Deadline = None):
+        """Асинхронный вариант get_or_fetch
+        afetch - корутина для загрузки при промахе, fetch - синхронная функция для фонового обновления"""
+        if not self.enabled():
+            return await afetch()
+        key = self.key(source, text)
+        entry = self._lookup(key)
+        if entry is None or entry[2] <= time.time():
+            entry = self._lookup_l2(key, await sync_to_async(self.l2.get, thread_sensitive=False)(key)) or entry
+        value = self._serve(source, text, entry, fetch)
+        if value is not None:
+            return value
+        try:
+            return await self._afetch(key, source, text, afetch, deadline)
+        except SourceUnavailable:
+            if entry is None:
+                raise
+            return self._fallback(entry)
+
+    async def _afetch(self, key, source, text, afetch, deadline: Deadline = None):
+        """Асинхронный вариант _fetch"""
+        if not self.shared_lock():
+            value = await afetch()
+            await sync_to_async(self.set, thread_sensitive=False)(source, text, value)
+            return value
+
+        lock = key + ":lock"
+        expires = time.monotonic() + self.lock_timeout()
+        add = sync_to_async(self.l2.add, thread_sensitive=False)
+        locked = await add(lock, 1, self.lock_timeout())
+        while not locked and time.monotonic() < expires:
+            if deadline is not None:
+                deadline.check()
+            await asyncio.sleep(self._poll_interval(deadline))
+            entry = await sync_to_async(self.l2.get, thread_sensitive=False)(key)
+            if entry is not None and entry[2] > time.time():
+                self._count("lock_waits")
+                return self._lookup_l2(key, entry)[0]
+            locked = await add(lock, 1, self.lock_timeout())
+        try:
+            value = await afetch()
+            await sync_to_async(self.set, thread_sensitive=False)(source, text, value)
+        finally:
+            if locked:
+                await sync_to_async(self.l2.delete, thread_sensitive=False)(lock)
+        return value
+
+    def set(self, source: str, text: str, value):
+        """Сохраняет результат в оба уровня кэша"""
+        key = self.key(source, text)
+        ttl = self.ttl(source)
+        now = time.time()
+        entry = (value, now + ttl, now + ttl + self.stale_ttl())
+        self.l1.set(key, entry, ttl + self.stale_ttl() + self.fallback_ttl())
+        self.l2.set(key, entry, ttl + self.stale_ttl() + self.fallback_ttl())
+
+    def clear(self):
+        self.l1.clear()
+        self.l2.clear()
+        with self._lock:
+            for name in self._stats:
+                self._stats[name] = 0
+
+    def stats(self):
+        """Счетчики попаданий и промахов кэша"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["l1_hits"] + stats["l2_hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+        stats["l1_size"] = len(self.l1)
+        return stats
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _lookup(self, key):
+        entry = self.l1.get(key)
+        if entry is not None and entry[1] > time.time():
+            self._count("l1_hits")
+        return entry
+
+    def _lookup_l2(self, key, entry):
+        if entry is not None:
+            self.l1.set(key, entry, entry[2] + self.fallback_ttl() - time.time())
+            if entry[1] > time.time():
+                self._count("l2_hits")
+        return entry
+
+    def _serve(self, source, text, entry, fetch):
+        """Возвращает значение свежей или устаревшей записи, либо None при промахе"""
+        if entry is None:
+            self._count("misses")
+            return None
+        value, fresh_until, stale_until = entry
+        now = time.time()
+        if now < fresh_until:
+            return value
+        if now < stale_until:
+            self._count("stale_hits")
+            self._refresh(source, text, fetch)
+            return value
+        self._count("misses")
+        return None
+
+    def _refresh(self, source, text, fetch):
+        """Запускает фоновое обновление записи, если оно еще не запущено"""
+        key = self.key(source, text)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self.set(source, text, fetch())
+                self._count("refreshes")
+            except Exception:
+                self._count("refresh_errors")
+                logger.exception("Не удалось обновить запись кэша %s для текста %s", source, text)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(refresh)
+
+
+translation_cache = TranslationCache()
@@ -0,0 +1,209 @@
+import os
+import re
+import mmap
+import struct
+import threading
+import unicodedata
+
+from django.conf import settings
+
+MAGIC = b"CEDICTX1"
+HEADER = struct.Struct("<8sII")
+OFFSET = struct.Struct("<I")
+FIELD_SEPARATOR = b"\x00"
+DEFINITION_SEPARATOR = "\x1f"
+
+CEDICT_LINE = re.compile(r"^(\S+)\s+(\S+)\s+\[([^\]]*)\]\s+/(.*)/\s*$")
+TONE_MARKS = {
+    "a": "āáǎàa", "e": "ēéěèe", "i": "īíǐìi", "o": "ōóǒòo", "u": "ūúǔùu", "ü": "ǖǘǚǜü",
+}
+
+
+def numbered_to_marked(syllable: str):
+    """Переводит слог пиньиня с номером тона (nar3) в запись с диакритикой (nǎr)"""
+    syllable = syllable.replace("u:", "ü").replace("v", "ü").replace("U:", "Ü")
+    if not syllable or not syllable[-1].isdigit():
+        return syllable
+    tone = int(syllable[-1])
+    syllable = syllable[:-1]
+    if tone not in (1, 2, 3, 4):
+        return syllable
+    lower = syllable.lower()
+    if "a" in lower:
+        index = lower.index("a")
+    elif "e" in lower:
+        index = lower.index("e")
+    elif "ou" in lower:
+        index = lower.index("o")
+    else:
+        index = max((lower.rfind(vowel) for vowel in "iouü"), default=-1)
+        if index < 0:
+            return syllable
+    mark = TONE_MARKS[lower[index]][tone - 1]
+    if syllable[index].isupper():
+        mark = mark.upper()
+    return syllable[:index] + mark + syllable[index + 1:]
+
+
+def numbered_to_pinyin(pinyin: str):
+    """Переводит пиньинь CC-CEDICT (na3 r5) в слитную запись с диакритикой (nǎr)"""
+    return "".join(numbered_to_marked(syllable) for syllable in pinyin.split())
+
+
+def is_hanzi(char: str):
+    """Является ли символ иероглифом, остальные символы при сегментации пропускаются"""
+    return unicodedata.category(char) == "Lo"
+
+
+class LocalDictionary:
+    """Локальный словарь в формате CC-CEDICT
+    Словарь импортируется в компактный индекс: отсортированные по ключу записи и таблица
+    смещений. Индекс отображается в память, поиск слова - двоичный поиск по ключам,
+    поэтому словарь не загружается в память целиком и разделяется процессами"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            self._mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.max_length = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError("%s не является индексом словаря" % path)
+        self._offsets = memoryview(self._mm)[HEADER.size:HEADER.size + OFFSET.size * (self.count + 1)].cast("I")
+
+    @classmethod
+    def build(cls, lines, path: str):
+        """Строит индекс по строкам словаря в формате CC-CEDICT и записывает его в path
+        Возвращает количество записей в индексе"""
+        entries = {}
+        for line in lines:
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            match = CEDICT_LINE.match(line.strip())
+            if line.startswith("#") or not match:
+                continue
+            traditional, simplified, pinyin, definitions = match.groups()
+            pinyin = numbered_to_pinyin(pinyin)
+            definitions = [definition for definition in definitions.split("/") if definition]
+            for word in {traditional, simplified}:
+                readings = entries.setdefault(word, {})
+                readings.setdefault(pinyin, []).extend(definitions)
+
+        records = []
+        for word in sorted(entries, key=lambda word: word.encode("utf-8")):
+            readings = entries[word]
+            definitions = [definition for reading in readings.values() for definition in reading]
+            records.append(FIELD_SEPARATOR.join((
+                word.encode("utf-8"),
+                " ".join(readings).encode("utf-8"),
+                DEFINITION_SEPARATOR.join(definitions).encode("utf-8"),
+            )))
+
+        max_length = max((len(word) for word in entries), default=0)
+        offset = HEADER.size + OFFSET.size * (len(records) + 1)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, len(records), max_length))
+            for record in records:
+                file.write(OFFSET.pack(offset))
+                offset += len(record)
+            file.write(OFFSET.pack(offset))
+            for record in records:
+                file.write(record)
+        os.replace(tmp_path, path)
+        return len(records)
+
+    def _key(self, index: int):
+        start = self._offsets[index]
+        end = self._mm.find(FIELD_SEPARATOR, start, self._offsets[index + 1])
+        return self._mm[start:end]
+
+    def _find(self, key: bytes):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._key(low) == key:
+            return low
+        return None
+
+    def __contains__(self, word: str):
+        return self._find(word.encode("utf-8")) is not None
+
+    def lookup(self, word: str):
+        """Возвращает пару (пиньинь, список значений) или None, если слова нет в словаре"""
+        index = self._find(word.encode("utf-8"))
+        if index is None:
+            return None
+        record = self._mm[self._offsets[index]:self._offsets[index + 1]].decode("utf-8")
+        _, pinyin, definitions = record.split("\x00")
+        return pinyin, definitions.split(DEFINITION_SEPARATOR)
+
+    def segment(self, text: str):
+        """Разбивает текст на слова словаря
+        Динамическое программирование по графу всех слов словаря, встречающихся в тексте,
+        выбирает разбиение с наименьшим числом слов. Символы, не являющиеся иероглифами,
+        пропускаются. Если какой-то иероглиф не покрыт словарем, возвращает None"""
+        length = len(text)
+        # best[i] - (число слов, длина первого слова) для лучшего разбиения text[i:]
+        best = [None] * (length + 1)
+        best[length] = (0, 0)
+        for start in range(length - 1, -1, -1):
+            if not is_hanzi(text[start]):
+                if best[start + 1] is not None:
+                    best[start] = (best[start + 1][0], 1)
+                continue
+            for end in range(min(length, start + self.max_length), start, -1):
+                if best[end] is None or text[start:end] not in self:
+                    continue
+                candidate = (best[end][0] + 1, end - start)
+                if best[start] is None or candidate[0] < best[start][0]:
+                    best[start] = candidate
+        if best[0] is None:
+            return None
+        words = []
+        start = 0
+        while start < length:
+            end = start + best[start][1]
+            if is_hanzi(text[start]):
+                words.append(text[start:end])
+            start = end
+        return words
+
+    def translate(self, text: str):
+        """Переводит текст в формате результата parser_bkrs или возвращает None при промахе"""
+        words = self.segment(text.strip())
+        if not words:
+            return None
+        if len(words) == 1 and words[0] == text.strip():
+            pinyin, definitions = self.lookup(words[0])
+            return [[words[0]], [pinyin], definitions]
+        result = []
+        for word in words:
+            pinyin, definitions = self.lookup(word)
+            result.append([[word], [pinyin], definitions])
+        return result
+
+    def close(self):
+        self._offsets.release()
+        self._mm.close()
+
+
+_dictionary = None
+_dictionary_lock = threading.Lock()
+
+
+def get_local_dictionary():
+    """Возвращает общий для процесса локальный словарь из TRANSLATE_LOCAL_DICTIONARY
+    или None, если индекс не построен"""
+    global _dictionary
+    if _dictionary is None:
+        path = getattr(settings, "TRANSLATE_LOCAL_DICTIONARY", None)
+        if not path or not os.path.exists(path):
+            return None
+        with _dictionary_lock:
+            if _dictionary is None:
+                _dictionary = LocalDictionary(path)
+    return _dictionary
@@ -0,0 +1,258 @@
+from abc import ABC, abstractmethod
+
+from lxml import etree
+
+
+def _has_class(name: str):
+    """Условие XPath, аналогичное поиску по классу в BeautifulSoup: класс - одно из слов атрибута"""
+    return "contains(concat(' ', normalize-space(@class), ' '), ' %s ')" % name
+
+
+def _xpath(path: str):
+    return etree.XPath(path, smart_strings=False)
+
+
+# Селекторы компилируются один раз при импорте
+BKRS_TABLES = _xpath("//body//table[%s]" % _has_class("tbl_bywords"))
+BKRS_PINYIN = _xpath("(//body//div[%s])[1]" % _has_class("py"))
+BKRS_TRANSLATIONS = _xpath("//body//div[%s]" % _has_class("ru"))
+ZHONGA_UNITS = _xpath("//body//div[%s]" % _has_class("segmented-unit"))
+ZHONGA_UNIT_VALUE = _xpath("(.//div[%s])[1]" % _has_class("segmented-unit-value"))
+ZHONGA_UNIT_PINYIN = _xpath("(.//span[%s])[1]" % _has_class("pinyin"))
+ZHONGA_UNIT_DEFINITIONS = _xpath("(.//div[%s])[1]" % _has_class("segmented-unit-dic-definitions"))
+ZHONGA_UNIT_USER_DEFINITIONS = _xpath("(.//div[%s])[1]" % _has_class("segmented-unit-user-definitions"))
+ZHONGA_PINYIN = _xpath("(//body//span[%s])[1]" % _has_class("pinyin"))
+ZHONGA_DEFINITIONS = _xpath("//body//div[@id='unit-dic-definitions']")
+DESCENDANT_ROWS = _xpath(".//tr")
+DESCENDANT_CELLS = _xpath(".//td")
+DESCENDANT_CENTER = _xpath("(.//center)[1]")
+DESCENDANT_LINKS = _xpath(".//a")
+DESCENDANT_DIVS = _xpath(".//div")
+# Как и в BeautifulSoup, текст скриптов и стилей в текст элемента не входит
+TEXT_NODES = _xpath(".//text()[not(ancestor::script or ancestor::style or ancestor::template)]")
+
+ASCII_SPACES = " \n\t\x0c\r"
+UTF8_PARSER = etree.HTMLParser(encoding="utf-8")
+PARSER = etree.HTMLParser()
+
+
+def parse_html(content: bytes):
+    """Разбирает страницу в дерево lxml
+    Страницы словарей в utf-8, если они не декодируются как utf-8, кодировку определяет libxml2"""
+    try:
+        content.decode("utf-8")
+    except UnicodeDecodeError:
+        return etree.fromstring(content, PARSER)
+    return etree.fromstring(content, UTF8_PARSER)
+
+
+def _collapse(string: str):
+    # BeautifulSoup заменяет строки из одних пробельных символов на один перевод строки или пробел
+    if string.strip(ASCII_SPACES):
+        return string
+    return "\n" if "\n" in string else " "
+
+
+def text(element):
+    """Текст элемента, совпадающий с Tag.text в BeautifulSoup"""
+    return "".join(_collapse(string) for string in TEXT_NODES(element))
+
+
+def contents(element):
+    """Строки непосредственного содержимого элемента, аналог Tag.contents в BeautifulSoup
+    Вложенные теги заменяются их текстом, чтобы результат сериализовался в JSON"""
+    result = []
+    if element.text:
+        result.append(_collapse(element.text))
+    for child in element:
+        if isinstance(child.tag, str):
+            result.append(text(child))
+        if child.tail:
+            result.append(_collapse(child.tail))
+    return result
+
+
+def first(selector, element):
+    """Первый найденный селектором элемент или None"""
+    found = selector(element)
+    return found[0] if found else None
+
+
+def collect_bkrs_strings(table, original_strings, pinyin_strings, translated_strings):
+    """Добавляет в списки оригиналы, пиньинь и переводы из таблицы tbl_bywords страницы bkrs"""
+    for count, row in enumerate(DESCENDANT_ROWS(table)):
+        for block in DESCENDANT_CELLS(row):
+            center = first(DESCENDANT_CENTER, block)
+            if center is not None:
+                pinyin_strings.append([text(center)])
+            if count % 2 == 0:
+                links = DESCENDANT_LINKS(block)
+                original_strings.append(contents(links[0] if links else block))
+            else:
+                divs = DESCENDANT_DIVS(block)
+                translated_strings.append(
+                    [text(div).strip() for div in divs] if divs else [text(block).strip()])
+
+
+def iter_bkrs_rows(tables):
+    """Строки результата [оригинал, пиньинь, перевод] по таблицам tbl_bywords страницы bkrs"""
+    original_strings = []
+    pinyin_strings = []
+    translated_strings = []
+    for table in tables:
+        collect_bkrs_strings(table, original_strings, pinyin_strings, translated_strings)
+    return zip(original_strings, pinyin_strings, translated_strings)
+
+
+def bkrs_word(source_text: str, root):
+    """Результат страницы bkrs с переводом одного слова"""
+    return [
+        [source_text],
+        [text(BKRS_PINYIN(root)[0]).strip()],
+        [text(translation).strip() for translation in BKRS_TRANSLATIONS(root)],
+    ]
+
+
+def bkrs(source_text: str, content: bytes):
+    """Разбирает страницу словаря bkrs с переводом source_text"""
+    root = parse_html(content)
+    tables = BKRS_TABLES(root)
+    if tables:
+        return [[original, pinyin, translated] for original, pinyin, translated in iter_bkrs_rows(tables)]
+    return bkrs_word(source_text, root)
+
+
+def zhonga_row(unit):
+    """Строка результата [оригинал, пиньинь, перевод] по блоку segmented-unit страницы zhonga"""
+    original = text(DESCENDANT_LINKS(ZHONGA_UNIT_VALUE(unit)[0])[0])
+    pinyin = text(ZHONGA_UNIT_PINYIN(unit)[0]).strip()
+    definitions = first(ZHONGA_UNIT_DEFINITIONS, unit)
+    user_definitions = first(ZHONGA_UNIT_USER_DEFINITIONS, unit)
+    if definitions is not None:
+        translate = text(definitions).strip()
+        if user_definitions is not None:
+            translate += text(user_definitions).strip()
+    else:
+        translate = text(user_definitions).strip()
+    return [[original], [pinyin], [translate]]
+
+
+def zhonga_word(source_text: str, root):
+    """Результат страницы zhonga с переводом одного слова"""
+    return [
+        [source_text],
+        [text(ZHONGA_PINYIN(root)[0]).strip()],
+        [text(definition).strip() for definition in ZHONGA_DEFINITIONS(root)],
+    ]
+
+
+def zhonga(source_text: str, content: bytes):
+    """Разбирает страницу словаря zhonga с переводом source_text"""
+    root = parse_html(content)
+    units = ZHONGA_UNITS(root)
+    if units:
+        return [zhonga_row(unit) for unit in units]
+    return zhonga_word(source_text, root)
+
+
+def has_class(element, name: str):
+    """Есть ли у элемента класс name, аналог _has_class для уже разобранного элемента"""
+    return name in (element.get("class") or "").split()
+
+
+class StreamingExtractor(ABC):
+    """Инкрементальный разбор страницы словаря по мере загрузки
+    Куски страницы передаются в feed, строки результата извлекаются, как только закрывается
+    их элемент, и сразу удаляются из дерева. feed возвращает True, когда закончилась область
+    результата: остаток страницы (реклама, подвал) можно не загружать. close возвращает
+    тот же результат, что и разбор всей страницы. Если передан on_row, он вызывается для каждой
+    строки результата сразу после ее разбора"""
+    # Идентификаторы и классы элементов, после закрытия которых результата на странице уже нет.
+    # Если таких элементов на странице нет, она разбирается до конца
+    region_ids = ()
+    region_classes = ()
+    # Текст этих элементов не входит в результат, они удаляются из дерева сразу после разбора
+    skipped_tags = frozenset(("script", "style", "template"))
+
+    def __init__(self, source_text: str, encoding: str = None, on_row=None):
+        self.source_text = source_text
+        self.on_row = on_row
+        self.done = False
+        self._parser = etree.HTMLPullParser(events=("end",), encoding=encoding or "utf-8")
+
+    def feed(self, chunk: bytes):
+        """Передает в разбор очередной кусок страницы, возвращает True, если результат уже получен"""
+        if self.done:
+            return True
+        self._parser.feed(chunk)
+        for _, element in self._parser.read_events():
+            if element.tag in self.skipped_tags:
+                element.clear(keep_tail=True)
+                continue
+            self.element_end(element)
+            if element.get("id") in self.region_ids or any(
+                    has_class(element, name) for name in self.region_classes):
+                self.done = True
+                break
+        return self.done
+
+    def close(self):
+        """Завершает разбор и возвращает результат"""
+        return self.result(self._parser.close())
+
+    def element_end(self, element):
+        """Обработка очередного закрытого элемента"""
+
+    @abstractmethod
+    def result(self, root):
+        """Результат разбора по оставшемуся дереву страницы"""
+
+
+class BkrsExtractor(StreamingExtractor):
+    """Инкрементальный разбор страницы словаря bkrs"""
+    region_ids = ("main_content",)
+
+    def __init__(self, source_text: str, encoding: str = None, on_row=None):
+        super().__init__(source_text, encoding, on_row)
+        self.tables = 0
+        self.strings = ([], [], [])
+        self.emitted = 0
+
+    def element_end(self, element):
+        if element.tag == "table" and has_class(element, "tbl_bywords"):
+            self.tables += 1
+            collect_bkrs_strings(element, *self.strings)
+            element.clear(keep_tail=True)
+            if self.on_row is not None:
+                rows = list(zip(*self.strings))
+                for row in rows[self.emitted:]:
+                    self.on_row(list(row))
+                self.emitted = len(rows)
+
+    def result(self, root):
+        if self.tables:
+            return [[original, pinyin, translated] for original, pinyin, translated in zip(*self.strings)]
+        return bkrs_word(self.source_text, root)
+
+
+class ZhongaExtractor(StreamingExtractor):
+    """Инкрементальный разбор страницы словаря zhonga"""
+    region_ids = ("content",)
+    region_classes = ("segmented",)
+
+    def __init__(self, source_text: str, encoding: str = None, on_row=None):
+        super().__init__(source_text, encoding, on_row)
+        self.rows = []
+
+    def element_end(self, element):
+        if element.tag == "div" and has_class(element, "segmented-unit"):
+            self.rows.append(zhonga_row(element))
+            element.clear(keep_tail=True)
+            if self.on_row is not None:
+                self.on_row(self.rows[-1])
+
+    def result(self, root):
+        if self.rows:
+            return self.rows
+        return zhonga_word(self.source_text, root)
+
@@ -0,0 +1,87 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import Client, AsyncClient
+from django.test.utils import override_settings
+
+from translate.benchmarks import prepare_database, summarize, dump_report
+from translate.stubserver import StubUpstream
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает синхронный (WSGI) и асинхронный (ASGI) путь перевода "
+            "на локальной заглушке словарей с задержкой")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Количество запросов в каждом прогоне")
+        parser.add_argument("--concurrency", type=int, default=100, help="Количество одновременных клиентов")
+        parser.add_argument("--latency", type=float, default=0.2, help="Задержка ответа заглушки в секундах")
+        parser.add_argument("--wsgi-threads", type=int, default=8,
+                            help="Количество потоков-обработчиков WSGI (воркеры gunicorn)")
+        parser.add_argument("--text", default="那不", help="Текст для перевода")
+        parser.add_argument("--cache", action="store_true", help="Не отключать кэш переводов")
+
+    def handle(self, *args, **options):
+        token = prepare_database()
+        path = "/translate/?bkrs=True&zhonga=True"
+        with StubUpstream(latency=options["latency"]) as stub, \
+                override_settings(TRANSLATE_UPSTREAM_URLS=stub.urls, TRANSLATE_CACHE_ENABLED=options["cache"]):
+            report = {
+                "latency_s": options["latency"],
+                "concurrency": options["concurrency"],
+                "wsgi": self.run_wsgi(path, token, options),
+                "asgi": asyncio.run(self.run_asgi("/translate/async/?bkrs=True&zhonga=True", token, options)),
+            }
+        dump_report(report, self.stdout)
+
+    def run_wsgi(self, path, token, options):
+        """Прогон через WSGI-обработчик с фиксированным числом потоков"""
+        local = threading.local()
+        latencies = []
+        errors = []
+
+        def request(_):
+            if not hasattr(local, "client"):
+                local.client = Client()
+                local.client.cookies["Token"] = token
+            start = time.perf_counter()
+            response = local.client.post(path, {"text": options["text"]}, content_type="application/json")
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+        threads = min(options["wsgi_threads"], options["concurrency"])
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            list(executor.map(request, range(options["requests"])))
+        result = summarize(latencies, time.perf_counter() - start, len(errors))
+        result["threads"] = threads
+        return result
+
+    async def run_asgi(self, path, token, options):
+        """Прогон через ASGI-обработчик, все клиенты в одном цикле событий"""
+        semaphore = asyncio.Semaphore(options["concurrency"])
+        client = AsyncClient()
+        client.cookies["Token"] = token
+        latencies = []
+        errors = []
+        peak_threads = threading.active_count()
+
+        async def request():
+            nonlocal peak_threads
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(path, {"text": options["text"]}, content_type="application/json")
+                latencies.append(time.perf_counter() - start)
+                peak_threads = max(peak_threads, threading.active_count())
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[request() for _ in range(options["requests"])])
+        result = summarize(latencies, time.perf_counter() - start, len(errors))
+        result["peak_threads"] = peak_threads
+        return result
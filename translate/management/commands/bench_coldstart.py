@@ -0,0 +1,83 @@
+import time
+import random
+import statistics
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from translate.benchmarks import Server, prepare_database, dump_report
+from translate.stats import percentile
+from translate.stubserver import StubUpstream
+from translate.management.commands.loadtest import random_texts
+
+MODES = {
+    "cold": {"preload": False, "warm": False},
+    "preload": {"preload": True, "warm": False},
+    "warm": {"preload": True, "warm": True},
+}
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает запуск gunicorn без предзагрузки, с предзагрузкой приложения в мастере и с прогревом "
+            "воркеров: время от запуска до первого ответа на перевод, время первого запроса и следующих запросов")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=3, help="Количество запусков в каждом режиме")
+        parser.add_argument("--workers", type=int, default=2, help="Количество воркеров gunicorn")
+        parser.add_argument("--requests", type=int, default=20, help="Количество запросов после первого")
+        parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа заглушки в секундах")
+        parser.add_argument("--timeout", type=float, default=60, help="Максимальное время запуска в секундах")
+
+    def handle(self, *args, **options):
+        token = prepare_database()
+        rng = random.Random()
+        report = {"workers": options["workers"], "runs": options["runs"]}
+        with StubUpstream(latency=options["latency"]) as stub:
+            for mode, config in MODES.items():
+                runs = [self.run(stub, token, rng, config, options) for _ in range(options["runs"])]
+                report[mode] = {
+                    name: round(statistics.median(run[name] for run in runs), 3) for name in runs[0]
+                }
+        report["speedup"] = round(
+            report["cold"]["time_to_first_response_ms"] / report["warm"]["time_to_first_response_ms"], 2
+        )
+        dump_report(report, self.stdout)
+
+    def run(self, stub, token, rng, config, options):
+        """Один запуск: запросы на перевод отправляются сразу после запуска gunicorn и повторяются,
+        пока сервер не ответит. Каждый запрос переводит новый текст, чтобы не попадать в кэш"""
+        server = Server(stub, workers=options["workers"], **config).spawn()
+        session = requests.Session()
+        session.cookies.set("Token", token)
+
+        def translate():
+            start = time.perf_counter()
+            response = session.post(
+                server.url + "/translate/?bkrs=True&zhonga=True", json={"text": random_texts(1, rng)[0]}, timeout=options["timeout"]
+            )
+            if response.status_code != 200:
+                raise CommandError("Перевод завершился со статусом %s" % response.status_code)
+            return time.perf_counter() - start
+
+        try:
+            started = time.perf_counter()
+            while True:
+                server.check()
+                if time.perf_counter() - started > options["timeout"]:
+                    raise CommandError("gunicorn не начал отвечать за %s секунд" % options["timeout"])
+                try:
+                    first = translate()
+                    break
+                except requests.ConnectionError:
+                    time.sleep(0.01)
+            ready = time.perf_counter() - started
+            # Следующие запросы попадают и в воркеры, которые еще не обработали ни одного запроса
+            latencies = [translate() for _ in range(options["requests"])]
+        finally:
+            server.stop()
+        return {
+            "time_to_first_response_ms": ready * 1000,
+            "first_request_ms": first * 1000,
+            "next_p50_ms": percentile(latencies, 50) * 1000,
+            "next_max_ms": max(latencies, default=0) * 1000,
+        }
@@ -0,0 +1,55 @@
+import time
+import statistics
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from translate import extract
+from translate.benchmarks import dump_report, bkrs_soup, zhonga_soup
+from translate.stubserver import load_page
+
+PAGES = ("bkrs_word", "bkrs_phrase", "zhonga_word", "zhonga_phrase")
+ENGINES = {
+    "bkrs": {"before": bkrs_soup, "after": extract.bkrs},
+    "zhonga": {"before": zhonga_soup, "after": extract.zhonga},
+}
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает разбор синтетических страниц словарей через BeautifulSoup (before) "
+            "и через lxml с заранее скомпилированными XPath (after)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50, help="Количество разборов каждой страницы")
+
+    def handle(self, *args, **options):
+        report = {}
+        for page in PAGES:
+            content = load_page(page)
+            source = page.split("_")[0]
+            results = {}
+            for name, parse in ENGINES[source].items():
+                results[name] = self.measure(parse, content, options["iterations"])
+            if ENGINES[source]["before"]("", content) != ENGINES[source]["after"]("", content):
+                raise AssertionError("Результаты разбора %s различаются" % page)
+            results["speedup"] = round(results["before"]["median_ms"] / results["after"]["median_ms"], 2)
+            report[page] = dict(results, page_bytes=len(content))
+        dump_report(report, self.stdout)
+
+    @staticmethod
+    def measure(parse, content, iterations):
+        """Медианное время разбора страницы и пик памяти Python-объектов за один разбор
+        Память, выделенная внутри libxml2, tracemalloc не учитывается"""
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            parse("", content)
+            timings.append(time.perf_counter() - start)
+        tracemalloc.start()
+        parse("", content)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {
+            "median_ms": round(statistics.median(timings) * 1000, 3),
+            "peak_kb": round(peak / 1024, 1),
+        }
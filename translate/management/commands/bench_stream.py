@@ -0,0 +1,72 @@
+import time
+import statistics
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from translate import upstream
+from translate.benchmarks import dump_report
+from translate.stubserver import StubUpstream
+from translate.views import Parser
+
+TEXTS = {"word": "哪儿", "phrase": "那不"}
+FETCHERS = {"bkrs": Parser.fetch_bkrs, "zhonga": Parser.fetch_zhonga}
+MODES = {
+    "buffered": {"TRANSLATE_UPSTREAM_STREAMING": False},
+    "streaming": {"TRANSLATE_UPSTREAM_STREAMING": True},
+    "streaming_close": {"TRANSLATE_UPSTREAM_STREAMING": True, "TRANSLATE_UPSTREAM_DRAIN_SIZE": 0},
+}
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает загрузку страниц словарей целиком с последующим разбором (buffered), "
+            "потоковую загрузку с дочитыванием остатка ответа (streaming) и потоковую загрузку "
+            "с закрытием соединения после результата (streaming_close) на медленной заглушке")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=10, help="Количество загрузок каждой страницы")
+        parser.add_argument("--chunk-size", type=int, default=4096, help="Размер куска ответа заглушки")
+        parser.add_argument("--chunk-delay", type=float, default=0.005,
+                            help="Пауза между кусками ответа заглушки в секундах")
+
+    def handle(self, *args, **options):
+        report = {}
+        with StubUpstream(chunk_size=options["chunk_size"], chunk_delay=options["chunk_delay"]) as stub, \
+                override_settings(TRANSLATE_UPSTREAM_URLS=stub.urls, TRANSLATE_CACHE_ENABLED=False):
+            for source, fetch in FETCHERS.items():
+                for kind, text in TEXTS.items():
+                    results = {}
+                    for mode, mode_settings in MODES.items():
+                        with override_settings(**mode_settings):
+                            results[mode] = self.measure(stub, fetch, text, options["iterations"])
+                    if len({repr(result.pop("result")) for result in results.values()}) != 1:
+                        raise AssertionError("Результаты разбора %s %s различаются" % (source, kind))
+                    report["%s_%s" % (source, kind)] = dict(results, page_bytes=len(stub.page(source, text)))
+        dump_report(report, self.stdout)
+
+    @staticmethod
+    def measure(stub, fetch, text, iterations):
+        """Медианное время до результата, отправленные заглушкой байты на запрос
+        и пик памяти Python-объектов за одну загрузку"""
+        upstream.reset()
+        timings = []
+        bytes_sent = stub.bytes_sent
+        for _ in range(iterations):
+            start = time.perf_counter()
+            result = fetch(text)
+            timings.append(time.perf_counter() - start)
+        # Заглушка досылает куски, пока не заметит закрытое соединение
+        time.sleep(stub.chunk_delay * 2 + 0.05)
+        bytes_sent = (stub.bytes_sent - bytes_sent) / iterations
+        tracemalloc.start()
+        fetch(text)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {
+            "median_ms": round(statistics.median(timings) * 1000, 3),
+            "bytes_sent": round(bytes_sent),
+            "peak_kb": round(peak / 1024, 1),
+            "result": result,
+        }
+
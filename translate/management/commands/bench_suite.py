@@ -0,0 +1,131 @@
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, RequestFactory
+from django.test.utils import override_settings
+
+from translate import resilience
+from translate.benchmarks import prepare_database, summarize, dump_report, measure, compare
+from translate.cache import translation_cache
+from translate.stubserver import StubUpstream, load_page
+from translate.views import Parser, check_language_chinese
+from user.backends import JWTAuthentication, ClaimsJWTAuthentication, token_cache, user_cache
+
+TEXTS = {
+    "short": "哪儿",
+    "long": "那不" * 50,
+    "not_chinese": "Русский язык",
+}
+PAGES = {
+    "bkrs_word": Parser.parse_bkrs,
+    "bkrs_phrase": Parser.parse_bkrs,
+    "zhonga_word": Parser.parse_zhonga,
+    "zhonga_phrase": Parser.parse_zhonga,
+}
+SOURCES = ("bkrs", "zhonga")
+AUTH = {
+    "without_cache": (JWTAuthentication, False),
+    "with_cache": (JWTAuthentication, True),
+    "claims": (ClaimsJWTAuthentication, False),
+}
+
+
+class Command(BaseCommand):
+    help = ("Воспроизводимый набор бенчмарков без сети: проверка языка, разбор синтетических страниц словарей, "
+            "аутентификация по JWT и сквозной перевод через Django на локальной заглушке словарей. "
+            "С --baseline сравнивает результаты с сохраненным отчетом и завершается ошибкой при регрессии")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=1000, help="Количество вызовов в микробенчмарках")
+        parser.add_argument("--requests", type=int, default=200, help="Количество запросов сквозного прогона")
+        parser.add_argument("--concurrency", type=int, default=8, help="Количество потоков-клиентов")
+        parser.add_argument("--latency", type=float, default=0.05, help="Задержка ответа заглушки в секундах")
+        parser.add_argument("--output", help="Файл, в который сохраняется отчет, например как базовый")
+        parser.add_argument("--baseline", help="Отчет, с которым сравниваются результаты")
+        parser.add_argument("--threshold", type=float, default=0.2,
+                            help="Допустимое ухудшение относительно базового отчета, доля (0.2 - 20%%)")
+
+    def handle(self, *args, **options):
+        token = prepare_database()
+        report = {
+            "check_language_chinese": self.bench_check_language(options["iterations"]),
+            "extract": self.bench_extract(max(options["iterations"] // 10, 1)),
+            "auth": self.bench_auth(token, options["iterations"]),
+            "e2e": self.bench_e2e(token, options),
+        }
+        regressions = []
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as file:
+                regressions = compare(report, json.load(file), options["threshold"])
+            report["regressions"] = regressions
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        dump_report(report, self.stdout)
+        if regressions:
+            raise CommandError("Регрессии относительно %s: %s" % (
+                options["baseline"], ", ".join(item["metric"] for item in regressions)
+            ))
+
+    @staticmethod
+    def bench_check_language(iterations):
+        return {name: measure(lambda: check_language_chinese(text), iterations) for name, text in TEXTS.items()}
+
+    @staticmethod
+    def bench_extract(iterations):
+        """Разбор целых синтетических страниц, как при загрузке без потокового разбора"""
+        report = {}
+        for page, parse in PAGES.items():
+            content = load_page(page)
+            report[page] = measure(lambda: parse("", content), iterations)
+        return report
+
+    @staticmethod
+    def bench_auth(token, iterations):
+        request = RequestFactory().get("/get-name/", HTTP_AUTHORIZATION="Token " + token)
+        report = {}
+        for mode, (backend, cache) in AUTH.items():
+            token_cache.clear()
+            user_cache.clear()
+            authentication = backend()
+            with override_settings(AUTH_CACHE_ENABLED=cache):
+                report[mode] = measure(lambda: authentication.authenticate(request), iterations)
+        return report
+
+    @staticmethod
+    def bench_e2e(token, options):
+        """Запросы /translate/ к обоим словарям из нескольких потоков, кэш переводов отключен,
+        поэтому каждый запрос загружает и разбирает страницы заглушки"""
+        local = threading.local()
+        latencies = []
+        errors = []
+
+        def request(_):
+            if not hasattr(local, "client"):
+                local.client = Client()
+                local.client.cookies["Token"] = token
+            start = time.perf_counter()
+            response = local.client.post(
+                "/translate/?bkrs=True&zhonga=True", {"text": "那不"}, content_type="application/json"
+            )
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+        # Ограничение частоты запросов к словарям измерялось бы вместо самого перевода
+        unlimited = {source: 1000000 for source in SOURCES}
+        translation_cache.clear()
+        with StubUpstream(latency=options["latency"]) as stub, \
+                override_settings(TRANSLATE_UPSTREAM_URLS=stub.urls, TRANSLATE_CACHE_ENABLED=False,
+                                  TRANSLATE_RATE_LIMIT=unlimited, TRANSLATE_RATE_BURST=unlimited):
+            resilience.reset()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+                list(executor.map(request, range(options["requests"])))
+            elapsed = time.perf_counter() - start
+        result = summarize(latencies, elapsed, len(errors))
+        result.update(latency_s=options["latency"], concurrency=options["concurrency"])
+        return result
@@ -0,0 +1,26 @@
+import os
+import gzip
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from translate.dictionary import LocalDictionary
+
+
+class Command(BaseCommand):
+    help = "Импортирует словарь в формате CC-CEDICT в локальный индекс для перевода без обращения к сайтам"
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="Файл словаря CC-CEDICT, можно сжатый gzip")
+        parser.add_argument("--output", default=None,
+                            help="Путь к индексу, по умолчанию TRANSLATE_LOCAL_DICTIONARY")
+
+    def handle(self, *args, **options):
+        output = options["output"] or settings.TRANSLATE_LOCAL_DICTIONARY
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        opener = gzip.open if options["source"].endswith(".gz") else open
+        start = time.perf_counter()
+        with opener(options["source"], "rb") as source:
+            count = LocalDictionary.build(source, output)
+        self.stdout.write("Импортировано %s слов в %s за %.2f с" % (count, output, time.perf_counter() - start))
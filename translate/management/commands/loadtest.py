@@ -0,0 +1,206 @@
+import os
+import time
+import random
+import threading
+from collections import defaultdict
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from translate.benchmarks import BENCH_MAIL, BENCH_PASSWORD, Server, prepare_database, summarize, dump_report
+from translate.stubserver import StubUpstream
+
+ACTIONS = ("login", "get_name", "translate")
+
+
+def parse_mix(value: str):
+    """Разбирает веса запросов вида "login=1,get_name=3,translate=6" """
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in ACTIONS:
+            raise CommandError("Неизвестный запрос %s, допустимы: %s" % (name, ", ".join(ACTIONS)))
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def random_texts(count: int, rng: random.Random):
+    """Случайные тексты из 1-4 иероглифов основного блока: каждый новый текст - промах кэша переводов"""
+    return ["".join(chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(rng.randint(1, 4))) for _ in range(count)]
+
+
+def cpu_seconds(pid: int):
+    """Процессорное время процесса pid и его дочерних процессов (воркеров gunicorn) из /proc
+    Возвращает None, если /proc недоступен"""
+    ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+    total = 0
+    try:
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open("/proc/%s/stat" % entry) as file:
+                    fields = file.read().rsplit(")", 1)[1].split()
+            except OSError:
+                continue
+            # После имени процесса: состояние, ppid, ..., utime и stime - 12 и 13 поля
+            if int(entry) == pid or int(fields[1]) == pid:
+                total += int(fields[11]) + int(fields[12])
+    except OSError:
+        return None
+    return total / ticks
+
+
+class VirtualUser:
+    """Пользователь, который входит в систему и выполняет запросы по весам без пауз или с паузой think"""
+
+    def __init__(self, url: str, weights: dict, texts, rng: random.Random, think: float):
+        self.url = url
+        self.actions = list(weights)
+        self.weights = [weights[action] for action in self.actions]
+        self.texts = texts
+        self.rng = rng
+        self.think = think
+        self.session = requests.Session()
+
+    def login(self):
+        # Токен возвращается в куки Token, которую сессия отправляет в следующих запросах
+        return self.session.post(self.url + "/login/", json={"mail": BENCH_MAIL, "password": BENCH_PASSWORD})
+
+    def get_name(self):
+        return self.session.get(self.url + "/get-name/")
+
+    def translate(self):
+        return self.session.post(
+            self.url + "/translate/?bkrs=True&zhonga=True", json={"text": self.rng.choice(self.texts)}
+        )
+
+    def run(self, stop: threading.Event, record):
+        while not stop.is_set():
+            action = self.rng.choices(self.actions, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                status = getattr(self, action)().status_code
+            except requests.RequestException:
+                status = None
+            record(action, time.perf_counter() - start, status)
+            if self.think:
+                stop.wait(self.think)
+
+
+class Command(BaseCommand):
+    help = ("Нагрузочный тест развертывания gunicorn: запускает приложение с заданным классом и числом воркеров "
+            "на локальной заглушке словарей и для каждого числа одновременных пользователей отчитывается "
+            "о пропускной способности, перцентилях задержки по запросам и загрузке процессора сервера")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--worker-class", default="sync",
+                            help="Класс воркеров gunicorn: sync, gthread, uvicorn.workers.UvicornWorker")
+        parser.add_argument("--workers", type=int, default=2, help="Количество воркеров gunicorn")
+        parser.add_argument("--threads", type=int, default=1, help="Количество потоков воркера (gthread)")
+        parser.add_argument("--preload", action="store_true", help="Загружать приложение до fork воркеров и прогревать воркеры (gunicorn.conf.py)")
+        parser.add_argument("--users", default="4,8,16,32",
+                            help="Ступени нагрузки: числа одновременных пользователей через запятую")
+        parser.add_argument("--duration", type=float, default=15, help="Длительность ступени в секундах")
+        parser.add_argument("--mix", default="login=1,get_name=3,translate=6", help="Веса запросов")
+        parser.add_argument("--think", type=float, default=0.0, help="Пауза пользователя между запросами в секундах")
+        parser.add_argument("--latency", type=float, default=0.1, help="Задержка ответа заглушки в секундах")
+        parser.add_argument("--texts", type=int, default=200,
+                            help="Количество разных текстов для перевода, меньше текстов - больше попаданий в кэш")
+        parser.add_argument("--seed", type=int, help="Начальное значение генератора текстов и выбора запросов")
+        parser.add_argument("--knee", type=float, default=0.1,
+                            help="Рост пропускной способности между ступенями, ниже которого сервер считается "
+                                 "насыщенным, доля")
+
+    def handle(self, *args, **options):
+        weights = parse_mix(options["mix"])
+        stages = [int(users) for users in options["users"].split(",")]
+        rng = random.Random(options["seed"])
+        texts = random_texts(options["texts"], rng)
+        prepare_database()
+
+        with StubUpstream(latency=options["latency"]) as stub:
+            server = Server(
+                stub, options["worker_class"], options["workers"], options["threads"], options["preload"]
+            ).start()
+            try:
+                results = [self.run_stage(server, users, weights, texts, rng, options) for users in stages]
+            finally:
+                server.stop()
+
+        report = {
+            "config": {
+                "worker_class": options["worker_class"],
+                "workers": options["workers"],
+                "threads": options["threads"],
+                "preload": options["preload"],
+                "mix": weights,
+                "latency_s": options["latency"],
+                "duration_s": options["duration"],
+                "texts": options["texts"],
+                "cpus": os.cpu_count(),
+            },
+            "stages": results,
+            "saturation": self.saturation(results, options["knee"]),
+        }
+        dump_report(report, self.stdout)
+
+    @staticmethod
+    def run_stage(server, users, weights, texts, rng, options):
+        """Одна ступень: users пользователей выполняют запросы в течение duration секунд"""
+        latencies = defaultdict(list)
+        errors = defaultdict(int)
+        lock = threading.Lock()
+
+        def record(action, latency, status):
+            with lock:
+                latencies[action].append(latency)
+                if status is None or status >= 400:
+                    errors[action] += 1
+
+        clients = [
+            VirtualUser(server.url, weights, texts, random.Random(rng.random()), options["think"])
+            for _ in range(users)
+        ]
+        for client in clients:
+            client.login()
+        stop = threading.Event()
+        threads = [threading.Thread(target=client.run, args=(stop, record)) for client in clients]
+        cpu_start = cpu_seconds(server.process.pid)
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        stop.wait(options["duration"])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        cpu_end = cpu_seconds(server.process.pid)
+
+        everything = [latency for values in latencies.values() for latency in values]
+        result = dict(summarize(everything, elapsed, sum(errors.values())), users=users)
+        result["endpoints"] = {
+            action: summarize(values, elapsed, errors[action]) for action, values in sorted(latencies.items())
+        }
+        if cpu_start is not None and cpu_end is not None:
+            # Загрузка всех ядер, 100% - одно ядро полностью
+            result["server_cpu_percent"] = round((cpu_end - cpu_start) / elapsed * 100, 1)
+        return result
+
+    @staticmethod
+    def saturation(results, knee: float):
+        """Ступень с наибольшей пропускной способностью и первая ступень, после которой
+        пропускная способность растет меньше чем на knee: дальше добавленные пользователи только ждут в очереди"""
+        best = max(results, key=lambda result: result["throughput_rps"])
+        saturated = None
+        for previous, current in zip(results, results[1:]):
+            growth = (current["throughput_rps"] - previous["throughput_rps"]) / (previous["throughput_rps"] or 1)
+            if growth < knee:
+                saturated = previous
+                break
+        return {
+            "max_throughput_rps": best["throughput_rps"],
+            "max_throughput_users": best["users"],
+            "saturated_at_users": saturated["users"] if saturated else None,
+            "p99_ms_at_saturation": saturated["p99_ms"] if saturated else None,
+        }
@@ -0,0 +1,172 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Границы корзин гистограмм времени в секундах и размера ответа в байтах
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+COUNTER = "counter"
+HISTOGRAM = "histogram"
+
+
+class Registry:
+    """Метрики процесса в текстовом формате Prometheus
+    Каждый поток пишет в собственную часть (shard) метрик без блокировок, части складываются
+    только при чтении метрик. Блокировка берется один раз на поток при создании его части.
+    Метрики считаются в каждом процессе отдельно: при нескольких воркерах gunicorn запрос
+    к /metrics возвращает метрики обработавшего его воркера"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._shards = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str):
+        self._metrics[name] = (COUNTER, help, None)
+        return name
+
+    def histogram(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        self._metrics[name] = (HISTOGRAM, help, tuple(buckets))
+        return name
+
+    def collector(self, collect):
+        """Регистрирует функцию, которая при чтении метрик возвращает список
+        (имя, тип, описание, [(метки, значение)]) для значений, которые считаются в других модулях"""
+        self._collectors.append(collect)
+        return collect
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def observe(self, name: str, value: float, **labels):
+        """Добавляет значение в гистограмму name"""
+        buckets = self._metrics[name][2]
+        shard = self._shard()
+        key = (name, tuple(sorted(labels.items())))
+        entry = shard.get(key)
+        if entry is None:
+            # Счетчики корзин, затем сумма значений
+            entry = shard[key] = [0] * (len(buckets) + 1) + [0.0]
+        entry[bisect_left(buckets, value)] += 1
+        entry[-1] += value
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """Увеличивает счетчик name"""
+        shard = self._shard()
+        key = (name, tuple(sorted(labels.items())))
+        shard[key] = shard.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Записывает в гистограмму name время выполнения блока"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def collect(self):
+        """Складывает части всех потоков, возвращает {(имя, метки): значение}"""
+        with self._lock:
+            shards = list(self._shards)
+        values = {}
+        for shard in shards:
+            # Копирование словаря атомарно относительно записи потоком-владельцем
+            for key, value in shard.copy().items():
+                if isinstance(value, list):
+                    total = values.get(key)
+                    values[key] = list(value) if total is None else [a + b for a, b in zip(total, value)]
+                else:
+                    values[key] = values.get(key, 0) + value
+        return values
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus 0.0.4"""
+        values = self.collect()
+        lines = []
+        for name, (kind, help, buckets) in sorted(self._metrics.items()):
+            lines += ["# HELP %s %s" % (name, help), "# TYPE %s %s" % (name, kind)]
+            for (metric, labels), value in sorted(values.items()):
+                if metric != name:
+                    continue
+                if kind == HISTOGRAM:
+                    count = 0
+                    for bound, bucket in zip(buckets + (float("inf"),), value):
+                        count += bucket
+                        lines.append(format_sample(name + "_bucket", labels + (("le", format_value(bound)),), count))
+                    lines.append(format_sample(name + "_sum", labels, value[-1]))
+                    lines.append(format_sample(name + "_count", labels, count))
+                else:
+                    lines.append(format_sample(name, labels, value))
+        for collect in self._collectors:
+            for name, kind, help, samples in collect():
+                lines += ["# HELP %s %s" % (name, help), "# TYPE %s %s" % (name, kind)]
+                lines += [format_sample(name, tuple(sorted(labels.items())), value) for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.clear()
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_sample(name: str, labels, value):
+    if not labels:
+        return "%s %s" % (name, format_value(value))
+    escaped = ",".join(
+        '%s="%s"' % (label, str(text).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for label, text in labels
+    )
+    return "%s{%s} %s" % (name, escaped, format_value(value))
+
+
+metrics = Registry()
+
+REQUEST_DURATION = metrics.histogram(
+    "translate_http_request_duration_seconds", "Время обработки запроса до начала отправки ответа"
+)
+PHASE_DURATION = metrics.histogram(
+    "translate_phase_duration_seconds", "Время этапов обработки запроса: auth, validation, translate, render"
+)
+UPSTREAM_DURATION = metrics.histogram(
+    "translate_upstream_duration_seconds", "Время загрузки и разбора страницы словаря"
+)
+EXTRACT_DURATION = metrics.histogram(
+    "translate_extract_duration_seconds", "Время разбора страницы словаря"
+)
+UPSTREAM_RESPONSE_BYTES = metrics.histogram(
+    "translate_upstream_response_bytes", "Прочитанный размер ответа словаря", SIZE_BUCKETS
+)
+SOURCE_ERRORS = metrics.counter(
+    "translate_source_errors_total", "Ошибки словарей, вместо результата которых отдано сообщение"
+)
+
+
+def get_route(request):
+    """Шаблон маршрута запроса для метки route, чтобы число меток не зависело от адресов запросов"""
+    match = getattr(request, "resolver_match", None)
+    return match.route if match is not None else "unmatched"
+
+
+def observe_upstream(source: str, seconds: float, stats: dict):
+    """Записывает метрики одной загрузки страницы словаря source"""
+    metrics.observe(UPSTREAM_DURATION, seconds, source=source)
+    if "extract_seconds" in stats:
+        metrics.observe(EXTRACT_DURATION, stats["extract_seconds"], source=source)
+    if "bytes" in stats:
+        metrics.observe(UPSTREAM_RESPONSE_BYTES, stats["bytes"], source=source)
@@ -0,0 +1,294 @@
+import os
+import io
+import re
+import sys
+import json
+import time
+import marshal
+import random
+import cProfile
+import threading
+import tracemalloc
+from types import SimpleNamespace
+from collections import Counter
+
+from django.conf import settings
+from rest_framework import exceptions
+
+from user.backends import JWTAuthentication
+
+# Режимы профилирования: детерминированный cProfile или выборка стеков с tracemalloc
+CPROFILE = "cprofile"
+SAMPLE = "sample"
+MODES = (CPROFILE, SAMPLE)
+
+# Расширения файлов профилей: статистика pstats, свернутые стеки для flamegraph и отчет о памяти
+EXTENSIONS = {".prof": CPROFILE, ".folded": SAMPLE, ".memory.txt": "memory"}
+
+_tracemalloc_users = 0
+_tracemalloc_lock = threading.Lock()
+# Потоки, в которых идет профиль: профиль на поток один, под ASGI - один на цикл событий
+_active_threads = set()
+_active_lock = threading.Lock()
+
+
+def get_rate():
+    """Доля запросов, которые профилируются без заголовка"""
+    return getattr(settings, "TRANSLATE_PROFILE_RATE", 0.0)
+
+
+def get_header():
+    """Ключ заголовка в request.META, которым администратор запрашивает профиль"""
+    return "HTTP_" + getattr(settings, "TRANSLATE_PROFILE_HEADER", "X-Profile").upper().replace("-", "_")
+
+
+def get_mode(requested: str = None):
+    """Режим профилирования: запрошенный в заголовке или TRANSLATE_PROFILE_MODE"""
+    if requested in MODES:
+        return requested
+    return getattr(settings, "TRANSLATE_PROFILE_MODE", CPROFILE)
+
+
+def get_directory():
+    return getattr(settings, "TRANSLATE_PROFILE_DIR", os.path.join(settings.BASE_DIR, "profiles"))
+
+
+def sampled():
+    """Выбирается ли запрос для профилирования по TRANSLATE_PROFILE_RATE"""
+    rate = get_rate()
+    return rate > 0 and random.random() < rate
+
+
+def requested(request):
+    """Режим профиля, запрошенный заголовком, или None
+    Заголовок учитывается только в запросе администратора, токен проверяется только при наличии заголовка"""
+    value = request.META.get(get_header())
+    if not value:
+        return None
+    # authenticate записывает request.user, поэтому получает только заголовки и cookies запроса
+    credentials = SimpleNamespace(META=request.META, COOKIES=request.COOKIES)
+    try:
+        result = JWTAuthentication().authenticate(credentials)
+    except exceptions.AuthenticationFailed:
+        return None
+    if result is None:
+        return None
+    user, _ = result
+    return get_mode(value.lower()) if user.is_staff else None
+
+
+def get_tags(request):
+    """Метки профиля: маршрут, выбранные словари и длина текста
+    Тело json и форм читается до представления, которое затем читает его из памяти.
+    Тело файлов не читается, чтобы не разбирать его дважды"""
+    sources = [name for name in ("local", "bkrs", "zhonga") if request.GET.get(name) == "True"]
+    text_length = None
+    try:
+        if request.content_type == "application/json":
+            text = json.loads(request.body).get("text")
+        elif request.content_type == "application/x-www-form-urlencoded":
+            text = request.POST.get("text")
+        else:
+            text = None
+        if isinstance(text, str):
+            text_length = len(text)
+    except Exception:
+        pass
+    return {"source": "+".join(sources) or "none", "text_length": text_length}
+
+
+def slug(value):
+    return re.sub(r"[^0-9A-Za-z+]+", "_", str(value)).strip("_") or "root"
+
+
+class StackSampler:
+    """Выборочный профилировщик: каждые interval секунд запоминает стек потока thread_id
+    Не замедляет профилируемый код, в отличие от cProfile, результат - свернутые стеки
+    в формате flamegraph.pl / speedscope"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("%s (%s:%s)" % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        return "".join("%s %s\n" % (stack, count) for stack, count in self.stacks.most_common())
+
+
+def start_tracemalloc():
+    """tracemalloc общий для процесса, поэтому включается первым профилем и выключается последним"""
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(getattr(settings, "TRANSLATE_PROFILE_TRACEBACK", 10))
+            _tracemalloc_users = 1
+        elif _tracemalloc_users:
+            _tracemalloc_users += 1
+    return tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+
+
+def stop_tracemalloc(before):
+    """Возвращает разницу выделений памяти с момента снимка before и выключает tracemalloc"""
+    global _tracemalloc_users
+    if before is None:
+        return None
+    after = tracemalloc.take_snapshot()
+    with _tracemalloc_lock:
+        if _tracemalloc_users:
+            _tracemalloc_users -= 1
+            if _tracemalloc_users == 0:
+                tracemalloc.stop()
+    return after.compare_to(before, "lineno")
+
+
+class Profile:
+    """Профиль одного запроса
+    cProfile и выборка стеков видят только поток, в котором выполняется запрос: словари,
+    загружаемые в общем пуле, попадают в профиль как ожидание результата. tracemalloc
+    учитывает выделения памяти всего процесса, включая параллельные запросы"""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.thread = threading.get_ident()
+        self.profiler = None
+        self.sampler = None
+        self.snapshot = None
+        self.memory = None
+        self.started = None
+        self.elapsed = None
+
+    def start(self):
+        """Начинает профиль и возвращает его или None, если в этом потоке уже идет профиль:
+        второй cProfile в потоке подменил бы первый, а выборка стеков смешала бы два запроса"""
+        with _active_lock:
+            if self.thread in _active_threads:
+                return None
+            _active_threads.add(self.thread)
+        self.started = time.time()
+        if self.mode == SAMPLE:
+            self.snapshot = start_tracemalloc()
+            self.sampler = StackSampler(self.thread, getattr(settings, "TRANSLATE_PROFILE_INTERVAL", 0.005))
+            self.sampler.start()
+        else:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        return self
+
+    def stop(self):
+        try:
+            if self.profiler is not None:
+                self.profiler.disable()
+            if self.sampler is not None:
+                self.sampler.stop()
+                self.memory = stop_tracemalloc(self.snapshot)
+                self.snapshot = None
+            self.elapsed = time.time() - self.started
+        finally:
+            with _active_lock:
+                _active_threads.discard(self.thread)
+
+    def files(self):
+        """Содержимое файлов профиля по расширениям"""
+        if self.profiler is not None:
+            # Тот же формат, что у dump_stats, файл открывается pstats.Stats и snakeviz
+            self.profiler.create_stats()
+            return {".prof": marshal.dumps(self.profiler.stats)}
+        files = {".folded": self.sampler.folded().encode("utf-8")}
+        if self.memory is not None:
+            report = io.StringIO()
+            for stat in self.memory[:getattr(settings, "TRANSLATE_PROFILE_MEMORY_TOP", 25)]:
+                report.write("%s\n" % stat)
+            files[".memory.txt"] = report.getvalue().encode("utf-8")
+        return files
+
+
+class ProfileStore:
+    """Каталог профилей с ограничением TRANSLATE_PROFILE_KEEP файлов
+    Метки профиля хранятся в имени файла, поэтому список профилей не требует индекса
+    и каталог можно разделять между процессами"""
+    NAME = re.compile(
+        r"^(?P<created>\d+)-(?P<pid>\d+)-(?P<endpoint>[^-]+)-(?P<source>[^-]+)-(?P<text_length>\d+|none)"
+        r"-(?P<elapsed_ms>\d+)ms(?P<extension>\.prof|\.folded|\.memory\.txt)$"
+    )
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or get_directory()
+
+    def keep(self):
+        return getattr(settings, "TRANSLATE_PROFILE_KEEP", 100)
+
+    def save(self, profile: Profile, tags: dict):
+        """Сохраняет файлы профиля, удаляет самые старые сверх TRANSLATE_PROFILE_KEEP
+        Возвращает имена сохраненных файлов"""
+        os.makedirs(self.directory, exist_ok=True)
+        stem = "%d-%d-%s-%s-%s-%dms" % (
+            profile.started * 1000, os.getpid(), slug(tags["endpoint"]), slug(tags["source"]),
+            tags["text_length"] if tags["text_length"] is not None else "none", profile.elapsed * 1000,
+        )
+        names = []
+        for extension, content in profile.files().items():
+            name = stem + extension
+            # Запись во временный файл и переименование, чтобы список не видел неполный профиль
+            path = os.path.join(self.directory, name)
+            with open(path + ".tmp", "wb") as file:
+                file.write(content)
+            os.replace(path + ".tmp", path)
+            names.append(name)
+        self.rotate()
+        return names
+
+    def entries(self):
+        """Профили каталога от новых к старым"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        entries = []
+        for name in names:
+            match = self.NAME.match(name)
+            if match is None:
+                continue
+            entry = match.groupdict()
+            entry["name"] = name
+            entry["kind"] = EXTENSIONS[entry.pop("extension")]
+            entry["created"] = int(entry["created"]) / 1000
+            entry["pid"] = int(entry["pid"])
+            entry["elapsed_ms"] = int(entry["elapsed_ms"])
+            entry["text_length"] = None if entry["text_length"] == "none" else int(entry["text_length"])
+            entries.append(entry)
+        entries.sort(key=lambda entry: (entry["created"], entry["name"]), reverse=True)
+        return entries
+
+    def rotate(self):
+        for entry in self.entries()[self.keep():]:
+            try:
+                os.remove(os.path.join(self.directory, entry["name"]))
+            except FileNotFoundError:
+                pass
+
+    def path(self, name: str):
+        """Путь к файлу профиля name или None, если такого профиля нет"""
+        if self.NAME.match(name) is None:
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
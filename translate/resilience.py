@@ -0,0 +1,544 @@
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import httpx
+import requests
+from django.conf import settings
+
+from .stats import percentile
+from .upstream import UpstreamServerError
+
+
+class SourceUnavailable(Exception):
+    """Словарь не вернул результат, сообщение отдается клиенту вместо результата словаря"""
+    message = "Не удалось получить перевод"
+
+    def __init__(self, message: str = None):
+        super().__init__(message or self.message)
+
+
+class CircuitOpen(SourceUnavailable):
+    """Словарь временно отключен после серии ошибок"""
+    message = "Словарь временно недоступен"
+
+
+class DeadlineExceeded(SourceUnavailable):
+    """Словарь не ответил до истечения времени запроса"""
+    message = "Словарь не ответил вовремя"
+
+
+class RateLimited(SourceUnavailable):
+    """Запрос к словарю не дождался очереди ограничителя"""
+    message = "Словарь перегружен, повторите запрос позже"
+
+
+def is_source_failure(error: BaseException):
+    """Считается ли ошибка отказом словаря: сбой соединения, таймаут или ошибка сервера 5xx
+    Ошибка разбора страницы, например страницы без результата для неизвестного слова,
+    означает, что словарь ответил, поэтому не отключает его и не снижает лимит запросов"""
+    return isinstance(error, (
+        requests.RequestException, httpx.TransportError, OSError, asyncio.TimeoutError,
+        DeadlineExceeded, UpstreamServerError,
+    ))
+
+
+class Deadline:
+    """Момент, к которому запрос на перевод должен быть выполнен"""
+
+    def __init__(self, seconds: float):
+        self.expires = time.monotonic() + seconds
+        self.cancelled = False
+
+    @classmethod
+    def from_settings(cls):
+        """Срок запроса из TRANSLATE_DEADLINE или None, если он не ограничен"""
+        seconds = getattr(settings, "TRANSLATE_DEADLINE", None)
+        return cls(seconds) if seconds else None
+
+    @classmethod
+    def copy(cls, deadline: "Deadline" = None):
+        """Срок, совпадающий с deadline (без ограничения, если deadline None), который можно
+        отменить отдельно от него"""
+        copy = cls(math.inf)
+        if deadline is not None:
+            copy.expires = deadline.expires
+        return copy
+
+    def cancel(self):
+        """Прерывает запрос: следующая проверка срока выбросит DeadlineExceeded"""
+        self.cancelled = True
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def check(self):
+        """Выбрасывает DeadlineExceeded, если срок истек или запрос прерван"""
+        if self.cancelled or time.monotonic() >= self.expires:
+            raise DeadlineExceeded()
+
+    def timeout(self, connect: float, read: float):
+        """Таймауты соединения и чтения, не превышающие оставшееся время"""
+        self.check()
+        remaining = self.remaining()
+        return min(connect, remaining), min(read, remaining)
+
+
+class CircuitBreaker:
+    """Автоматический выключатель словаря
+    После TRANSLATE_CIRCUIT_FAILURES ошибок подряд запросы к словарю сразу отклоняются
+    в течение TRANSLATE_CIRCUIT_RESET секунд, затем пропускается один пробный запрос:
+    при успехе словарь снова включается, при ошибке снова отключается"""
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def threshold():
+        return getattr(settings, "TRANSLATE_CIRCUIT_FAILURES", 5)
+
+    @staticmethod
+    def reset_timeout():
+        return getattr(settings, "TRANSLATE_CIRCUIT_RESET", 30)
+
+    def before_call(self):
+        """Выбрасывает CircuitOpen, если запрос к словарю сейчас не допускается
+        Возвращает True, если запрос пробный"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return False
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout():
+                self.state = self.HALF_OPEN
+                return True
+            raise CircuitOpen()
+
+    def release(self, probe: bool):
+        """Возвращает место пробного запроса, который не дошел до словаря или был отменен:
+        выключатель снова разомкнут с прежним временем, поэтому следующий запрос станет пробным.
+        Иначе выключатель навсегда остался бы в half_open, отклоняя все запросы"""
+        if not probe:
+            return
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold():
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Время ответа последних успешных запросов к словарю"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float):
+        """Перцентиль времени ответа или None, пока запросов меньше TRANSLATE_HEDGE_MIN_SAMPLES"""
+        with self._lock:
+            samples = list(self._samples)
+        if len(samples) < getattr(settings, "TRANSLATE_HEDGE_MIN_SAMPLES", 20):
+            return None
+        return percentile(samples, p)
+
+
+class SourceLimiter:
+    """Ограничитель запросов к словарю, общий для всех запросов процесса
+    Частота запросов ограничена корзиной токенов: TRANSLATE_RATE_LIMIT запросов в секунду
+    с пиком до TRANSLATE_RATE_BURST. Число одновременных запросов подстраивается по AIMD:
+    после успешного ответа лимит растет на 1/лимит (примерно на 1 за каждый полный набор
+    запросов), после ошибки уменьшается вдвое, в пределах TRANSLATE_CONCURRENCY_MIN..MAX.
+    Запросы сверх лимита ждут в очереди не больше TRANSLATE_LIMIT_QUEUE_SIZE запросов
+    и не дольше TRANSLATE_LIMIT_QUEUE_TIMEOUT секунд, остальные отклоняются с RateLimited"""
+    # Шаг опроса при асинхронном ожидании, ограничитель общий для потоков и циклов событий
+    poll_interval = 0.01
+
+    def __init__(self, name: str):
+        self.name = name
+        self.limit = float(getattr(settings, "TRANSLATE_CONCURRENCY_INITIAL", 4))
+        self.in_flight = 0
+        self.queued = 0
+        self.tokens = float(self._setting("TRANSLATE_RATE_BURST", 20))
+        self.updated = time.monotonic()
+        self.rejected = 0
+        self.waited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._condition = threading.Condition()
+
+    def _setting(self, name: str, default):
+        return getattr(settings, name, {}).get(self.name, default)
+
+    def _refill(self):
+        now = time.monotonic()
+        rate = self._setting("TRANSLATE_RATE_LIMIT", 10)
+        self.tokens = min(self._setting("TRANSLATE_RATE_BURST", 20), self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def _try_acquire(self):
+        """Забирает место и токен, если они есть, иначе возвращает, сколько секунд ждать токена
+        (None - ждать освобождения места)"""
+        self._refill()
+        if self.in_flight >= max(1, int(self.limit)):
+            return None
+        if self.tokens < 1:
+            return (1 - self.tokens) / self._setting("TRANSLATE_RATE_LIMIT", 10)
+        self.tokens -= 1
+        self.in_flight += 1
+        return 0
+
+    def _queue_timeout(self, deadline: Deadline = None):
+        timeout = getattr(settings, "TRANSLATE_LIMIT_QUEUE_TIMEOUT", 1.0)
+        return min(timeout, deadline.remaining()) if deadline is not None else timeout
+
+    def _enqueue(self):
+        if self.queued >= getattr(settings, "TRANSLATE_LIMIT_QUEUE_SIZE", 32):
+            self.rejected += 1
+            raise RateLimited()
+        self.queued += 1
+
+    def _record_wait(self, seconds: float):
+        self.waited += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+    def acquire(self, deadline: Deadline = None):
+        """Ждет разрешения на запрос к словарю или выбрасывает RateLimited"""
+        start = time.monotonic()
+        expires = start + self._queue_timeout(deadline)
+        with self._condition:
+            if self._try_acquire() != 0:
+                self._enqueue()
+                try:
+                    while True:
+                        wait_time = self._try_acquire()
+                        if wait_time == 0:
+                            break
+                        remaining = expires - time.monotonic()
+                        if remaining <= 0:
+                            self.rejected += 1
+                            raise RateLimited()
+                        self._condition.wait(min(remaining, wait_time) if wait_time else remaining)
+                finally:
+                    self.queued -= 1
+            self._record_wait(time.monotonic() - start)
+
+    async def aacquire(self, deadline: Deadline = None):
+        """Асинхронный вариант acquire, не блокирует цикл событий"""
+        start = time.monotonic()
+        expires = start + self._queue_timeout(deadline)
+        with self._condition:
+            if self._try_acquire() == 0:
+                self._record_wait(0.0)
+                return
+            self._enqueue()
+        try:
+            while True:
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    with self._condition:
+                        self.rejected += 1
+                    raise RateLimited()
+                await asyncio.sleep(min(remaining, self.poll_interval))
+                with self._condition:
+                    if self._try_acquire() == 0:
+                        self._record_wait(time.monotonic() - start)
+                        return
+        finally:
+            with self._condition:
+                self.queued -= 1
+
+    def release(self, success: bool = None):
+        """Освобождает место и подстраивает лимит одновременных запросов
+        success=None - запрос прерван, например отменен, и лимит не меняется"""
+        with self._condition:
+            self.in_flight -= 1
+            if success:
+                self.limit = min(getattr(settings, "TRANSLATE_CONCURRENCY_MAX", 16), self.limit + 1 / self.limit)
+            elif success is not None:
+                self.limit = max(getattr(settings, "TRANSLATE_CONCURRENCY_MIN", 1), self.limit / 2)
+            self._condition.notify()
+
+    def stats(self):
+        with self._condition:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "queue_wait_avg_ms": round(self.wait_total / self.waited * 1000, 3) if self.waited else 0.0,
+                "queue_wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+
+
+class Attempt:
+    """Один запрос к словарю с разрешения ограничителя
+    Запрос получает собственный срок, поэтому его можно прервать, когда результат больше не нужен,
+    например после ответа повторного запроса: abandon сразу освобождает место в ограничителе,
+    а потоковая загрузка прерывается на следующем куске"""
+
+    def __init__(self, limiter: SourceLimiter, deadline: Deadline = None):
+        self.limiter = limiter
+        self.deadline = Deadline.copy(deadline)
+        self.holding = False
+        self._lock = threading.Lock()
+
+    def run(self, fetch):
+        """Выполняет fetch(deadline) с разрешения ограничителя"""
+        self.limiter.acquire(self.deadline)
+        with self._lock:
+            if self.deadline.cancelled:
+                self.limiter.release()
+                raise DeadlineExceeded()
+            self.holding = True
+        success = None
+        try:
+            value = fetch(self.deadline)
+            success = True
+            return value
+        except Exception as ex:
+            # Прерванный запрос ничего не говорит о состоянии словаря
+            if not self.deadline.cancelled:
+                success = not is_source_failure(ex)
+            raise
+        finally:
+            self._release(success)
+
+    def abandon(self):
+        """Прерывает запрос, результат которого больше не нужен"""
+        self.deadline.cancel()
+        self._release(None)
+
+    def _release(self, success: bool = None):
+        with self._lock:
+            holding, self.holding = self.holding, False
+        if holding:
+            self.limiter.release(success)
+
+
+class SourceGuard:
+    """Защита запросов к одному словарю: срок запроса, автоматический выключатель,
+    ограничитель частоты и числа одновременных запросов и необязательный повторный запрос
+    (hedging), если первый отвечает дольше TRANSLATE_HEDGE_PERCENTILE перцентиля времени
+    ответа словаря"""
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.limiter = SourceLimiter(name)
+        self.hedges = 0
+
+    @classmethod
+    def executor(cls):
+        """Пул потоков для запросов с повтором, отдельный от пула загрузки словарей,
+        потому что ожидающий повтора поток сам может быть из пула загрузки"""
+        if cls._executor is None:
+            with cls._executor_lock:
+                if cls._executor is None:
+                    cls._executor = ThreadPoolExecutor(
+                        max_workers=getattr(settings, "TRANSLATE_HEDGE_WORKERS", 8),
+                        thread_name_prefix="translate-hedge"
+                    )
+        return cls._executor
+
+    def hedge_delay(self):
+        """Через сколько секунд без ответа отправляется повторный запрос или None без повтора"""
+        if not getattr(settings, "TRANSLATE_HEDGE", False):
+            return None
+        return self.latency.percentile(getattr(settings, "TRANSLATE_HEDGE_PERCENTILE", 95))
+
+    def call(self, fetch, hedge_fetch=None, deadline: Deadline = None):
+        """Выполняет fetch(deadline) с защитой словаря
+        fetch получает срок своего запроса и должен прерываться по его истечении: поток нельзя
+        отменить, поэтому запрос, проигравший повторному, прерывается отменой его срока
+        hedge_fetch - функция для повторного запроса, по умолчанию fetch
+        Выключатель учитывает только отказы словаря (is_source_failure), ошибка разбора
+        ответившего словаря считается успешным запросом"""
+        # Истекший до запроса срок - не ошибка словаря
+        if deadline is not None:
+            deadline.check()
+        probe = self.breaker.before_call()
+        start = time.monotonic()
+        try:
+            delay = self.hedge_delay()
+            if delay is None:
+                value = self._limited(fetch, deadline)
+            else:
+                value = self._hedged(fetch, hedge_fetch or fetch, delay, deadline)
+        except RateLimited:
+            # Отказ ограничителя - перегрузка у нас, а не ошибка словаря
+            self.breaker.release(probe)
+            raise
+        except Exception as ex:
+            self._record(ex)
+            raise
+        except BaseException:
+            self.breaker.release(probe)
+            raise
+        self.breaker.success()
+        self.latency.add(time.monotonic() - start)
+        return value
+
+    def _record(self, error: Exception):
+        """Учитывает в выключателе ошибку запроса к словарю"""
+        if is_source_failure(error):
+            self.breaker.failure()
+        else:
+            self.breaker.success()
+
+    def _limited(self, fetch, deadline: Deadline = None):
+        """Выполняет запрос с разрешения ограничителя"""
+        return Attempt(self.limiter, deadline).run(fetch)
+
+    async def _alimited(self, afetch, deadline: Deadline = None):
+        await self.limiter.aacquire(deadline)
+        success = None
+        try:
+            value = await afetch()
+            success = True
+            return value
+        except Exception as ex:
+            success = not is_source_failure(ex)
+            raise
+        finally:
+            self.limiter.release(success)
+
+    def _hedged(self, fetch, hedge_fetch, delay: float, deadline: Deadline):
+        """Запрос с повтором в пуле потоков
+        Запрос, результат которого не понадобился, прерывается и сразу освобождает место в ограничителе"""
+        attempts = {}
+
+        def start(fetch):
+            attempt = Attempt(self.limiter, deadline)
+            attempts[self.executor().submit(attempt.run, fetch)] = attempt
+
+        start(fetch)
+        try:
+            done, _ = wait(set(attempts), timeout=delay)
+            if not done:
+                self.hedges += 1
+                start(hedge_fetch)
+            error = None
+            futures = set(attempts)
+            while futures:
+                done, futures = wait(
+                    futures, timeout=deadline.remaining() if deadline else None, return_when=FIRST_COMPLETED
+                )
+                if not done:
+                    raise DeadlineExceeded()
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            for future, attempt in attempts.items():
+                if not future.done():
+                    future.cancel()
+                    attempt.abandon()
+
+    async def acall(self, afetch, deadline: Deadline = None):
+        """Асинхронный вариант call, afetch - функция, возвращающая корутину"""
+        if deadline is not None:
+            deadline.check()
+        probe = self.breaker.before_call()
+        start = time.monotonic()
+        afetch = partial(self._alimited, afetch, deadline)
+        try:
+            delay = self.hedge_delay()
+            if delay is None:
+                value = await asyncio.wait_for(afetch(), deadline.remaining() if deadline else None)
+            else:
+                value = await self._ahedged(afetch, delay, deadline)
+        except asyncio.TimeoutError:
+            self.breaker.failure()
+            raise DeadlineExceeded()
+        except RateLimited:
+            self.breaker.release(probe)
+            raise
+        except Exception as ex:
+            self._record(ex)
+            raise
+        except BaseException:
+            # Отмена задачи (CancelledError) не наследуется от Exception
+            self.breaker.release(probe)
+            raise
+        self.breaker.success()
+        self.latency.add(time.monotonic() - start)
+        return value
+
+    async def _ahedged(self, afetch, delay: float, deadline: Deadline):
+        tasks = {asyncio.ensure_future(afetch())}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.hedges += 1
+                tasks.add(asyncio.ensure_future(afetch()))
+            error = None
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=deadline.remaining() if deadline else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise asyncio.TimeoutError()
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self):
+        return dict(
+            self.limiter.stats(),
+            state=self.breaker.state,
+            failures=self.breaker.failures,
+            hedges=self.hedges,
+            p95_ms=round((self.latency.percentile(95) or 0) * 1000, 3),
+        )
+
+
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard(source: str):
+    """Возвращает общую для процесса защиту словаря source"""
+    guard = _guards.get(source)
+    if guard is None:
+        with _guards_lock:
+            guard = _guards.setdefault(source, SourceGuard(source))
+    return guard
+
+
+def reset():
+    """Сбрасывает состояние защиты всех словарей"""
+    with _guards_lock:
+        _guards.clear()
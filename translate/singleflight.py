@@ -0,0 +1,88 @@
+import asyncio
+import threading
+
+from django.conf import settings
+
+from .resilience import DeadlineExceeded
+
+
+class _Call:
+    """Выполняющийся вызов, которого ждут остальные запросы с тем же ключом"""
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Объединение одновременных вызовов с одинаковым ключом
+    Пока вызов с ключом выполняется, остальные вызовы с тем же ключом не выполняют функцию,
+    а ждут и получают результат или исключение первого. Работает между потоками процесса
+    и между корутинами одного цикла событий"""
+
+    def __init__(self):
+        self._calls = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, "TRANSLATE_COALESCE", True)
+
+    def do(self, key, fn, timeout: float = None):
+        """Вызывает fn() или ждет результат уже выполняющегося вызова с ключом key
+        не дольше timeout секунд, после чего выбрасывает DeadlineExceeded"""
+        if not self.enabled():
+            return fn()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            if not call.event.wait(timeout):
+                raise DeadlineExceeded()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except Exception as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    async def ado(self, key, afn, timeout: float = None):
+        """Асинхронный вариант do, afn - функция, возвращающая корутину
+        Вызов выполняется отдельной задачей, поэтому отмена одного из ожидающих не отменяет его для остальных"""
+        if not self.enabled():
+            return await afn()
+        loop = asyncio.get_running_loop()
+        task_key = (loop, key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = self._tasks[task_key] = loop.create_task(afn())
+                task.add_done_callback(lambda _: self._forget(task_key))
+            else:
+                self.coalesced += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded()
+
+    def _forget(self, task_key):
+        with self._lock:
+            self._tasks.pop(task_key, None)
+
+
+flights = SingleFlight()
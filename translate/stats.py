@@ -0,0 +1,10 @@
+import math
+
+
+def percentile(values, p: float):
+    """Возвращает перцентиль p (от 0 до 100) списка values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[index]
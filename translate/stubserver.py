@@ -0,0 +1,147 @@
+import sys
+import time
+import threading
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TESTDATA_DIR = Path(__file__).resolve().parent / "testdata"
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Бенчмарки открывают сотни соединений одновременно
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # Клиент закрыл соединение, например не дочитав ответ
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+def load_page(name: str):
+    """Возвращает содержимое страницы словаря из testdata
+    Страницы синтетические: разметка результатов повторяет bkrs и zhonga, а объем страницы
+    набран скриптами и меню. Настоящие ответы словарей не сохранены, поэтому совпадение
+    разборов на этих страницах не гарантирует совпадения на живых страницах"""
+    return (TESTDATA_DIR / (name + ".html")).read_bytes()
+
+
+class StubUpstream:
+    """Локальная заглушка словарей bkrs и zhonga для тестов и бенчмарков
+    Отдает синтетические страницы из testdata с настраиваемой задержкой
+    Используется как контекстный менеджер, адреса для TRANSLATE_UPSTREAM_URLS доступны в urls"""
+    # Страницы для конкретных текстов, для остальных отдается страница с разбором фразы
+    pages = {
+        "bkrs": {"哪儿": "bkrs_word"},
+        "zhonga": {"哪儿": "zhonga_word"},
+    }
+    default_pages = {"bkrs": "bkrs_phrase", "zhonga": "zhonga_phrase"}
+    query_params = {"bkrs": "ch", "zhonga": "q"}
+
+    def __init__(self, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0,
+                 chunk_size: int = None, chunk_delay: float = 0.0):
+        self.latency = latency
+        # Тело ответа отправляется кусками chunk_size байт с паузой chunk_delay, как по медленной сети
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.requests = 0
+        self.connections = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._content = {name: load_page(name) for name in self._page_names()}
+        self._server = _Server((host, port), self._handler_class())
+        self._thread = None
+
+    def _page_names(self):
+        names = set(self.default_pages.values())
+        for pages in self.pages.values():
+            names.update(pages.values())
+        return names
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return "http://%s:%s" % (host, port)
+
+    @property
+    def urls(self):
+        """Адреса словарей в формате TRANSLATE_UPSTREAM_URLS"""
+        return {
+            "bkrs": self.url + "/bkrs/slovo.php?ch=",
+            "zhonga": self.url + "/zhonga/search?q=",
+        }
+
+    def page(self, source: str, text: str):
+        """Возвращает страницу, которую заглушка отдает на запрос text в словарь source"""
+        name = self.pages.get(source, {}).get(text, self.default_pages[source])
+        return self._content[name]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                source = parts.path.strip("/").split("/")[0]
+                if source not in stub.default_pages:
+                    self.send_error(404)
+                    return
+                text = parse_qs(parts.query).get(stub.query_params[source], [""])[0]
+                with stub._lock:
+                    stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                body = stub.page(source, text)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                chunk_size = stub.chunk_size or len(body)
+                for start in range(0, len(body), chunk_size):
+                    if start and stub.chunk_delay:
+                        time.sleep(stub.chunk_delay)
+                    try:
+                        self.wfile.write(body[start:start + chunk_size])
+                        self.wfile.flush()
+                    except ConnectionError:
+                        # Клиент закрыл соединение, не дочитав ответ
+                        self.close_connection = True
+                        return
+                    with stub._lock:
+                        stub.bytes_sent += len(body[start:start + chunk_size])
+
+            def do_HEAD(self):
+                # Прогрев соединений воркера gunicorn
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -1,22 +1,62 @@
 from rest_framework.test import APITestCase as TestCase
+from django.test import SimpleTestCase, AsyncClient
+from django.test.utils import override_settings
+from django.core.management.base import CommandError
+
+import os
+import json
+import asyncio
+import time
+import pstats
+import tempfile
+import threading
+import tracemalloc
+from unittest import mock
 
 # Create your tests here.
 
+from user.models import MyUser
+from user.backends import token_cache, user_cache
 from user.serializers import RegistrationSerializer
+from .views import Parser, check_language_chinese, find_not_chinese, PUNCTUATION_MARKS
+from . import upstream, extract, resilience, benchmarks, profiling
+from .cache import TranslationCache, translation_cache
+from .dictionary import LocalDictionary
+from .singleflight import SingleFlight
+from .metrics import Registry, metrics
+from .profiling import ProfileStore
+from .stubserver import StubUpstream, load_page
+
+
+class StubUpstreamTestCase(TestCase):
+    """Тесты представлений со словарями на локальной заглушке и пользователем Username
+    Тест не зависит от сети и доступности словарей, кэш переводов по умолчанию отключен"""
+    upstream_settings = {"TRANSLATE_CACHE_ENABLED": False}
 
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        resilience.reset()
+        cls.stub = StubUpstream().start()
+        cls.stub_settings = override_settings(TRANSLATE_UPSTREAM_URLS=cls.stub.urls, **cls.upstream_settings)
+        cls.stub_settings.enable()
 
-class TranslateListViewTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub_settings.disable()
+        cls.stub.stop()
+        super().tearDownClass()
 
     @classmethod
     def setUpTestData(cls):
         """Настройка контекста для теста"""
-        mail = 'Username@mail.ru'
-        username = 'Username'
-        password = 'Password1'
-        user = {"mail": mail, "username": username, "password": password}
+        user = {"mail": 'Username@mail.ru', "username": 'Username', "password": 'Password1'}
         serializer = RegistrationSerializer(data=user)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        cls.token = serializer.save().token
+
+
+class TranslateListViewTest(StubUpstreamTestCase):
 
     def login(self, mail, password):
         """Авторизация пользователя с именем name и паролем password"""
@@ -127,3 +167,944 @@ class TranslateListViewTest(TestCase):
         resp = self.login('Username@mail.ru', 'Password1')
         resp = self.translate("哪儿", "False", "True")
         self.assertEqual(resp.json()['zhonga'], [['哪儿'], ['nǎr'], ['где?, куда? \n\n\nсм. 哪里  \n\n\nгде? где уж там! (вопр)']])
+
+
+class ParserConcurrencyTest(SimpleTestCase):
+
+    def test_sources_fetched_concurrently(self):
+        """Тестирование параллельной загрузки словарей: время равно самому медленному словарю"""
+        def slow(result):
+            def parse(self):
+                time.sleep(0.3)
+                return result
+            return parse
+
+        with mock.patch.object(Parser, "parser_bkrs", slow(["bkrs"])), \
+                mock.patch.object(Parser, "parser_zhonga", slow(["zhonga"])):
+            start = time.monotonic()
+            result = Parser("那不", True, True).result
+            elapsed = time.monotonic() - start
+        self.assertEqual(result, {"bkrs": ["bkrs"], "zhonga": ["zhonga"]})
+        self.assertLess(elapsed, 0.5)
+
+    def test_result_is_not_shared(self):
+        """Тестирование того, что результат не разделяется между запросами в разных потоках"""
+        results = {}
+
+        def run(text):
+            results[text] = Parser(text, True, True).result
+
+        with mock.patch.object(Parser, "parser_bkrs", lambda self: self.text), \
+                mock.patch.object(Parser, "parser_zhonga", lambda self: self.text):
+            threads = [threading.Thread(target=run, args=(text,)) for text in ("那", "不", "哪儿")]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        for text, result in results.items():
+            self.assertEqual(result, {"bkrs": text, "zhonga": text})
+        self.assertFalse(hasattr(Parser, "result"))
+
+
+class AsyncTranslateViewTest(StubUpstreamTestCase):
+    upstream_settings = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        translation_cache.clear()
+        super().tearDownClass()
+
+    async def translate(self, text, bkrs="True", zhonga="True", token=None):
+        client = AsyncClient()
+        if token:
+            client.cookies["Token"] = token
+        return await client.post('/translate/async/?bkrs=' + bkrs + '&zhonga=' + zhonga, {'text': text},
+                                 content_type="application/json")
+
+    async def test_authenticate_translate(self):
+        """Тестирование асинхронного перевода авторизованным пользователем в оба словаря"""
+        resp = await self.translate("哪儿", token=self.token)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()['bkrs'], [['哪儿'], ['nǎr'], ['разг. где?, куда? (вм. 哪里 кроме 5)']])
+        self.assertEqual(resp.json()['zhonga'],
+                         [['哪儿'], ['nǎr'], ['где?, куда? \n\n\nсм. 哪里  \n\n\nгде? где уж там! (вопр)']])
+
+    async def test_not_authenticate_translate(self):
+        """Тестирование асинхронного перевода не авторизованным пользователем"""
+        resp = await self.translate("哪儿")
+        self.assertEqual(resp.status_code, 401)
+
+    async def test_authenticate_translate_with_incorrect_text(self):
+        """Тестирование асинхронного перевода с некорректным текстом"""
+        resp = await self.translate("Русский язык", token=self.token)
+        self.assertEqual(resp.status_code, 400)
+
+
+class UpstreamTest(SimpleTestCase):
+
+    def setUp(self):
+        upstream.reset()
+        resilience.reset()
+        self.addCleanup(upstream.reset)
+
+    def test_connections_reused(self):
+        """Тестирование повторного использования keep-alive соединения с словарем"""
+        with StubUpstream() as stub, \
+                override_settings(TRANSLATE_UPSTREAM_URLS=stub.urls, TRANSLATE_CACHE_ENABLED=False):
+            first = Parser("哪儿", True, False).result
+            second = Parser("哪儿", True, False).result
+        self.assertEqual(first, second)
+        self.assertEqual(stub.requests, 2)
+        self.assertEqual(stub.connections, 1)
+
+    def test_streaming_stops_early(self):
+        """Тестирование прекращения потоковой загрузки после области результата"""
+        with StubUpstream(chunk_size=4096, chunk_delay=0.05) as stub, \
+                override_settings(TRANSLATE_UPSTREAM_URLS=stub.urls, TRANSLATE_CACHE_ENABLED=False,
+                                  TRANSLATE_UPSTREAM_DRAIN_SIZE=0):
+            result = Parser.fetch_bkrs("那不")
+            time.sleep(0.2)
+            page = stub.page("bkrs", "那不")
+            self.assertEqual(result, extract.bkrs("那不", page))
+            self.assertLess(stub.bytes_sent, len(page))
+
+    def test_max_response_size(self):
+        """Тестирование отклонения слишком большого ответа словаря"""
+        with StubUpstream() as stub, \
+                override_settings(TRANSLATE_UPSTREAM_URLS=stub.urls, TRANSLATE_UPSTREAM_MAX_RESPONSE_SIZE=1024):
+            with self.assertRaises(upstream.ResponseTooLarge):
+                Parser.fetch_zhonga("那不")
+
+    @override_settings(TRANSLATE_UPSTREAM_CONNECT_TIMEOUT=1, TRANSLATE_UPSTREAM_READ_TIMEOUT=2)
+    def test_timeouts(self):
+        """Тестирование передачи таймаутов в запрос к словарю"""
+        with mock.patch.object(upstream.get_session(), "get", return_value=mock.Mock(status_code=200)) as get:
+            upstream.get("http://127.0.0.1/")
+        get.assert_called_once_with("http://127.0.0.1/", timeout=(1, 2))
+
+
+class TranslationCacheTest(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = TranslationCache()
+        self.cache.clear()
+        self.fetch = mock.Mock(side_effect=["first", "second"])
+
+    def test_hit_and_miss(self):
+        """Тестирование попадания в кэш для одинакового текста"""
+        self.assertEqual(self.cache.get_or_fetch("bkrs", "哪儿", self.fetch), "first")
+        self.assertEqual(self.cache.get_or_fetch("bkrs", "哪儿", self.fetch), "first")
+        self.assertEqual(self.fetch.call_count, 1)
+        stats = self.cache.stats()
+        self.assertEqual((stats["misses"], stats["l1_hits"]), (1, 1))
+
+    def test_exact_text_key(self):
+        """Тестирование раздельных записей для текстов, отличающихся пробелами и формой символов:
+        результат содержит исходный текст, поэтому не должен отдаваться для другого текста"""
+        self.cache.get_or_fetch("bkrs", "哪儿", self.fetch)
+        self.assertEqual(self.cache.get_or_fetch("bkrs", "哪儿 ", self.fetch), "second")
+        self.assertNotEqual(self.cache.key("bkrs", "\uF900"), self.cache.key("bkrs", "\u8C48"))
+
+    def test_sources_cached_separately(self):
+        """Тестирование раздельного кэширования словарей"""
+        self.cache.get_or_fetch("bkrs", "哪儿", self.fetch)
+        self.assertEqual(self.cache.get_or_fetch("zhonga", "哪儿", self.fetch), "second")
+
+    def test_shared_cache(self):
+        """Тестирование получения записи из общего кэша, если ее нет в памяти процесса"""
+        self.cache.get_or_fetch("bkrs", "哪儿", self.fetch)
+        self.cache.l1.clear()
+        self.assertEqual(self.cache.get_or_fetch("bkrs", "哪儿", self.fetch), "first")
+        self.assertEqual(self.cache.stats()["l2_hits"], 1)
+
+    @override_settings(TRANSLATE_CACHE_TTL={"bkrs": 0}, TRANSLATE_CACHE_STALE_TTL=60)
+    def test_stale_while_revalidate(self):
+        """Тестирование отдачи устаревшей записи с обновлением в фоне"""
+        self.cache.get_or_fetch("bkrs", "哪儿", self.fetch)
+        self.assertEqual(self.cache.get_or_fetch("bkrs", "哪儿", self.fetch), "first")
+        self.cache._executor.submit(lambda: None).result()
+        self.cache._executor.shutdown(wait=True)
+        self.assertEqual(self.fetch.call_count, 2)
+        self.assertEqual(self.cache.stats()["stale_hits"], 1)
+        self.assertEqual(self.cache.l1.get(self.cache.key("bkrs", "哪儿"))[0], "second")
+
+    @override_settings(TRANSLATE_CACHE_TTL={"bkrs": 0}, TRANSLATE_CACHE_STALE_TTL=60)
+    def test_refresh_error_counted(self):
+        """Тестирование учета ошибки фонового обновления"""
+        self.fetch.side_effect = ["first", ConnectionError()]
+        self.cache.get_or_fetch("bkrs", "哪儿", self.fetch)
+        with self.assertLogs("translate.cache", "ERROR"):
+            self.assertEqual(self.cache.get_or_fetch("bkrs", "哪儿", self.fetch), "first")
+            self.cache._executor.shutdown(wait=True)
+        self.assertEqual((self.cache.stats()["refreshes"], self.cache.stats()["refresh_errors"]), (0, 1))
+
+    @override_settings(TRANSLATE_CACHE_SHARED_LOCK=True, TRANSLATE_CACHE_LOCK_TIMEOUT=0.05, TRANSLATE_CACHE_LOCK_POLL=0.01)
+    def test_foreign_lock_kept(self):
+        """Тестирование загрузки без блокировки по истечении ожидания: чужая блокировка не снимается"""
+        lock = self.cache.key("bkrs", "哪儿") + ":lock"
+        self.cache.l2.add(lock, 1, 60)
+        self.assertEqual(self.cache.get_or_fetch("bkrs", "哪儿", self.fetch), "first")
+        self.assertEqual(self.cache.l2.get(lock), 1)
+
+        async def afetch():
+            return self.fetch()
+
+        self.cache.l1.clear()
+        self.cache.l2.delete(self.cache.key("bkrs", "哪儿"))
+        self.assertEqual(asyncio.run(self.cache.aget_or_fetch("bkrs", "哪儿", afetch, self.fetch)), "second")
+        self.assertEqual(self.cache.l2.get(lock), 1)
+        self.cache.l2.delete(lock)
+
+
+class LocalDictionaryTest(SimpleTestCase):
+    cedict = [
+        "# CC-CEDICT",
+        "哪兒 哪儿 [na3 r5] /where?/wherever/",
+        "那 那 [na4] /that/those/",
+        "不 不 [bu4] /not/no/",
+        "中國 中国 [Zhong1 guo2] /China/",
+        "中 中 [zhong1] /middle/",
+        "國 国 [guo2] /country/",
+        "傳統 传统 [chuan2 tong3] /tradition/",
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "cedict.idx")
+        LocalDictionary.build(self.cedict, path)
+        self.dictionary = LocalDictionary(path)
+        self.addCleanup(self.dictionary.close)
+
+    def test_lookup(self):
+        """Тестирование поиска слова в упрощенной и традиционной записи"""
+        self.assertEqual(self.dictionary.lookup("哪儿"), ("nǎr", ["where?", "wherever"]))
+        self.assertEqual(self.dictionary.lookup("中國"), ("Zhōngguó", ["China"]))
+        self.assertIsNone(self.dictionary.lookup("人"))
+
+    def test_segment(self):
+        """Тестирование разбиения текста на наименьшее число слов словаря"""
+        self.assertEqual(self.dictionary.segment("中国传统，那不"), ["中国", "传统", "那", "不"])
+        self.assertIsNone(self.dictionary.segment("中国人"))
+
+    def test_translate(self):
+        """Тестирование формата результата, совпадающего с parser_bkrs"""
+        self.assertEqual(self.dictionary.translate("哪儿"), [["哪儿"], ["nǎr"], ["where?", "wherever"]])
+        self.assertEqual(self.dictionary.translate("那不"),
+                         [[["那"], ["nà"], ["that", "those"]], [["不"], ["bù"], ["not", "no"]]])
+
+    def test_parser_fallback(self):
+        """Тестирование перехода к словарю bkrs при промахе локального словаря"""
+        with mock.patch("translate.views.get_local_dictionary", return_value=self.dictionary), \
+                mock.patch.object(Parser, "parser_bkrs", return_value="bkrs") as parser_bkrs:
+            self.assertEqual(Parser("哪儿", False, False, True).result["local"],
+                             [["哪儿"], ["nǎr"], ["where?", "wherever"]])
+            self.assertEqual(Parser("中国人", False, False, True).result["local"], "bkrs")
+        parser_bkrs.assert_called_once_with()
+
+
+class CheckLanguageChineseTest(SimpleTestCase):
+
+    @staticmethod
+    def reference(char):
+        """Посимвольная проверка в исходном виде"""
+        return (u'\u2E80' <= char <= u'\u2FD5' or u'\u3190' <= char <= u'\u319f'
+                or u'\u3400' <= char <= u'\u4DBF' or u'\u4E00' <= char <= u'\u9FCC'
+                or u'\uF900' <= char <= u'\uFAAD' or char in PUNCTUATION_MARKS)
+
+    def test_all_codepoints(self):
+        """Тестирование совпадения таблицы символов с посимвольной проверкой на всех символах"""
+        for codepoint in range(0x110000):
+            if 0xD800 <= codepoint <= 0xDFFF:
+                continue
+            char = chr(codepoint)
+            self.assertEqual(check_language_chinese(char), self.reference(char), hex(codepoint))
+
+    def test_bulk(self):
+        """Тестирование проверки нескольких строк с позициями некорректных символов"""
+        self.assertEqual(find_not_chinese(["那不", "那a不b", "", "哪儿? 1"]), [[], [1, 3], [], []])
+
+
+class ExtractTest(SimpleTestCase):
+    pages = {
+        "bkrs": ["bkrs_word", "bkrs_phrase"],
+        "zhonga": ["zhonga_word", "zhonga_phrase"],
+    }
+
+    def assertSameAsSoup(self, source, content):
+        expected = getattr(benchmarks, source + "_soup")("那不", content)
+        self.assertEqual(getattr(extract, source)("那不", content), expected)
+
+    def test_synthetic_pages(self):
+        """Тестирование совпадения разбора lxml и BeautifulSoup на синтетических страницах"""
+        for source, pages in self.pages.items():
+            for page in pages:
+                with self.subTest(page=page):
+                    self.assertSameAsSoup(source, load_page(page))
+
+    def test_streaming_synthetic_pages(self):
+        """Тестирование совпадения потокового разбора с разбором всей синтетической страницы
+        и остановки после результата"""
+        extractors = {"bkrs": extract.BkrsExtractor, "zhonga": extract.ZhongaExtractor}
+        for source, pages in self.pages.items():
+            for page in pages:
+                with self.subTest(page=page):
+                    content = load_page(page)
+                    extractor = extractors[source]("那不")
+                    position = next(
+                        (start for start in range(0, len(content), 64) if extractor.feed(content[start:start + 64])),
+                        None
+                    )
+                    self.assertEqual(extractor.close(), getattr(extract, source)("那不", content))
+                    self.assertLess(position, len(content) // 2 + 1024)
+
+    def test_markup_variants(self):
+        """Тестирование совпадения разбора на разметке с пробелами, скриптами и вложенными тегами"""
+        self.assertSameAsSoup("bkrs", (
+            '<html><body><table class="x tbl_bywords"><tr><td><a>那\n\n</a><center> nà </center></td>'
+            '<td><a>不</a>\n\n<center>bù</center></td></tr><tr><td>тот\n<script>var a;</script>\n\n</td>'
+            '<td><div> не </div>\n\n\n<div>нет<br>\n<br>да</div></td></tr></table></body></html>'
+        ).encode("utf-8"))
+        self.assertSameAsSoup("zhonga", (
+            '<html><body><div class="segmented-unit"><div class="segmented-unit-value"><a> 那 </a></div>'
+            '<span class="pinyin">nà</span><div class="segmented-unit-user-definitions"> тот </div></div>'
+            '<div class="segmented-unit first"><div class="segmented-unit-value"><a>不</a></div>'
+            '<span class="pinyin">bù</span><div class="segmented-unit-dic-definitions">не\n\n<p>нет</p>\n\n'
+            '<p>да</p></div></div></body></html>'
+        ).encode("utf-8"))
+
+
+class BatchTranslateViewTest(StubUpstreamTestCase):
+
+    def translate(self, texts, bkrs="True", zhonga="True"):
+        self.client.cookies["Token"] = self.token
+        return self.client.post('/translate/batch/?bkrs=' + bkrs + '&zhonga=' + zhonga, {'texts': texts},
+                                format="json")
+
+    def test_batch_translate(self):
+        """Тестирование пакетного перевода: порядок результатов, ошибки по текстам и дедупликация"""
+        requests = self.stub.requests
+        resp = self.translate(["哪儿", "hello", "那不", "哪儿", ""])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([item["text"] for item in resp.json()], ["哪儿", "hello", "那不", "哪儿", ""])
+        self.assertEqual(resp.json()[0]["result"]["bkrs"], [['哪儿'], ['nǎr'], ['разг. где?, куда? (вм. 哪里 кроме 5)']])
+        self.assertEqual(resp.json()[0], resp.json()[3])
+        self.assertEqual(resp.json()[1]["error"], "Введите текст на китайском языке")
+        self.assertEqual(resp.json()[4]["error"], "Поле текста не заполнено")
+        self.assertEqual(self.stub.requests - requests, 4)
+
+    def test_batch_item_failure(self):
+        """Тестирование ошибки словаря для одного текста пакета"""
+        fetch_bkrs = Parser.fetch_bkrs
+
+        def fetch(text, on_row=None, deadline=None):
+            if text == "那不":
+                raise ConnectionError()
+            return fetch_bkrs(text, on_row, deadline)
+
+        with mock.patch.object(Parser, "fetch_bkrs", staticmethod(fetch)):
+            resp = self.translate(["那不", "哪儿"], zhonga="False")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()[0], {"text": "那不", "error": "Не удалось получить перевод"})
+        self.assertIn("result", resp.json()[1])
+
+    @override_settings(TRANSLATE_BATCH_MAX_ITEMS=2)
+    def test_batch_incorrect(self):
+        """Тестирование пакетного перевода с некорректным списком текстов"""
+        self.assertEqual(self.translate("哪儿").status_code, 400)
+        self.assertEqual(self.translate([]).status_code, 400)
+        self.assertEqual(self.translate(["那", "不", "哪儿"]).status_code, 400)
+
+    @override_settings(TRANSLATE_BATCH_CONCURRENCY=2)
+    def test_batch_concurrency_limit(self):
+        """Тестирование ограничения количества одновременных запросов к словарям"""
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def parse(self):
+            with lock:
+                running.append(self.text)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(self.text)
+            return self.text
+
+        with mock.patch.object(Parser, "parser_bkrs", parse), mock.patch.object(Parser, "parser_zhonga", parse):
+            resp = self.translate(["那", "不", "哪儿", "你"])
+        self.assertEqual(resp.json()[2]["result"], {"bkrs": "哪儿", "zhonga": "哪儿"})
+        self.assertEqual(max(peak), 2)
+
+    @override_settings(TRANSLATE_DEADLINE=8)
+    def test_batch_shared_deadline(self):
+        """Тестирование одного срока на весь пакет: тексты, запущенные позже, не получают новый срок"""
+        deadlines = []
+
+        def parse(self):
+            deadlines.append(self.deadline)
+            return self.text
+
+        with mock.patch.object(Parser, "parser_bkrs", parse), mock.patch.object(Parser, "parser_zhonga", parse):
+            self.translate(["那", "不", "哪儿", "你"])
+        self.assertEqual(len(deadlines), 8)
+        self.assertEqual(len({id(deadline) for deadline in deadlines}), 1)
+
+
+class StreamTranslateViewTest(StubUpstreamTestCase):
+
+    def translate(self, text, bkrs="True", zhonga="True"):
+        self.client.cookies["Token"] = self.token
+        return self.client.post('/translate/stream/?bkrs=' + bkrs + '&zhonga=' + zhonga, {'text': text},
+                                format="json")
+
+    def events(self, resp):
+        return [json.loads(line) for line in b"".join(resp.streaming_content).splitlines()]
+
+    def test_stream_translate(self):
+        """Тестирование потокового перевода: строки результата и итоговые события словарей"""
+        resp = self.translate("那不")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp["Content-Type"], "application/x-ndjson; charset=utf-8")
+        events = self.events(resp)
+        for source in ("bkrs", "zhonga"):
+            result = next(event["result"] for event in events if event.get("source") == source and "result" in event)
+            rows = [event["row"] for event in events if event.get("source") == source and "row" in event]
+            self.assertEqual(rows, result)
+            self.assertEqual(result, getattr(extract, source)("那不", self.stub.page(source, "那不")))
+
+    def test_slow_source_does_not_delay(self):
+        """Тестирование отправки результата быстрого словаря до ответа медленного"""
+        fetch_zhonga = Parser.fetch_zhonga
+
+        def slow(text, on_row=None, deadline=None):
+            time.sleep(0.3)
+            return fetch_zhonga(text, on_row, deadline)
+
+        with mock.patch.object(Parser, "fetch_zhonga", staticmethod(slow)):
+            events = self.events(self.translate("哪儿"))
+        self.assertEqual([event["source"] for event in events], ["bkrs", "zhonga"])
+        self.assertEqual(events[0]["result"], [['哪儿'], ['nǎr'], ['разг. где?, куда? (вм. 哪里 кроме 5)']])
+
+    @override_settings(TRANSLATE_CACHE_ENABLED=True, TRANSLATE_CACHE_TTL={"bkrs": 0}, TRANSLATE_CACHE_STALE_TTL=60)
+    def test_stale_refresh_sends_no_rows(self):
+        """Тестирование фонового обновления устаревшей записи: строки не отправляются в завершенный запрос"""
+        translation_cache.clear()
+        first, second = [], []
+        Parser("那不", True, False, on_row=first.append)
+        self.assertTrue(first)
+        Parser("那不", True, False, on_row=second.append)
+        for _ in range(100):
+            if translation_cache.stats()["refreshes"]:
+                break
+            time.sleep(0.02)
+        self.assertEqual(translation_cache.stats()["refreshes"], 1)
+        self.assertEqual(second, [])
+        translation_cache.clear()
+
+    def test_stream_incorrect_text(self):
+        """Тестирование потокового перевода с некорректным текстом"""
+        self.assertEqual(self.translate("hello").status_code, 400)
+
+
+class SingleFlightTest(SimpleTestCase):
+
+    def setUp(self):
+        resilience.reset()
+        self.flight = SingleFlight()
+        self.calls = 0
+
+    def slow(self):
+        self.calls += 1
+        time.sleep(0.1)
+        return ["result"]
+
+    def run_threads(self, target, count=5):
+        threads = [threading.Thread(target=target) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_concurrent_calls_coalesced(self):
+        """Тестирование одного вызова для одновременных запросов с одинаковым ключом"""
+        results = []
+        self.run_threads(lambda: results.append(self.flight.do("key", self.slow)))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [["result"]] * 5)
+        self.assertEqual(self.flight.coalesced, 4)
+
+    def test_error_shared(self):
+        """Тестирование передачи исключения всем ожидающим"""
+        errors = []
+
+        def fail():
+            time.sleep(0.1)
+            raise ConnectionError()
+
+        def call():
+            try:
+                self.flight.do("key", fail)
+            except ConnectionError as ex:
+                errors.append(ex)
+
+        self.run_threads(call, 3)
+        self.assertEqual(len(errors), 3)
+        self.assertEqual(self.flight.do("key", lambda: "next"), "next")
+
+    def test_async_calls_coalesced(self):
+        """Тестирование объединения одновременных вызовов в цикле событий"""
+        async def fetch():
+            self.calls += 1
+            await asyncio.sleep(0.05)
+            return "result"
+
+        async def run():
+            return await asyncio.gather(*[self.flight.ado("key", fetch) for _ in range(5)])
+
+        self.assertEqual(asyncio.run(run()), ["result"] * 5)
+        self.assertEqual(self.calls, 1)
+
+    def test_parser_requests_coalesced(self):
+        """Тестирование одного запроса к словарю для одновременных переводов одного текста"""
+        results = []
+        with StubUpstream(latency=0.2) as stub, \
+                override_settings(TRANSLATE_UPSTREAM_URLS=stub.urls, TRANSLATE_CACHE_ENABLED=False):
+            self.run_threads(lambda: results.append(Parser("哪儿", True, False).result))
+        self.assertEqual(stub.requests, 1)
+        self.assertEqual(len(results), 5)
+
+    @override_settings(TRANSLATE_CACHE_SHARED_LOCK=True, TRANSLATE_CACHE_LOCK_POLL=0.01)
+    def test_shared_lock(self):
+        """Тестирование ожидания записи в общем кэше другим процессом"""
+        workers = [TranslationCache(), TranslationCache()]
+        workers[0].clear()
+        self.addCleanup(workers[0].clear)
+        results = []
+        threads = [
+            threading.Thread(target=lambda cache=cache: results.append(cache.get_or_fetch("bkrs", "哪儿", self.slow)))
+            for cache in workers
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [["result"], ["result"]])
+        self.assertEqual(workers[0].stats()["lock_waits"] + workers[1].stats()["lock_waits"], 1)
+
+    def test_waits_bounded_by_deadline(self):
+        """Тестирование ожидания чужой загрузки не дольше срока запроса"""
+        started = threading.Event()
+        release = threading.Event()
+
+        def hold():
+            started.set()
+            release.wait(5)
+            return "result"
+
+        leader = threading.Thread(target=self.flight.do, args=("key", hold))
+        leader.start()
+        self.addCleanup(leader.join)
+        self.addCleanup(release.set)
+        started.wait(5)
+        start = time.monotonic()
+        with self.assertRaises(resilience.DeadlineExceeded):
+            self.flight.do("key", hold, 0.1)
+        self.assertLess(time.monotonic() - start, 1)
+
+    @override_settings(TRANSLATE_CACHE_SHARED_LOCK=True, TRANSLATE_CACHE_LOCK_POLL=0.01, TRANSLATE_CACHE_LOCK_TIMEOUT=15)
+    def test_shared_lock_bounded_by_deadline(self):
+        """Тестирование ожидания блокировки общего кэша не дольше срока запроса"""
+        cache = TranslationCache()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        cache.l2.add(cache.key("bkrs", "哪儿") + ":lock", 1, 15)
+        start = time.monotonic()
+        with self.assertRaises(resilience.DeadlineExceeded):
+            cache.get_or_fetch("bkrs", "哪儿", self.slow, deadline=resilience.Deadline(0.1))
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(self.calls, 0)
+
+
+class ResilienceTest(SimpleTestCase):
+
+    def setUp(self):
+        resilience.reset()
+        self.addCleanup(resilience.reset)
+
+    @override_settings(TRANSLATE_CIRCUIT_FAILURES=2, TRANSLATE_CIRCUIT_RESET=0.1)
+    def test_circuit_breaker(self):
+        """Тестирование отключения словаря после серии ошибок и пробного запроса после паузы"""
+        guard = resilience.get_guard("bkrs")
+        fail = mock.Mock(side_effect=ConnectionError())
+        for _ in range(2):
+            with self.assertRaises(ConnectionError):
+                guard.call(fail)
+        with self.assertRaises(resilience.CircuitOpen):
+            guard.call(fail)
+        self.assertEqual(fail.call_count, 2)
+        time.sleep(0.1)
+        self.assertEqual(guard.call(lambda _: "result"), "result")
+        self.assertEqual(guard.breaker.state, resilience.CircuitBreaker.CLOSED)
+
+    @override_settings(TRANSLATE_CIRCUIT_FAILURES=1, TRANSLATE_CIRCUIT_RESET=0)
+    def test_probe_released(self):
+        """Тестирование пробного запроса, отклоненного ограничителем или отмененного:
+        выключатель не остается в half_open и следующий запрос снова пробный"""
+        guard = resilience.get_guard("bkrs")
+        with self.assertRaises(ConnectionError):
+            guard.call(mock.Mock(side_effect=ConnectionError()))
+        with mock.patch.object(guard.limiter, "acquire", side_effect=resilience.RateLimited()):
+            with self.assertRaises(resilience.RateLimited):
+                guard.call(lambda _: "result")
+        self.assertEqual(guard.breaker.state, resilience.CircuitBreaker.OPEN)
+
+        async def cancelled():
+            async def hang():
+                await asyncio.sleep(10)
+            task = asyncio.ensure_future(guard.acall(hang))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancelled())
+        self.assertEqual(guard.breaker.state, resilience.CircuitBreaker.OPEN)
+        self.assertEqual(guard.limiter.in_flight, 0)
+        self.assertEqual(guard.call(lambda _: "result"), "result")
+        self.assertEqual(guard.breaker.state, resilience.CircuitBreaker.CLOSED)
+
+    @override_settings(TRANSLATE_CIRCUIT_FAILURES=2)
+    def test_extract_errors_not_source_failures(self):
+        """Тестирование ошибок разбора страницы: словарь ответил, поэтому не отключается и лимит не снижается"""
+        guard = resilience.get_guard("bkrs")
+        limit = guard.limiter.limit
+        for _ in range(3):
+            with self.assertRaises(IndexError):
+                guard.call(mock.Mock(side_effect=IndexError()))
+        self.assertEqual(guard.breaker.state, resilience.CircuitBreaker.CLOSED)
+        self.assertGreaterEqual(guard.limiter.limit, limit)
+        for _ in range(2):
+            with self.assertRaises(upstream.UpstreamServerError):
+                guard.call(mock.Mock(side_effect=upstream.UpstreamServerError()))
+        self.assertEqual(guard.breaker.state, resilience.CircuitBreaker.OPEN)
+        self.assertLess(guard.limiter.limit, limit)
+
+    def test_server_error_status(self):
+        """Тестирование ошибки сервера словаря: страница с кодом 5xx не разбирается"""
+        upstream.check_status(404)
+        with self.assertRaises(upstream.UpstreamServerError):
+            upstream.check_status(503)
+
+    @override_settings(TRANSLATE_DEADLINE=0.2)
+    def test_deadline_partial_result(self):
+        """Тестирование частичного результата, если словарь не ответил вовремя"""
+        def slow(self):
+            time.sleep(0.5)
+            return ["zhonga"]
+
+        with mock.patch.object(Parser, "parser_bkrs", lambda self: ["bkrs"]), \
+                mock.patch.object(Parser, "parser_zhonga", slow):
+            start = time.monotonic()
+            parser = Parser("那不", True, True)
+            elapsed = time.monotonic() - start
+        self.assertEqual(parser.result, {"bkrs": ["bkrs"], "zhonga": resilience.DeadlineExceeded.message})
+        self.assertEqual((parser.errors, parser.status), ({"zhonga"}, 200))
+        self.assertLess(elapsed, 0.4)
+
+    def test_all_sources_failed(self):
+        """Тестирование статуса 503, если недоступны все словари"""
+        with mock.patch.object(Parser, "fetch_bkrs", staticmethod(mock.Mock(side_effect=ConnectionError()))):
+            parser = Parser("那不", True, False)
+        self.assertEqual(parser.result, {"bkrs": "Не удалось получить перевод"})
+        self.assertEqual(parser.status, 503)
+
+    def test_stream_deadline(self):
+        """Тестирование прерывания потоковой загрузки по истечении срока запроса"""
+        with StubUpstream(chunk_size=1024, chunk_delay=0.05) as stub, \
+                override_settings(TRANSLATE_UPSTREAM_URLS=stub.urls):
+            with self.assertRaises(resilience.DeadlineExceeded):
+                Parser.load_bkrs("那不", deadline=resilience.Deadline(0.2))
+
+    @override_settings(TRANSLATE_HEDGE=True, TRANSLATE_HEDGE_MIN_SAMPLES=1)
+    def test_hedged_request(self):
+        """Тестирование повторного запроса, если первый отвечает дольше обычного"""
+        guard = resilience.get_guard("bkrs")
+        guard.latency.add(0.05)
+        start = time.monotonic()
+        result = guard.call(lambda _: time.sleep(0.5) or "slow", lambda _: "hedge")
+        self.assertEqual(result, "hedge")
+        self.assertEqual(guard.hedges, 1)
+        self.assertLess(time.monotonic() - start, 0.3)
+
+    @override_settings(TRANSLATE_HEDGE=True, TRANSLATE_HEDGE_MIN_SAMPLES=1)
+    def test_hedge_loser_abandoned(self):
+        """Тестирование прерывания проигравшего запроса: место в ограничителе освобождается сразу,
+        загрузка прерывается на следующей проверке срока, лимит не снижается"""
+        guard = resilience.get_guard("bkrs")
+        guard.latency.add(0.05)
+        limit = guard.limiter.limit
+        aborted = threading.Event()
+
+        def slow(deadline):
+            try:
+                for _ in range(100):
+                    deadline.check()
+                    time.sleep(0.01)
+            except resilience.DeadlineExceeded:
+                aborted.set()
+                raise
+            return "slow"
+
+        self.assertEqual(guard.call(slow, lambda _: "hedge"), "hedge")
+        self.assertEqual(guard.limiter.in_flight, 0)
+        self.assertTrue(aborted.wait(0.5))
+        self.assertEqual(guard.limiter.in_flight, 0)
+        self.assertGreaterEqual(guard.limiter.limit, limit)
+
+    @override_settings(TRANSLATE_HEDGE=True, TRANSLATE_HEDGE_MIN_SAMPLES=1)
+    def test_async_hedged_request(self):
+        """Тестирование повторного запроса в цикле событий"""
+        guard = resilience.get_guard("zhonga")
+        guard.latency.add(0.05)
+        delays = [0.5, 0.0]
+
+        async def fetch():
+            delay = delays.pop(0)
+            await asyncio.sleep(delay)
+            return delay
+
+        self.assertEqual(asyncio.run(guard.acall(fetch)), 0.0)
+        self.assertEqual(guard.hedges, 1)
+
+
+class SourceLimiterTest(SimpleTestCase):
+
+    def setUp(self):
+        resilience.reset()
+        self.addCleanup(resilience.reset)
+
+    @override_settings(TRANSLATE_RATE_LIMIT={"bkrs": 20}, TRANSLATE_RATE_BURST={"bkrs": 2})
+    def test_token_bucket(self):
+        """Тестирование ожидания токена после исчерпания пика запросов"""
+        limiter = resilience.SourceLimiter("bkrs")
+        start = time.monotonic()
+        for _ in range(3):
+            limiter.acquire()
+            limiter.release(True)
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+    @override_settings(TRANSLATE_CONCURRENCY_INITIAL=1, TRANSLATE_LIMIT_QUEUE_SIZE=0)
+    def test_queue_full(self):
+        """Тестирование отказа, если очередь ограничителя заполнена"""
+        limiter = resilience.SourceLimiter("bkrs")
+        limiter.acquire()
+        with self.assertRaises(resilience.RateLimited):
+            limiter.acquire()
+        self.assertEqual(limiter.stats()["rejected"], 1)
+
+    @override_settings(TRANSLATE_CONCURRENCY_INITIAL=1, TRANSLATE_LIMIT_QUEUE_TIMEOUT=0.05)
+    def test_queue_timeout(self):
+        """Тестирование отказа после ожидания в очереди и того, что отказ не отключает словарь"""
+        guard = resilience.get_guard("bkrs")
+        guard.limiter.acquire()
+        with self.assertRaises(resilience.RateLimited):
+            guard.call(lambda _: "result")
+        with self.assertRaises(resilience.RateLimited):
+            asyncio.run(guard.acall(asyncio.sleep))
+        self.assertEqual(guard.breaker.failures, 0)
+        guard.limiter.release(True)
+        self.assertEqual(guard.call(lambda _: "result"), "result")
+
+    @override_settings(TRANSLATE_CONCURRENCY_INITIAL=8, TRANSLATE_CONCURRENCY_MIN=2, TRANSLATE_CONCURRENCY_MAX=9)
+    def test_adaptive_limit(self):
+        """Тестирование уменьшения лимита вдвое после ошибки и роста после успешных ответов"""
+        limiter = resilience.SourceLimiter("bkrs")
+        for limit in (4, 2, 2):
+            limiter.acquire()
+            limiter.release(False)
+            self.assertEqual(limiter.limit, limit)
+        for _ in range(20):
+            limiter.acquire()
+            limiter.release(True)
+        self.assertGreater(limiter.limit, 4)
+        self.assertLessEqual(limiter.limit, 9)
+
+    @override_settings(TRANSLATE_CACHE_TTL={"bkrs": 0}, TRANSLATE_CACHE_STALE_TTL=0, TRANSLATE_CACHE_FALLBACK_TTL=60)
+    def test_cache_fallback(self):
+        """Тестирование ответа из просроченной записи кэша, если словарь перегружен"""
+        cache = TranslationCache()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.assertEqual(cache.get_or_fetch("bkrs", "哪儿", lambda: ["result"]), ["result"])
+        fail = mock.Mock(side_effect=resilience.RateLimited())
+        self.assertEqual(cache.get_or_fetch("bkrs", "哪儿", fail), ["result"])
+        afail = mock.AsyncMock(side_effect=resilience.RateLimited())
+        self.assertEqual(asyncio.run(cache.aget_or_fetch("bkrs", "哪儿", afail, fail)), ["result"])
+        self.assertEqual(cache.stats()["fallbacks"], 2)
+        with self.assertRaises(resilience.RateLimited):
+            cache.get_or_fetch("bkrs", "那不", fail)
+
+
+class MetricsTest(StubUpstreamTestCase):
+
+    def test_registry(self):
+        """Тестирование сложения метрик потоков и текстового формата Prometheus"""
+        registry = Registry()
+        latency = registry.histogram("test_seconds", "Время", (0.1, 1.0))
+        errors = registry.counter("test_errors_total", "Ошибки")
+
+        def work():
+            registry.observe(latency, 0.05, source="bkrs")
+            registry.observe(latency, 0.5, source="bkrs")
+            registry.inc(errors, source='b"k')
+
+        threads = [threading.Thread(target=work) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        lines = registry.render().splitlines()
+        self.assertIn("# TYPE test_seconds histogram", lines)
+        self.assertIn('test_seconds_bucket{source="bkrs",le="0.1"} 3', lines)
+        self.assertIn('test_seconds_bucket{source="bkrs",le="1.0"} 6', lines)
+        self.assertIn('test_seconds_bucket{source="bkrs",le="+Inf"} 6', lines)
+        self.assertIn('test_seconds_count{source="bkrs"} 6', lines)
+        self.assertIn('test_errors_total{source="b\\"k"} 3', lines)
+
+    def test_translate_metrics(self):
+        """Тестирование метрик этапов, загрузки страниц и кэша после запроса на перевод"""
+        metrics.clear()
+        self.client.cookies["Token"] = self.token
+        resp = self.client.post('/translate/?bkrs=True&zhonga=False', {'text': '哪儿'}, format="json")
+        self.assertEqual(resp.status_code, 200)
+
+        resp = self.client.get('/metrics/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp["Content-Type"].startswith("text/plain; version=0.0.4"))
+        text = resp.content.decode()
+        for phase in ("auth", "validation", "translate", "render"):
+            self.assertIn('translate_phase_duration_seconds_count{phase="%s",route="translate/"} 1' % phase, text)
+        self.assertIn('translate_http_request_duration_seconds_count{method="POST",route="translate/",status="200"} 1',
+                      text)
+        self.assertIn('translate_upstream_duration_seconds_count{source="bkrs"} 1', text)
+        self.assertIn('translate_upstream_response_bytes_count{source="bkrs"} 1', text)
+        self.assertIn("translate_cache_hit_ratio", text)
+        self.assertIn('translate_source_breaker_open{source="bkrs"} 0', text)
+
+    def test_metrics_internal_only(self):
+        """Тестирование запрета метрик для внешних адресов"""
+        self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR="10.0.0.1").status_code, 403)
+
+
+class ProfilingTest(StubUpstreamTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        """Настройка контекста для теста"""
+        cls.user = MyUser.objects.create_user("user@mail.ru", "User", "Password1")
+        cls.admin = MyUser.objects.create_user("admin@mail.ru", "Admin", "Password1", is_staff=True)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        profile_settings = override_settings(TRANSLATE_PROFILE_DIR=directory.name)
+        profile_settings.enable()
+        self.addCleanup(profile_settings.disable)
+
+    def translate(self, user, **extra):
+        self.client.cookies["Token"] = user.token
+        return self.client.post('/translate/?bkrs=True&zhonga=False', {'text': '哪儿'}, format="json", **extra)
+
+    def test_admin_header(self):
+        """Тестирование профиля по заголовку администратора, списка профилей и загрузки файла"""
+        resp = self.translate(self.admin, HTTP_X_PROFILE="cprofile")
+        self.assertEqual(resp.status_code, 200)
+        name = resp["X-Profile-Name"]
+
+        entries = self.client.get('/translate/profiles/').json()
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]["name"], name)
+        self.assertEqual(entries[0]["kind"], "cprofile")
+        self.assertEqual(entries[0]["endpoint"], "translate")
+        self.assertEqual(entries[0]["source"], "bkrs")
+        self.assertEqual(entries[0]["text_length"], 2)
+
+        resp = self.client.get('/translate/profiles/%s/' % name)
+        self.assertEqual(resp.status_code, 200)
+        with tempfile.NamedTemporaryFile(suffix=".prof") as file:
+            file.write(b"".join(resp.streaming_content))
+            file.flush()
+            stats = pstats.Stats(file.name)
+        self.assertTrue(any(function[2] == "post" for function in stats.stats))
+
+    def test_header_requires_admin(self):
+        """Тестирование игнорирования заголовка обычного пользователя"""
+        resp = self.translate(self.user, HTTP_X_PROFILE="cprofile")
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn("X-Profile-Name", resp)
+        self.client.cookies["Token"] = self.user.token
+        self.assertEqual(self.client.get('/translate/profiles/').status_code, 403)
+
+    async def test_admin_header_async(self):
+        """Тестирование профиля по заголовку администратора под ASGI: токен проверяется вне цикла событий"""
+        # Пользователь из кэша аутентификации не потребовал бы запроса к базе
+        token_cache.clear()
+        user_cache.clear()
+        client = AsyncClient()
+        client.cookies["Token"] = self.admin.token
+        # AsyncClient Django 3.1 передает дополнительные аргументы как заголовки с тем же именем
+        resp = await client.get('/get-name/', **{"X-Profile": "cprofile"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("X-Profile-Name", resp)
+
+    async def test_overlapping_async_profiles(self):
+        """Тестирование одновременных профилей под ASGI: второй запрос в том же цикле событий не профилируется"""
+        client = AsyncClient()
+        client.cookies["Token"] = self.admin.token
+        first = profiling.Profile(profiling.CPROFILE).start()
+        try:
+            resp = await client.get('/get-name/', **{"X-Profile": "cprofile"})
+        finally:
+            first.stop()
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn("X-Profile-Name", resp)
+        self.assertIsNotNone(first.files()[".prof"])
+        resp = await client.get('/get-name/', **{"X-Profile": "cprofile"})
+        self.assertIn("X-Profile-Name", resp)
+
+    @override_settings(TRANSLATE_PROFILE_RATE=1.0, TRANSLATE_PROFILE_MODE="sample", TRANSLATE_PROFILE_KEEP=4,
+                       TRANSLATE_PROFILE_INTERVAL=0.001)
+    def test_sampled_rotation(self):
+        """Тестирование выборочного профиля с отчетом о памяти и удаления старых профилей"""
+        for _ in range(3):
+            resp = self.translate(self.user)
+            self.assertEqual(resp.status_code, 200)
+        self.assertFalse(tracemalloc.is_tracing())
+        entries = ProfileStore().entries()
+        self.assertEqual(len(entries), 4)
+        self.assertEqual(sorted(entry["kind"] for entry in entries), ["memory", "memory", "sample", "sample"])
+        self.assertEqual(set(resp["X-Profile-Name"].split(", ")), {entry["name"] for entry in entries[:2]})
+
+
+class BenchmarkCompareTest(SimpleTestCase):
+
+    def test_compare(self):
+        """Тестирование поиска регрессий: время растет, пропускная способность падает, максимум не учитывается"""
+        baseline = {"auth": {"claims": {"median_us": 50.0}}, "e2e": {"p99_ms": 100, "throughput_rps": 60,
+                                                                    "max_ms": 100, "requests": 200}}
+        report = {"auth": {"claims": {"median_us": 55.0}}, "e2e": {"p99_ms": 150, "throughput_rps": 40,
+                                                                  "max_ms": 900, "requests": 100}}
+        regressions = benchmarks.compare(report, baseline, 0.2)
+        self.assertEqual([item["metric"] for item in regressions], ["e2e.p99_ms", "e2e.throughput_rps"])
+        self.assertEqual(regressions[0]["change"], 0.5)
+        self.assertEqual(benchmarks.compare(report, baseline, 0.6), [])
+
+    def test_prepare_database_refuses_production_database(self):
+        """Тестирование отказа бенчмарков работать не на sqlite"""
+        databases = {"default": {"ENGINE": "django.db.backends.postgresql_psycopg2", "NAME": "china_translator"}}
+        with override_settings(DATABASES=databases), mock.patch.object(benchmarks, "call_command") as migrate:
+            with self.assertRaises(CommandError):
+                benchmarks.prepare_database()
+        migrate.assert_not_called()
@@ -0,0 +1,228 @@
+import time
+import asyncio
+import weakref
+import threading
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# br запрашивается только если его умеем распаковывать
+ACCEPT_ENCODING = "gzip, deflate, br" if brotli else "gzip, deflate"
+# Размер куска тела ответа, передаваемого в разбор при потоковой загрузке. requests ждет
+# куска целиком, поэтому чем он меньше, тем раньше разбор видит конец области результата
+CHUNK_SIZE = 4 * 1024
+
+_session = None
+_session_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+class ResponseTooLarge(Exception):
+    """Ответ словаря больше TRANSLATE_UPSTREAM_MAX_RESPONSE_SIZE"""
+
+
+class UpstreamServerError(Exception):
+    """Словарь ответил ошибкой сервера (5xx)"""
+
+
+def get_timeout():
+    """Возвращает таймауты соединения и чтения для запросов к словарям"""
+    return (
+        getattr(settings, "TRANSLATE_UPSTREAM_CONNECT_TIMEOUT", 3.05),
+        getattr(settings, "TRANSLATE_UPSTREAM_READ_TIMEOUT", 10),
+    )
+
+
+def get_pool_size():
+    """Возвращает максимальное число соединений с одним хостом"""
+    return getattr(settings, "TRANSLATE_UPSTREAM_POOL_SIZE", 10)
+
+
+def streaming():
+    """Загружать ли страницы словарей потоково, разбирая их по мере получения"""
+    return getattr(settings, "TRANSLATE_UPSTREAM_STREAMING", True)
+
+
+def get_max_response_size():
+    """Возвращает максимальный размер ответа словаря в байтах"""
+    return getattr(settings, "TRANSLATE_UPSTREAM_MAX_RESPONSE_SIZE", 2 * 1024 * 1024)
+
+
+def get_drain_size():
+    """Возвращает максимальный размер недочитанного остатка ответа, который дочитывается,
+    чтобы вернуть соединение в пул. Ответ с большим или неизвестным остатком закрывается"""
+    return getattr(settings, "TRANSLATE_UPSTREAM_DRAIN_SIZE", 64 * 1024)
+
+
+def get_charset(headers):
+    """Кодировка из заголовка Content-Type или None, если она не указана"""
+    _, *params = headers.get("Content-Type", "").split(";")
+    for param in params:
+        name, _, value = param.strip().partition("=")
+        if name.lower() == "charset" and value.strip("\"' "):
+            return value.strip("\"' ")
+    return None
+
+
+def check_status(status_code: int):
+    """Выбрасывает UpstreamServerError, если словарь ответил ошибкой сервера
+    Страница ошибки не содержит результата, и ее разбор не должен выдавать себя за ответ словаря"""
+    if status_code >= 500:
+        raise UpstreamServerError("Словарь ответил с кодом %s" % status_code)
+
+
+def check_size(size: int):
+    if size > get_max_response_size():
+        raise ResponseTooLarge("Размер ответа словаря превышает %s байт" % get_max_response_size())
+
+
+def get_remaining(headers, received: int):
+    """Сколько байт ответа еще не прочитано или None, если длина ответа неизвестна"""
+    length = headers.get("Content-Length")
+    if length is None or not length.isdigit():
+        return None
+    return int(length) - received
+
+
+def get_session():
+    """Возвращает общий для процесса requests.Session
+    У каждого хоста свой пул keep-alive соединений, поэтому повторные запросы
+    не тратят время на DNS, TCP и TLS"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=10, pool_maxsize=get_pool_size())
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+                _session = session
+    return _session
+
+
+def get_deadline_timeout(deadline=None):
+    """Таймауты запроса, не превышающие оставшееся до срока deadline время"""
+    return deadline.timeout(*get_timeout()) if deadline is not None else get_timeout()
+
+
+def get(url: str, deadline=None, **kwargs):
+    """Выполняет GET-запрос через общий пул соединений с таймаутами по умолчанию"""
+    kwargs.setdefault("timeout", get_deadline_timeout(deadline))
+    response = get_session().get(url, **kwargs)
+    check_status(response.status_code)
+    return response
+
+
+def stream(url: str, extractor_factory, deadline=None, stats: dict = None, **kwargs):
+    """Загружает страницу по частям и передает их в инкрементальный разбор
+    extractor_factory(encoding) создает StreamingExtractor. Как только разбор получил результат,
+    загрузка прекращается: небольшой остаток ответа дочитывается, чтобы соединение вернулось
+    в пул, иначе соединение закрывается. Если ответ больше допустимого, выбрасывает ResponseTooLarge,
+    если словарь ответил ошибкой сервера - UpstreamServerError
+    Загрузка прерывается, если истек срок запроса deadline
+    В словарь stats, если он передан, записываются прочитанный размер ответа bytes
+    и время разбора extract_seconds"""
+    kwargs.setdefault("timeout", get_deadline_timeout(deadline))
+    response = get_session().get(url, stream=True, **kwargs)
+    received = 0
+    extract_seconds = 0.0
+    try:
+        check_status(response.status_code)
+        check_size(int(response.headers.get("Content-Length", 0) or 0))
+        extractor = extractor_factory(get_charset(response.headers))
+        for chunk in response.iter_content(CHUNK_SIZE):
+            received += len(chunk)
+            check_size(received)
+            if deadline is not None:
+                deadline.check()
+            start = time.perf_counter()
+            done = extractor.feed(chunk)
+            extract_seconds += time.perf_counter() - start
+            if done:
+                break
+        remaining = get_remaining(response.headers, response.raw.tell())
+    except Exception:
+        response.close()
+        raise
+    finally:
+        if stats is not None:
+            stats["bytes"] = received
+    if remaining is not None and remaining <= get_drain_size():
+        response.raw.drain_conn()
+        response.raw.release_conn()
+    else:
+        response.close()
+    start = time.perf_counter()
+    result = extractor.close()
+    if stats is not None:
+        stats["extract_seconds"] = extract_seconds + time.perf_counter() - start
+    return result
+
+
+async def astream(url: str, extractor_factory, stats: dict = None):
+    """Асинхронный вариант stream
+    Куски разбираются прямо в цикле событий: инкрементальный разбор куска занимает доли миллисекунды"""
+    received = 0
+    extract_seconds = 0.0
+    try:
+        async with get_async_client().stream("GET", url) as response:
+            check_status(response.status_code)
+            check_size(int(response.headers.get("Content-Length", 0) or 0))
+            extractor = extractor_factory(get_charset(response.headers))
+            # httpx без размера куска отдает данные по мере получения
+            chunks = response.aiter_bytes()
+            async for chunk in chunks:
+                received += len(chunk)
+                check_size(received)
+                start = time.perf_counter()
+                done = extractor.feed(chunk)
+                extract_seconds += time.perf_counter() - start
+                if done:
+                    break
+            remaining = get_remaining(response.headers, response.num_bytes_downloaded)
+            if remaining is not None and remaining <= get_drain_size():
+                async for _ in chunks:
+                    pass
+    finally:
+        if stats is not None:
+            stats["bytes"] = received
+    start = time.perf_counter()
+    result = extractor.close()
+    if stats is not None:
+        stats["extract_seconds"] = extract_seconds + time.perf_counter() - start
+    return result
+
+
+def get_async_client():
+    """Возвращает общий асинхронный http-клиент текущего цикла событий
+    Клиент нельзя разделять между циклами, поэтому он создается один раз на цикл"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        connect_timeout, read_timeout = get_timeout()
+        client = httpx.AsyncClient(
+            follow_redirects=True,
+            headers={"Accept-Encoding": ACCEPT_ENCODING},
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=get_pool_size()),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def reset():
+    """Закрывает общие соединения, например после fork процесса"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+    _async_clients.clear()
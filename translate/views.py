@@ -1,178 +1,746 @@
-from rest_framework.permissions import IsAuthenticated
+from rest_framework import exceptions
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+import re
+import json
+import time
+import queue
+import logging
 import string
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import threading
+from functools import partial
+from itertools import islice
+from asgiref.sync import sync_to_async
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait, TimeoutError as FutureTimeoutError
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.views import View
+
+from user.backends import ClaimsJWTAuthentication
+from . import upstream, extract
+from .cache import TranslationCache, translation_cache
+from .singleflight import flights
+from .resilience import Deadline, SourceUnavailable, DeadlineExceeded, get_guard
+from .dictionary import get_local_dictionary
+from .profiling import ProfileStore
+from .metrics import metrics, get_route, observe_upstream, PHASE_DURATION, SOURCE_ERRORS
+
+
+# Ошибка словаря для одного текста или словаря, когда остальные результаты возвращаются
+FETCH_ERROR = SourceUnavailable.message
+
+logger = logging.getLogger(__name__)
+
+
+class TranslateRequestError(Exception):
+    """Некорректные параметры запроса на перевод"""
+
+
+def get_source_params(query_params):
+    """Извлекает из запроса параметры словарей
+    Возвращает кортеж (bkrs, zhonga, local), если параметры отсутствуют, выбрасывает TranslateRequestError"""
+    try:
+        bkrs = query_params["bkrs"] == "True"
+    except Exception:
+        raise TranslateRequestError("В запрсое не указан параметр bkrs")
+    try:
+        zhonga = query_params["zhonga"] == "True"
+    except Exception:
+        raise TranslateRequestError("В запрсое не указан параметр zhonga")
+    # Локальный словарь необязателен, чтобы не ломать существующих клиентов
+    local = query_params.get("local") == "True"
+    return bkrs, zhonga, local
+
+
+def check_text_length(text: str):
+    """Проверка длины текста, если она некорректна, выбрасывает TranslateRequestError"""
+    if len(text) > 100:
+        raise TranslateRequestError("Длина текста превышает допустимую")
+    elif len(text) < 1:
+        raise TranslateRequestError("Поле текста не заполнено")
+
+
+def get_translate_params(query_params, data):
+    """Извлекает из запроса параметры bkrs, zhonga и текст для перевода
+    Возвращает кортеж (bkrs, zhonga, local, text)
+    Если параметры отсутствуют или текст некорректен, выбрасывает TranslateRequestError"""
+    bkrs, zhonga, local = get_source_params(query_params)
+    try:
+        text = data["text"]
+    except Exception:
+        raise TranslateRequestError("В запрсое не передан text")
+
+    check_text_length(text)
+    if not check_language_chinese(text):
+        raise TranslateRequestError("Введите текст на китайском языке")
+    return bkrs, zhonga, local, text
+
+
+def get_batch_texts(data):
+    """Извлекает из запроса список текстов для пакетного перевода
+    Если список отсутствует, пуст или слишком велик, выбрасывает TranslateRequestError"""
+    if hasattr(data, "getlist"):
+        # В форме список передается повторяющимся полем texts
+        texts = data.getlist("texts")
+    else:
+        texts = data.get("texts") if isinstance(data, dict) else None
+    if not isinstance(texts, list):
+        raise TranslateRequestError("В запрсое не передан texts")
+    if len(texts) < 1:
+        raise TranslateRequestError("Список текстов пуст")
+    if len(texts) > getattr(settings, "TRANSLATE_BATCH_MAX_ITEMS", 100):
+        raise TranslateRequestError("Количество текстов превышает допустимое")
+    return texts
+
+
+def validate_texts(texts):
+    """Проверяет список текстов, для каждого возвращает сообщение об ошибке или None
+    Проверка на китайский язык выполняется для всех текстов за один проход"""
+    errors = []
+    for text in texts:
+        if not isinstance(text, str):
+            errors.append("Введите текст на китайском языке")
+            continue
+        try:
+            check_text_length(text)
+        except TranslateRequestError as ex:
+            errors.append(str(ex))
+        else:
+            errors.append(None)
+    checked = [index for index, error in enumerate(errors) if error is None]
+    for index, positions in zip(checked, find_not_chinese([texts[index] for index in checked])):
+        if positions:
+            errors[index] = "Введите текст на китайском языке"
+    return errors
 
 
 class ParserAPIView(APIView):
     """Перевод текста
     Доступен авторизованным пользователям"""
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticated]
 
+    def perform_authentication(self, request):
+        with metrics.timer(PHASE_DURATION, route=get_route(request), phase="auth"):
+            super().perform_authentication(request)
+
     def post(self, request):
         """Обработка post-запроса
         Отправляет запрос на перевод в словари, в случае успеха возвращает полученный результат
         Если отстутствуют параметры bkrs и zhonga в query_params возвращает ошибку со статусом 400
-        Если поле текста в json отсутствует или его значение некорреткно, возвращает ошибку со статусом 400"""
+        Если поле текста в json отсутствует или его значение некорреткно, возвращает ошибку со статусом 400
+        Если словарь недоступен, вместо его результата возвращается сообщение об ошибке,
+        если недоступны все словари - со статусом 503"""
         try:
-            bkrs = request.query_params["bkrs"]
-            if bkrs == "True":
-                bkrs = True
-            else:
-                bkrs = False
-        except Exception:
-            return Response(
-                "В запрсое не указан параметр bkrs",
-                400
-            )
+            with metrics.timer(PHASE_DURATION, route=get_route(request), phase="validation"):
+                bkrs, zhonga, local, text = get_translate_params(request.query_params, request.data)
+        except TranslateRequestError as ex:
+            return Response(str(ex), 400)
+
+        with metrics.timer(PHASE_DURATION, route=get_route(request), phase="translate"):
+            parser = Parser(text, bkrs, zhonga, local)
+        return Response(parser.result, parser.status)
+
+
+class BatchParserAPIView(APIView):
+    """Пакетный перевод списка текстов
+    Одинаковые тексты переводятся один раз, запросы к словарям выполняются параллельно
+    с ограничением TRANSLATE_BATCH_CONCURRENCY
+    Доступен авторизованным пользователям"""
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        """Обработка post-запроса
+        Принимает список текстов в поле texts, параметры словарей - как у ParserAPIView
+        Возвращает список результатов в порядке текстов: {"text", "result"} или {"text", "error"}
+        Если отстутствуют параметры словарей или список текстов некорректен, возвращает ошибку со статусом 400"""
         try:
-            zhonga = request.query_params["zhonga"]
-            if zhonga == "True":
-                zhonga = True
-            else:
-                zhonga = False
-        except Exception:
-            return Response(
-                "В запрсое не указан параметр zhonga",
-                400
-            )
+            bkrs, zhonga, local = get_source_params(request.query_params)
+            texts = get_batch_texts(request.data)
+        except TranslateRequestError as ex:
+            return Response(str(ex), 400)
+
+        return Response(BatchParser(texts, bkrs, zhonga, local).result, 200)
+
+
+class StreamParserAPIView(APIView):
+    """Потоковый перевод текста в формате NDJSON
+    Результат каждого словаря отправляется, как только он получен, поэтому медленный словарь
+    не задерживает остальные. Строки длинного результата отправляются по мере разбора страницы
+    Доступен авторизованным пользователям"""
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        """Обработка post-запроса
+        Параметры и ошибки со статусом 400 - как у ParserAPIView. Тело ответа - события по одному
+        JSON-объекту в строке: {"source", "row"} для каждой разобранной строки результата, затем
+        {"source", "result"} с полным результатом словаря или {"source", "error"}"""
+        try:
+            bkrs, zhonga, local, text = get_translate_params(request.query_params, request.data)
+        except TranslateRequestError as ex:
+            return Response(str(ex), 400)
+
+        events = StreamParser(text, bkrs, zhonga, local).events()
+        lines = (json.dumps(event, ensure_ascii=False).encode("utf-8") + b"\n" for event in events)
+        response = StreamingHttpResponse(lines, content_type="application/x-ndjson; charset=utf-8")
+        # Прокси не должны накапливать ответ целиком
+        response["X-Accel-Buffering"] = "no"
+        response["Cache-Control"] = "no-cache"
+        return response
+
+
+class CacheStatsAPIView(APIView):
+    """Счетчики кэша переводов для настройки его размера и времени жизни
+    Доступен администраторам"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """Обработка get-запроса, возвращает счетчики попаданий и промахов кэша
+        и количество запросов, дождавшихся уже выполнявшейся загрузки"""
+        return Response(dict(translation_cache.stats(), coalesced=flights.coalesced), 200)
+
+
+class SourceStatsAPIView(APIView):
+    """Состояние защиты словарей: выключатель, ограничитель, очередь и время ответа
+    Доступен администраторам"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """Обработка get-запроса, возвращает состояние каждого словаря"""
+        return Response({source: get_guard(source).stats() for source in settings.TRANSLATE_UPSTREAM_URLS}, 200)
+
+
+class ProfilesAPIView(APIView):
+    """Последние профили запросов
+    Доступен администраторам"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """Обработка get-запроса, возвращает не больше limit профилей от новых к старым
+        с маршрутом, словарями, длиной текста и временем обработки запроса"""
+        try:
+            limit = int(request.query_params.get("limit", 50))
+        except ValueError:
+            return Response("Параметр limit должен быть числом", 400)
+        return Response(ProfileStore().entries()[:max(limit, 0)], 200)
+
+
+class ProfileAPIView(APIView):
+    """Файл профиля запроса: .prof открывается pstats и snakeviz, .folded - flamegraph и speedscope
+    Доступен администраторам"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, name):
+        path = ProfileStore().path(name)
+        if path is None:
+            return Response("Профиль не найден", 404)
+        return FileResponse(open(path, "rb"), as_attachment=True, filename=name)
+
+
+class MetricsView(View):
+    """Метрики процесса в текстовом формате Prometheus
+    Доступны только с адресов INTERNAL_IPS. Метрики считаются в каждом процессе отдельно,
+    поэтому при нескольких воркерах gunicorn ответ содержит метрики одного воркера"""
+
+    def get(self, request):
+        if request.META.get("REMOTE_ADDR") not in settings.INTERNAL_IPS:
+            return HttpResponseForbidden()
+        return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@metrics.collector
+def collect_cache():
+    """Счетчики кэша переводов и объединения одновременных загрузок"""
+    stats = translation_cache.stats()
+    return [
+        ("translate_cache_lookups_total", "counter", "Обращения к кэшу переводов по результату", [
+            ({"result": name}, stats[name]) for name in ("l1_hits", "l2_hits", "stale_hits", "misses")
+        ]),
+        ("translate_cache_hit_ratio", "gauge", "Доля обращений к кэшу переводов без загрузки страницы",
+         [({}, stats["hit_ratio"])]),
+        ("translate_cache_refresh_errors_total", "counter", "Ошибки фонового обновления записей кэша переводов",
+         [({}, stats["refresh_errors"])]),
+        ("translate_cache_l1_size", "gauge", "Число записей в кэше переводов процесса", [({}, stats["l1_size"])]),
+        ("translate_coalesced_total", "counter", "Запросы, дождавшиеся уже выполнявшейся загрузки",
+         [({}, flights.coalesced)]),
+    ]
+
+
+@metrics.collector
+def collect_sources():
+    """Состояние защиты словарей"""
+    stats = {source: get_guard(source).stats() for source in settings.TRANSLATE_UPSTREAM_URLS}
+    return [
+        (name, kind, help, [({"source": source}, value(stats[source])) for source in stats])
+        for name, kind, help, value in (
+            ("translate_source_breaker_open", "gauge", "Выключатель словаря разомкнут",
+             lambda item: int(item["state"] != "closed")),
+            ("translate_source_concurrency_limit", "gauge", "Допустимое число одновременных запросов к словарю",
+             lambda item: item["limit"]),
+            ("translate_source_in_flight", "gauge", "Выполняющиеся запросы к словарю", lambda item: item["in_flight"]),
+            ("translate_source_queued", "gauge", "Запросы к словарю в очереди", lambda item: item["queued"]),
+            ("translate_source_rejected_total", "counter", "Запросы, отклоненные ограничителем словаря",
+             lambda item: item["rejected"]),
+            ("translate_source_hedges_total", "counter", "Повторные запросы к медленному словарю",
+             lambda item: item["hedges"]),
+        )
+    ]
+
+
+class AsyncParserAPIView(View):
+    """Асинхронный перевод текста для запуска под ASGI
+    Авторизация, поиск пользователя и запросы к словарям не блокируют поток
+    Доступен авторизованным пользователям"""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Django 3.1 не вызывает асинхронные методы представлений-классов,
+        # поэтому представление оборачивается в корутину. csrf_exempt тоже не
+        # поддерживает корутины, флаг выставляется напрямую, как это делает APIView
+        dispatch_view = super().as_view(**initkwargs)
+
+        async def view(request, *args, **kwargs):
+            response = dispatch_view(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+            return response
+
+        view.view_class = cls
+        view.view_initkwargs = initkwargs
+        view.csrf_exempt = True
+        return view
+
+    async def post(self, request):
+        """Обработка post-запроса
+        Возвращает тот же результат и те же коды ошибок, что и ParserAPIView"""
+        try:
+            auth = await ClaimsJWTAuthentication().authenticate_async(request)
+        except exceptions.AuthenticationFailed as ex:
+            return JsonResponse(ex.detail, status=403, safe=False)
+        if auth is None:
+            return JsonResponse(exceptions.NotAuthenticated.default_detail, status=401, safe=False)
+        request.user = auth[0]
+
         try:
-            text = request.data["text"]
-        except Exception:
-            return Response(
-                "В запрсое не передан text",
-                400
-            )
-
-        if len(text) > 100:
-            return Response(
-                "Длина текста превышает допустимую",
-                400
-            )
-        elif len(text) < 1:
-            return Response(
-                "Поле текста не заполнено",
-                400
-            )
-
-        if not check_language_chinese(text):
-            return Response(
-                "Введите текст на китайском языке",
-                400
-            )
-
-        result = Parser(text, bkrs, zhonga).result
-        return Response(result, 200)
+            bkrs, zhonga, local, text = get_translate_params(request.GET, self.get_data(request))
+        except TranslateRequestError as ex:
+            return JsonResponse(str(ex), status=400, safe=False)
+
+        parser = AsyncParser(text, bkrs, zhonga, local)
+        result = await parser.parse()
+        return JsonResponse(result, status=parser.status, json_dumps_params={"ensure_ascii": False})
+
+    @staticmethod
+    def get_data(request):
+        """Возвращает тело запроса в виде словаря, поддерживает json и формы"""
+        if request.content_type == "application/json":
+            try:
+                return json.loads(request.body)
+            except ValueError:
+                return {}
+        return request.POST
+
+
+# Знаки пунктуации, числа и пробельные символы, которые допускаются в китайском тексте
+PUNCTUATION_MARKS = string.punctuation + string.whitespace + '。［］【】﹁﹂『』「」﹁﹂………、‧《》〈〉﹏—～，1234567890'
+# Диапазоны иероглифов: радикалы, канбун, расширение A, основной блок и совместимые иероглифы
+CHINESE_RANGES = (
+    ('\u2E80', '\u2FD5'),
+    ('\u3190', '\u319f'),
+    ('\u3400', '\u4DBF'),
+    ('\u4E00', '\u9FCC'),
+    ('\uF900', '\uFAAD'),
+)
+# Класс символов, которые не могут встречаться в китайском тексте, компилируется один раз при импорте
+NOT_CHINESE = re.compile('[^%s%s]' % (
+    ''.join('%s-%s' % (first, last) for first, last in CHINESE_RANGES),
+    re.escape(''.join(sorted(set(PUNCTUATION_MARKS)))),
+))
 
 
 def check_language_chinese(text: str):
     """Проверка строки на то, что она написана на китайском языке
     Знаки пунктуации, числа и пробельные символы на проверку не влияют"""
-    punctuation_marks = string.punctuation + string.whitespace + '。［］【】﹁﹂『』「」﹁﹂………、‧《》〈〉﹏—～，1234567890'
-    for char in text:
-        if u'\u2E80' <= char <= u'\u2FD5':
-            continue
-        elif u'\u3190' <= char <= u'\u319f':
-            continue
-        elif u'\u3400' <= char <= u'\u4DBF':
-            continue
-        elif u'\u4E00' <= char <= u'\u9FCC':
-            continue
-        elif u'\uF900' <= char <= u'\uFAAD':
-            continue
-        elif char in punctuation_marks:
-            continue
-        else:
-            return False
-    return True
+    return NOT_CHINESE.search(text) is None
+
+
+def find_not_chinese(texts):
+    """Проверяет список строк за один проход
+    Для каждой строки возвращает список позиций символов, которые не допускаются в китайском тексте,
+    пустой список означает, что строка написана на китайском языке"""
+    search = NOT_CHINESE.finditer
+    return [[match.start() for match in search(text)] for text in texts]
 
 
 class Parser:
     """Парсер словарей"""
-    url = {"bkrs": "https://bkrs.info/slovo.php?ch=", "zhonga": "https://www.zhonga.ru/search?q="}
-    result = {}
+    _executor = None
+    _executor_lock = threading.Lock()
 
-    def __init__(self, text: str, bkrs: bool, zhonga: bool):
+    def __init__(self, text: str, bkrs: bool, zhonga: bool, local: bool = False, on_row=None,
+                 deadline: Deadline = None):
         self.text = text
+        # Вызывается для каждой строки результата сразу после ее разбора при потоковой загрузке
+        self.on_row = on_row
+        # Срок запроса, общий для всех текстов пакета, или срок этого перевода
+        self.deadline = deadline or Deadline.from_settings()
         self.result = {}
+        # Словари, вместо результата которых возвращается сообщение об ошибке
+        self.errors = set()
+        sources = []
+        if local:
+            sources.append(("local", self.parser_local))
         if bkrs:
-            self.result["bkrs"] = self.parser_bkrs()
+            sources.append(("bkrs", self.parser_bkrs))
         if zhonga:
-            self.result["zhonga"] = self.parser_zhonga()
+            sources.append(("zhonga", self.parser_zhonga))
+        # Первый словарь парсится в текущем потоке, остальные - параллельно в общем пуле,
+        # поэтому время ответа определяется самым медленным словарем, а не их суммой
+        futures = [(name, Parser.executor().submit(method)) for name, method in sources[1:]]
+        for name, method in sources[:1]:
+            self.collect(name, method)
+        for name, future in futures:
+            self.collect(name, partial(future.result, self.remaining()))
 
-    def parser_bkrs(self):
-        """Парсит словарь bkrs"""
-        link = Parser.url["bkrs"] + self.text
-        response = requests.get(link)
-        soup = BeautifulSoup(response.content, "lxml")
-        result = []
-        tables = soup.body("table", {"class": "tbl_bywords"})
-        if len(tables) > 0:
-            text = ""
-            for i in soup.body("div", {"class": "fixed_scroll"}):
-                text += i.text
-            original_strings = []
-            pinyin_strings = []
-            translated_strings = []
-            for table in tables:
-                for count, row in enumerate(table('tr')):
-                    for block in row('td'):
-                        if block.center:
-                            pinyin_strings.append([block.center.text])
-                        if count % 2 == 0:
-                            a = block('a')
-                            original_strings.append(a[0].contents if len(a) > 0 else block.contents)
-                        else:
-                            a = block('a')
-
-                            translated_strings.append(
-                                [data.text.strip() for data in block('div')] if len(block('div')) > 0 else [
-                                    block.text.strip()])
-            for original, pinyin, translated in zip(original_strings, pinyin_strings, translated_strings):
-                result.append([original, pinyin, translated])
-        else:
-            original = [self.text]
-            pinyin = [soup.body.find("div", {"class": "py"}).text.strip()]
-            translated = [t.text.strip() for t in soup.body("div", {"class": "ru"})]
-            result.append(original)
-            result.append(pinyin)
-            result.append(translated)
+    def remaining(self):
+        """Оставшееся время запроса в секундах или None, если срок не ограничен"""
+        return self.deadline.remaining() if self.deadline else None
+
+    def collect(self, name: str, get):
+        """Сохраняет результат словаря name, полученный вызовом get()
+        Ошибка словаря не прерывает перевод: вместо результата сохраняется сообщение о ней"""
+        try:
+            self.result[name] = get()
+            return
+        except SourceUnavailable as ex:
+            error, message = ex, str(ex)
+        except FutureTimeoutError as ex:
+            error, message = ex, DeadlineExceeded.message
+        except Exception as ex:
+            error, message = ex, FETCH_ERROR
+            logger.exception("Ошибка словаря %s для текста %s", name, self.text)
+        self.result[name] = message
+        self.errors.add(name)
+        metrics.inc(SOURCE_ERRORS, source=name, error=type(error).__name__)
+
+    @property
+    def status(self):
+        """Статус ответа: 503, если ни один словарь не вернул результат"""
+        return 503 if self.errors and len(self.errors) == len(self.result) else 200
+
+    @classmethod
+    def executor(cls):
+        """Возвращает общий для всех запросов пул потоков, ограниченный TRANSLATE_FETCH_WORKERS"""
+        if cls._executor is None:
+            with cls._executor_lock:
+                if cls._executor is None:
+                    cls._executor = ThreadPoolExecutor(
+                        max_workers=getattr(settings, "TRANSLATE_FETCH_WORKERS", 8),
+                        thread_name_prefix="translate-fetch"
+                    )
+        return cls._executor
+
+    @staticmethod
+    def link(source: str, text: str):
+        """Возвращает адрес страницы словаря source с переводом text"""
+        return settings.TRANSLATE_UPSTREAM_URLS[source] + text
+
+    def parser_local(self):
+        """Переводит текст по локальному словарю
+        Если словарь не импортирован или в нем нет какого-то слова, парсит словарь bkrs"""
+        dictionary = get_local_dictionary()
+        result = dictionary.translate(self.text) if dictionary else None
+        if result is None:
+            return self.parser_bkrs()
         return result
 
+    def parser_bkrs(self):
+        """Парсит словарь bkrs, если перевод уже есть в кэше, берет его оттуда
+        Одновременные запросы одного текста ждут одну загрузку страницы. Фоновое обновление
+        устаревшей записи выполняется после ответа, поэтому не передает строки и срок запроса"""
+        return flights.do(TranslationCache.key("bkrs", self.text), partial(
+            translation_cache.get_or_fetch, "bkrs", self.text,
+            partial(Parser.fetch_bkrs, self.text, self.on_row, self.deadline), partial(Parser.fetch_bkrs, self.text),
+            self.deadline
+        ), self.remaining())
+
     def parser_zhonga(self):
-        """Парсит словарь zhonga"""
+        """Парсит словарь zhonga, если перевод уже есть в кэше, берет его оттуда
+        Одновременные запросы одного текста ждут одну загрузку страницы"""
         if len(self.text) > 24:
             return "Длина текста превышает допустимую"
-        link = Parser.url["zhonga"] + self.text
-        response = requests.get(link)
-        original_strings = []
-        pinyin_strings = []
-        translated_strings = []
-        soup = BeautifulSoup(response.content, "lxml")
-        tables = soup.body("div", {"class": "segmented-unit"})
+        return flights.do(TranslationCache.key("zhonga", self.text), partial(
+            translation_cache.get_or_fetch, "zhonga", self.text,
+            partial(Parser.fetch_zhonga, self.text, self.on_row, self.deadline), partial(Parser.fetch_zhonga, self.text),
+            self.deadline
+        ), self.remaining())
+
+    @staticmethod
+    def fetch_bkrs(text: str, on_row=None, deadline: Deadline = None):
+        """Загружает и разбирает страницу словаря bkrs через защиту словаря
+        Повторный запрос строк результата не передает, чтобы они не повторялись"""
+        return get_guard("bkrs").call(
+            partial(Parser.load_bkrs, text, on_row), partial(Parser.load_bkrs, text), deadline
+        )
+
+    @staticmethod
+    def fetch_zhonga(text: str, on_row=None, deadline: Deadline = None):
+        """Загружает и разбирает страницу словаря zhonga через защиту словаря
+        Повторный запрос строк результата не передает, чтобы они не повторялись"""
+        return get_guard("zhonga").call(
+            partial(Parser.load_zhonga, text, on_row), partial(Parser.load_zhonga, text), deadline
+        )
+
+    @staticmethod
+    def load(source: str, text: str, extractor_class, parse, on_row=None, deadline: Deadline = None):
+        """Загружает и разбирает страницу словаря source, записывая время загрузки и разбора
+        и размер ответа в метрики"""
+        stats = {}
+        start = time.perf_counter()
+        try:
+            if upstream.streaming():
+                return upstream.stream(
+                    Parser.link(source, text), partial(extractor_class, text, on_row=on_row), deadline, stats
+                )
+            content = upstream.get(Parser.link(source, text), deadline).content
+            stats["bytes"] = len(content)
+            parse_start = time.perf_counter()
+            result = parse(text, content)
+            stats["extract_seconds"] = time.perf_counter() - parse_start
+            return result
+        finally:
+            observe_upstream(source, time.perf_counter() - start, stats)
+
+    @staticmethod
+    def load_bkrs(text: str, on_row=None, deadline: Deadline = None):
+        """Загружает и разбирает страницу словаря bkrs"""
+        return Parser.load("bkrs", text, extract.BkrsExtractor, Parser.parse_bkrs, on_row, deadline)
+
+    @staticmethod
+    def load_zhonga(text: str, on_row=None, deadline: Deadline = None):
+        """Загружает и разбирает страницу словаря zhonga"""
+        return Parser.load("zhonga", text, extract.ZhongaExtractor, Parser.parse_zhonga, on_row, deadline)
+
+    @staticmethod
+    def parse_bkrs(text: str, content: bytes):
+        """Разбирает страницу словаря bkrs с переводом text"""
+        return extract.bkrs(text, content)
+
+    @staticmethod
+    def parse_zhonga(text: str, content: bytes):
+        """Разбирает страницу словаря zhonga с переводом text"""
+        return extract.zhonga(text, content)
+
+
+class BatchParser:
+    """Пакетный парсер словарей
+    Тексты проверяются за один проход, одинаковые тексты переводятся один раз. Запросы
+    к словарям всех текстов выполняются в общем пуле, одновременно не больше
+    TRANSLATE_BATCH_CONCURRENCY, чтобы один пакет не занимал весь пул. Ошибка словаря
+    заменяет только его результат, текст считается непереведенным, если недоступны все словари"""
+
+    def __init__(self, texts, bkrs: bool, zhonga: bool, local: bool = False):
+        self.texts = texts
+        self.sources = [name for name, selected in (("local", local), ("bkrs", bkrs), ("zhonga", zhonga)) if selected]
+        # Один срок на весь пакет: иначе каждый текст получал бы полный срок с момента своего запуска
+        self.deadline = Deadline.from_settings()
+        self.result = self.translate()
+
+    def translate(self):
+        """Результаты в порядке текстов: {"text", "result"} или {"text", "error"}"""
+        errors = validate_texts(self.texts)
+        # dict сохраняет порядок, повторяющиеся тексты переводятся один раз
+        unique = list(dict.fromkeys(text for text, error in zip(self.texts, errors) if error is None))
+        results, failed = self.parse(unique)
+
         result = []
-        if len(tables) > 0:
-            for string in tables:
-                original_strings.append([string.find("div", {"class": "segmented-unit-value"}).a.text])
-                pinyin_strings.append([string.find("span", {"class": "pinyin"}).text.strip()])
-                try:
-                    translate = string.find("div", {"class": "segmented-unit-dic-definitions"}).text.strip()
-                    if string.find("div", {"class": "segmented-unit-user-definitions"}):
-                        translate += string.find("div", {"class": "segmented-unit-user-definitions"}).text.strip()
-                except Exception as ex:
-                    translate = string.find("div", {"class": "segmented-unit-user-definitions"}).text.strip()
-                    print(str(ex))
-                translated_strings.append([translate])
-            for original, pinyin, translated in zip(original_strings, pinyin_strings, translated_strings):
-                result.append([original, pinyin, translated])
-        else:
-            original = [self.text]
-            pinyin = [soup.body.find("span", {"class": "pinyin"}).text.strip()]
-            translated = [t.text.strip() for t in soup.body("div", {"id": "unit-dic-definitions"})]
-            result.append(original)
-            result.append(pinyin)
-            result.append(translated)
+        for text, error in zip(self.texts, errors):
+            if error is None and text in failed:
+                error = FETCH_ERROR
+            if error is None:
+                result.append({"text": text, "result": results[text]})
+            else:
+                result.append({"text": text, "error": error})
         return result
+
+    def parse_source(self, text: str, name: str):
+        """Парсит один словарь для одного текста в текущем потоке"""
+        return Parser(text, name == "bkrs", name == "zhonga", name == "local", deadline=self.deadline)
+
+    def parse(self, texts):
+        """Парсит словари всех текстов, возвращает результаты по текстам и множество текстов с ошибками"""
+        tasks = ((text, name) for text in texts for name in self.sources)
+        results = {text: {} for text in texts}
+        errors = dict.fromkeys(texts, 0)
+        running = {}
+        concurrency = getattr(settings, "TRANSLATE_BATCH_CONCURRENCY", 4)
+        while True:
+            for text, name in islice(tasks, concurrency - len(running)):
+                running[Parser.executor().submit(self.parse_source, text, name)] = (text, name)
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                text, name = running.pop(future)
+                parser = future.result()
+                results[text][name] = parser.result[name]
+                errors[text] += name in parser.errors
+        return results, {text for text, count in errors.items() if count == len(self.sources)}
+
+
+class StreamParser:
+    """Парсер словарей с результатами в виде потока событий
+    Каждый словарь парсится отдельной задачей в общем пуле, события передаются через очередь
+    в порядке получения"""
+
+    def __init__(self, text: str, bkrs: bool, zhonga: bool, local: bool = False):
+        self.text = text
+        self.sources = [name for name, selected in (("local", local), ("bkrs", bkrs), ("zhonga", zhonga)) if selected]
+        self.queue = queue.Queue()
+        # Словари, итоговое событие которых уже отправлено
+        self.finished = set()
+        self._lock = threading.Lock()
+
+    def parse_source(self, name: str):
+        """Парсит один словарь, отправляя в очередь строки результата и итоговое событие
+        Строки после итогового события отбрасываются: их может продолжать разбирать запрос,
+        который проиграл повторному запросу или не уложился в срок"""
+        def on_row(row):
+            with self._lock:
+                if name not in self.finished:
+                    self.queue.put({"source": name, "row": row})
+
+        parser = Parser(self.text, name == "bkrs", name == "zhonga", name == "local", on_row)
+        with self._lock:
+            self.finished.add(name)
+            if name in parser.errors:
+                self.queue.put({"source": name, "error": parser.result[name]})
+            else:
+                self.queue.put({"source": name, "result": parser.result[name]})
+
+    def events(self):
+        """Генератор событий, завершается после итогового события каждого словаря"""
+        for name in self.sources:
+            Parser.executor().submit(self.parse_source, name)
+        remaining = len(self.sources)
+        while remaining:
+            event = self.queue.get()
+            if "row" not in event:
+                remaining -= 1
+            yield event
+
+
+class AsyncParser:
+    """Асинхронный парсер словарей
+    Страницы загружаются асинхронным http-клиентом. При потоковой загрузке страница разбирается
+    по мере получения в цикле событий, иначе разбор целой страницы выполняется в пуле потоков,
+    чтобы не блокировать цикл событий"""
+
+    def __init__(self, text: str, bkrs: bool, zhonga: bool, local: bool = False):
+        self.text = text
+        self.bkrs = bkrs
+        self.zhonga = zhonga
+        self.local = local
+        self.deadline = Deadline.from_settings()
+        self.result = {}
+        self.errors = set()
+
+    async def parse(self):
+        """Параллельно парсит выбранные словари и возвращает словарь с результатами"""
+        sources = []
+        if self.local:
+            sources.append(("local", self.parser_local()))
+        if self.bkrs:
+            sources.append(("bkrs", self.parser_bkrs()))
+        if self.zhonga:
+            sources.append(("zhonga", self.parser_zhonga()))
+        results = await asyncio.gather(*[parser for _, parser in sources], return_exceptions=True)
+        for (name, _), result in zip(sources, results):
+            # Как и в Parser.collect, ошибка словаря заменяет только его результат
+            if isinstance(result, Exception):
+                if not isinstance(result, SourceUnavailable):
+                    logger.error("Ошибка словаря %s для текста %s", name, self.text, exc_info=result)
+                metrics.inc(SOURCE_ERRORS, source=name, error=type(result).__name__)
+                result = str(result) if isinstance(result, SourceUnavailable) else FETCH_ERROR
+                self.errors.add(name)
+            self.result[name] = result
+        return self.result
+
+    @property
+    def status(self):
+        """Статус ответа: 503, если ни один словарь не вернул результат"""
+        return 503 if self.errors and len(self.errors) == len(self.result) else 200
+
+    def remaining(self):
+        """Оставшееся время запроса в секундах или None, если срок не ограничен"""
+        return self.deadline.remaining() if self.deadline else None
+
+    async def fetch(self, source: str):
+        """Загружает страницу словаря source"""
+        response = await upstream.get_async_client().get(Parser.link(source, self.text))
+        upstream.check_status(response.status_code)
+        return response.content
+
+    async def parser_local(self):
+        """Переводит текст по локальному словарю, при промахе парсит словарь bkrs"""
+        dictionary = get_local_dictionary()
+        result = dictionary.translate(self.text) if dictionary else None
+        if result is None:
+            return await self.parser_bkrs()
+        return result
+
+    async def parser_bkrs(self):
+        """Парсит словарь bkrs, если перевод уже есть в кэше, берет его оттуда"""
+        return await flights.ado(TranslationCache.key("bkrs", self.text), partial(
+            translation_cache.aget_or_fetch, "bkrs", self.text, self.fetch_bkrs, partial(Parser.fetch_bkrs, self.text),
+            self.deadline
+        ), self.remaining())
+
+    async def parser_zhonga(self):
+        """Парсит словарь zhonga, если перевод уже есть в кэше, берет его оттуда"""
+        if len(self.text) > 24:
+            return "Длина текста превышает допустимую"
+        return await flights.ado(TranslationCache.key("zhonga", self.text), partial(
+            translation_cache.aget_or_fetch, "zhonga", self.text, self.fetch_zhonga,
+            partial(Parser.fetch_zhonga, self.text), self.deadline
+        ), self.remaining())
+
+    async def fetch_bkrs(self):
+        """Загружает и разбирает страницу словаря bkrs через защиту словаря"""
+        return await get_guard("bkrs").acall(self.load_bkrs, self.deadline)
+
+    async def fetch_zhonga(self):
+        """Загружает и разбирает страницу словаря zhonga через защиту словаря"""
+        return await get_guard("zhonga").acall(self.load_zhonga, self.deadline)
+
+    async def load(self, source: str, extractor_class, parse):
+        """Загружает и разбирает страницу словаря source, записывая время загрузки и разбора
+        и размер ответа в метрики"""
+        stats = {}
+        start = time.perf_counter()
+        try:
+            if upstream.streaming():
+                return await upstream.astream(
+                    Parser.link(source, self.text), partial(extractor_class, self.text), stats
+                )
+            content = await self.fetch(source)
+            stats["bytes"] = len(content)
+            parse_start = time.perf_counter()
+            result = await sync_to_async(parse, thread_sensitive=False)(self.text, content)
+            stats["extract_seconds"] = time.perf_counter() - parse_start
+            return result
+        finally:
+            observe_upstream(source, time.perf_counter() - start, stats)
+
+    async def load_bkrs(self):
+        """Загружает и разбирает страницу словаря bkrs"""
+        return await self.load("bkrs", extract.BkrsExtractor, Parser.parse_bkrs)
+
+    async def load_zhonga(self):
+        """Загружает и разбирает страницу словаря zhonga"""
+        return await self.load("zhonga", extract.ZhongaExtractor, Parser.parse_zhonga)
@@ -1,11 +1,169 @@
 import jwt
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.db import connection
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 
 from rest_framework import authentication, exceptions
 
+from translate.cache import LRUCache
 from .models import MyUser
 
+logger = logging.getLogger(__name__)
+
+# Payloads of verified tokens keyed by the token string and the field
+# values of active users keyed by id. Both are per process, so a user
+# change made by another process is seen after at most
+# AUTH_USER_CACHE_TTL seconds.
+token_cache = LRUCache(getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 4096))
+user_cache = LRUCache(getattr(settings, 'AUTH_USER_CACHE_SIZE', 1024))
+
+
+def cache_enabled():
+    return getattr(settings, 'AUTH_CACHE_ENABLED', True)
+
+
+class DenyList:
+    """
+    Ids of users whose tokens must not be accepted from claims alone.
+    The check is a set lookup. The set of deactivated users is loaded from
+    the database on first use, rebuilt in a background thread every
+    AUTH_DENY_LIST_REFRESH seconds and updated at once when a user is saved
+    or deleted in this process. Deleted users are not in the database, so
+    they are remembered by this process only.
+    """
+
+    def __init__(self):
+        self._inactive = frozenset()
+        self._deleted = set()
+        self._loaded = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='deny-list-refresh')
+
+    def loaded(self):
+        return self._loaded is not None
+
+    def stale(self):
+        refresh = getattr(settings, 'AUTH_DENY_LIST_REFRESH', 60)
+        return self._loaded is None or time.monotonic() - self._loaded >= refresh
+
+    def load(self):
+        """
+        Load the set on first use. Only one thread queries the database,
+        the others wait for its result.
+        """
+        with self._load_lock:
+            if self._loaded is None:
+                self.refresh()
+
+    def refresh(self):
+        inactive = frozenset(MyUser.objects.filter(is_active=False).values_list('pk', flat=True))
+        with self._lock:
+            self._inactive = inactive
+            self._loaded = time.monotonic()
+
+    def refresh_in_background(self):
+        """
+        Rebuild the stale set in the background thread unless a rebuild is
+        already running. Requests keep using the current set meanwhile.
+        """
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        self._executor.submit(self._background_refresh)
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception('Could not refresh the deny-list')
+        finally:
+            # The refresh thread is not a request, so nothing else closes its connection
+            connection.close()
+            with self._lock:
+                self._refreshing = False
+
+    def update(self, pk, denied):
+        with self._lock:
+            self._inactive = (self._inactive | {pk}) if denied else (self._inactive - {pk})
+
+    def delete(self, pk):
+        with self._lock:
+            self._deleted.add(pk)
+
+    def clear(self):
+        with self._lock:
+            self._inactive = frozenset()
+            self._deleted.clear()
+            self._loaded = None
+
+    def __contains__(self, pk):
+        if not self.loaded():
+            self.load()
+        elif self.stale():
+            self.refresh_in_background()
+        return pk in self._inactive or pk in self._deleted
+
+
+deny_list = DenyList()
+
+
+@receiver(post_save, sender=MyUser)
+@receiver(post_delete, sender=MyUser)
+def invalidate_user(sender, instance, **kwargs):
+    """
+    Drop the cached user when it is saved or deleted, so that for example
+    a deactivated user is rejected by the next request.
+    """
+    user_cache.delete(instance.pk)
+    if kwargs['signal'] is post_delete:
+        deny_list.delete(instance.pk)
+    else:
+        deny_list.update(instance.pk, not instance.is_active)
+
+
+class TokenPrincipal:
+    """
+    Lightweight authenticated user built from the signed claims of a token.
+    It carries the id, username and flags only. Any other attribute loads
+    the full `MyUser` record on first access.
+    """
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, payload):
+        self.pk = self.id = payload['id']
+        self.username = payload['username']
+        self.is_active = payload['active']
+        self.is_staff = payload.get('staff', False)
+        self._user = None
+
+    @property
+    def user(self):
+        """
+        The full user record, loaded through the user cache.
+        """
+        if self._user is None:
+            self._user = JWTAuthentication()._get_user({'id': self.pk})
+        return self._user
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __str__(self):
+        return self.username
+
 
 class JWTAuthentication(authentication.BaseAuthentication):
     authentication_header_prefix = 'Token'
@@ -43,6 +201,28 @@ class JWTAuthentication(authentication.BaseAuthentication):
         # method below.
         return self._authenticate_credentials(request, token)
 
+    async def authenticate_async(self, request):
+        """
+        Asynchronous counterpart of `authenticate` for views served over
+        ASGI. Return values and errors are the same. The token is decoded in
+        the event loop, the user lookup runs in a worker thread so that it
+        does not block other requests.
+        """
+        request.user = None
+
+        token = self.get_token_from_headers(request)
+        if token == None:
+            token = self.get_token_from_cookie(request)
+        if token == None:
+            return None
+        payload = self._decode_token(token)
+        if not deny_list.loaded():
+            await sync_to_async(deny_list.load)()
+        user = self._get_principal(payload) or self._get_cached_user(payload)
+        if user is None:
+            user = await sync_to_async(self._get_user)(payload)
+        return (user, token)
+
     def get_token_from_headers(self, request):
         # `auth_header` should be an array with two elements: 1) the name of
         # the authentication header (in this case, "Token") and 2) the JWT
@@ -86,12 +266,63 @@ class JWTAuthentication(authentication.BaseAuthentication):
         Try to authenticate the given credentials. If authentication is
         successful, return the user and token. If not, throw an error.
         """
+        payload = self._decode_token(token)
+        user = self._get_principal(payload) or self._get_user(payload)
+        return (user, token)
+
+    def _decode_token(self, token):
+        """
+        Decode the token and return its payload. Throw an error if the token
+        is invalid or expired. Verified payloads are cached until the token
+        expires, but for no longer than AUTH_TOKEN_CACHE_TTL seconds.
+        """
+        if cache_enabled():
+            payload = token_cache.get(token)
+            if payload is not None:
+                return payload
         try:
             payload = jwt.decode(token, settings.SECRET_KEY)
         except:
             msg = 'Invalid authentication. Could not decode token.'
             raise exceptions.AuthenticationFailed(msg)
 
+        if cache_enabled():
+            ttl = getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 300)
+            if 'exp' in payload:
+                ttl = min(ttl, payload['exp'] - time.time())
+            if ttl > 0:
+                token_cache.set(token, payload, ttl)
+        return payload
+
+    def _get_principal(self, payload):
+        """
+        Return a principal built from the token claims without loading the
+        user, or `None` to load the user. Subclasses enable the claims path.
+        """
+        return None
+
+    def _get_cached_user(self, payload):
+        """
+        Return the cached user the token payload belongs to or `None`.
+        A user on the deny-list is loaded again so that it can be rejected.
+        Every call builds a new instance from the cached field values, so
+        requests in different threads never share one `MyUser` object.
+        """
+        if not cache_enabled() or payload.get('id') in deny_list:
+            return None
+        cached = user_cache.get(payload.get('id'))
+        if cached is None:
+            return None
+        db, values = cached
+        return MyUser.from_db(db, [field.attname for field in MyUser._meta.concrete_fields], values)
+
+    def _get_user(self, payload):
+        """
+        Return the active user the token payload belongs to.
+        """
+        user = self._get_cached_user(payload)
+        if user is not None:
+            return user
         try:
             user = MyUser.objects.get(pk=payload['id'])
         except MyUser.DoesNotExist:
@@ -101,4 +332,24 @@ class JWTAuthentication(authentication.BaseAuthentication):
         if not user.is_active:
             msg = 'This user has been deactivated.'
             raise exceptions.AuthenticationFailed(msg)
-        return (user, token)
+        if cache_enabled():
+            values = tuple(getattr(user, field.attname) for field in MyUser._meta.concrete_fields)
+            user_cache.set(user.pk, (user._state.db, values), getattr(settings, 'AUTH_USER_CACHE_TTL', 60))
+        return user
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    Authentication for endpoints that need no more than the user id and
+    name. While the claims of the token are valid and the user is not on
+    the deny-list, a `TokenPrincipal` is returned and the database is not
+    hit. Tokens without claims or with expired claims fall back to
+    `JWTAuthentication`.
+    """
+
+    def _get_principal(self, payload):
+        if not payload.get('active') or payload.get('claims_exp', 0) <= time.time():
+            return None
+        if payload['id'] in deny_list:
+            return None
+        return TokenPrincipal(payload)
@@ -0,0 +1,106 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model, hashers
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class TunablePBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    PBKDF2 hasher whose cost is taken from AUTH_PASSWORD_ITERATIONS. The
+    algorithm name is unchanged, so existing hashes are still verified and
+    are rehashed with the new cost on the next successful login.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'AUTH_PASSWORD_ITERATIONS', hashers.PBKDF2PasswordHasher.iterations)
+
+
+def get_executor():
+    """
+    Return the process wide pool that hashes passwords. It caps the number
+    of hashes computed at once at AUTH_HASH_WORKERS, so a burst of logins
+    or registrations cannot take every CPU from other requests. The calling
+    thread still waits for its hash, so this limits CPU, not request threads.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'AUTH_HASH_WORKERS', 2),
+                    thread_name_prefix='password-hash'
+                )
+    return _executor
+
+
+def reset():
+    """
+    Shut down the pool so that the next call creates it with the current
+    settings.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+def _verify(password, encoded):
+    """
+    Check the password and, if the hash uses an outdated hasher or cost,
+    compute the new hash. Return `(is_correct, new_encoded_or_None)`.
+    """
+    outdated = []
+    is_correct = hashers.check_password(password, encoded, setter=outdated.append)
+    return is_correct, hashers.make_password(password) if outdated else None
+
+
+def make_password(password):
+    """
+    Hash the password in the hashing pool and wait for the result.
+    """
+    return get_executor().submit(hashers.make_password, password).result()
+
+
+def check_password(password, encoded):
+    """
+    Verify the password in the hashing pool and wait for the result. Return
+    `(is_correct, new_encoded_or_None)`, where the new hash must be saved if
+    it is given.
+    """
+    return get_executor().submit(_verify, password, encoded).result()
+
+
+def _get_user(mail):
+    return get_user_model().objects.filter(mail=mail).first()
+
+
+def _save_password(user, encoded):
+    user.password = encoded
+    user.save(update_fields=['password'])
+
+
+def authenticate(mail, password):
+    """
+    Return the active user with the given mail and password or `None`, as
+    `django.contrib.auth.authenticate` with the model backend does. The hash
+    runs in the hashing pool, the database queries run in the calling
+    thread. An outdated hash is replaced transparently.
+    """
+    user = _get_user(mail)
+    if user is None:
+        # Hash anyway so that a missing user takes as long as a wrong password
+        make_password(password)
+        return None
+    is_correct, encoded = check_password(password, user.password)
+    if not is_correct or not user.is_active:
+        return None
+    if encoded is not None:
+        _save_password(user, encoded)
+    return user
+
@@ -0,0 +1,194 @@
+import io
+import csv
+import json
+import time
+import codecs
+import threading
+from itertools import islice
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.db import IntegrityError, transaction
+
+from . import hashing
+from .models import MyUser
+from .namegenerator import taken_names
+from .serializers import RegistrationSerializer
+
+FORMATS = ("csv", "jsonl")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Общий пул процессов для хэширования паролей при импорте
+    PBKDF2 занимает процессор, поэтому пароли хэшируются на всех ядрах, а не в потоках процесса.
+    Процессы запускаются через forkserver: fork многопоточного воркера gunicorn копирует
+    блокировки, захваченные другими потоками, и процесс пула может зависнуть. Процесс пула
+    начинается с чистого интерпретатора, поэтому сначала настраивает Django: инициализатор -
+    сам django.setup, функция этого модуля потребовала бы импорта моделей до настройки"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(
+                    max_workers=getattr(settings, "USER_IMPORT_WORKERS", None), initializer=django.setup,
+                    mp_context=get_context("forkserver"),
+                )
+    return _executor
+
+
+def reset():
+    """Останавливает пул процессов, следующий импорт создаст его заново"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+def detect_format(name: str):
+    """Формат файла по расширению или None"""
+    extension = name.rsplit(".", 1)[-1].lower()
+    if extension == "ndjson":
+        return "jsonl"
+    return extension if extension in FORMATS else None
+
+
+class InvalidRow:
+    """Данные строки, которую не удалось разобрать, вместо словаря полей пользователя"""
+
+    def __init__(self, message: str):
+        self.message = message
+
+
+def read_rows(file, format: str):
+    """Читает пользователей из текстового файла по одному, возвращает пары (номер строки, данные)
+    Вместо данных строки JSONL, которую не удалось разобрать, возвращается InvalidRow"""
+    if format == "csv":
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+    elif format == "jsonl":
+        for line_num, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_num, row if isinstance(row, dict) else InvalidRow("Некорректная строка JSON")
+    else:
+        raise ValueError("Формат должен быть одним из: %s" % ", ".join(FORMATS))
+
+
+def read_bytes(data: bytes, format: str):
+    """read_rows для содержимого файла в памяти"""
+    return read_lines(io.BytesIO(data), format)
+
+
+def read_lines(lines, format: str):
+    """read_rows для итератора строк в байтах, например загруженного файла или тела запроса:
+    строки читаются и декодируются по одной, файл целиком в память не загружается"""
+    return read_rows(codecs.iterdecode(lines, "utf-8-sig"), format)
+
+
+class UserImporter:
+    """Массовый импорт пользователей
+    Строки проверяются пачками по batch_size: правила полей - как при регистрации, занятость
+    почты - одним запросом на пачку. Пароли пачки хэшируются в пуле процессов, пользователи
+    создаются одним bulk_create. Отклоненные строки попадают в отчет, импорт продолжается
+    processes=False - пароли хэшируются в потоке вызова через общий пул хэширования, без
+    запуска процессов: так импорт выполняется в веб-запросе"""
+
+    def __init__(self, batch_size: int = None, processes: bool = True):
+        self.batch_size = batch_size or getattr(settings, "USER_IMPORT_BATCH_SIZE", 500)
+        self.processes = processes
+        self.created = 0
+        self.rejected = []
+        self.seen = set()
+
+    def run(self, rows):
+        """Импортирует пары (номер строки, данные), возвращает отчет"""
+        start = time.perf_counter()
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch)
+        elapsed = time.perf_counter() - start
+        total = self.created + len(self.rejected)
+        return {
+            "created": self.created,
+            "rejected": self.rejected,
+            "elapsed_s": round(elapsed, 4),
+            "rows_per_sec": round(total / elapsed, 2) if elapsed else 0.0,
+        }
+
+    def reject(self, line_num, errors):
+        self.rejected.append({"line": line_num, "errors": errors})
+
+    def validate(self, batch):
+        """Возвращает проверенные строки пачки, отклоняя остальные"""
+        valid = []
+        for line_num, row in batch:
+            if isinstance(row, InvalidRow):
+                self.reject(line_num, {"row": [row.message]})
+                continue
+            serializer = RegistrationSerializer(data=row)
+            if not serializer.is_valid():
+                self.reject(line_num, serializer.errors)
+                continue
+            data = serializer.validated_data
+            if data["mail"] in self.seen:
+                self.reject(line_num, {"mail": ["Почта повторяется в файле"]})
+                continue
+            self.seen.add(data["mail"])
+            valid.append((line_num, data))
+
+        existing = set(MyUser.objects.filter(mail__in=[data["mail"] for _, data in valid])
+                       .values_list("mail", flat=True))
+        result = []
+        for line_num, data in valid:
+            if data["mail"] in existing:
+                self.reject(line_num, {"mail": ["Пользователь с такой почтой уже существует"]})
+            else:
+                result.append((line_num, data))
+        return result
+
+    def import_batch(self, batch):
+        valid = self.validate(batch)
+        if not valid:
+            return
+        raw_passwords = [data["password"] for _, data in valid]
+        if self.processes:
+            passwords = get_executor().map(hashers.make_password, raw_passwords, chunksize=16)
+        else:
+            passwords = map(hashing.make_password, raw_passwords)
+        users = [
+            MyUser(mail=data["mail"], username=data["username"], password=password)
+            for (_, data), password in zip(valid, passwords)
+        ]
+        try:
+            with transaction.atomic():
+                MyUser.objects.bulk_create(users)
+            created = users
+        except IntegrityError:
+            # Почту заняли во время импорта: пользователи пачки создаются по одному
+            created = []
+            for (line_num, _), user in zip(valid, users):
+                try:
+                    with transaction.atomic():
+                        user.save()
+                    created.append(user)
+                except IntegrityError:
+                    self.reject(line_num, {"mail": ["Пользователь с такой почтой уже существует"]})
+        # bulk_create не отправляет post_save, имена добавляются в фильтр занятых имен напрямую
+        for user in created:
+            taken_names.add(user.username)
+        self.created += len(created)
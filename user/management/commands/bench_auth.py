@@ -0,0 +1,67 @@
+import time
+import statistics
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from translate.benchmarks import prepare_database, dump_report
+from user.backends import JWTAuthentication, ClaimsJWTAuthentication, token_cache, user_cache
+
+MODES = {
+    "without_cache": (JWTAuthentication, False),
+    "with_cache": (JWTAuthentication, True),
+    "claims": (ClaimsJWTAuthentication, False),
+}
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает затраты на аутентификацию запроса по JWT: без кэша токенов и пользователей, "
+            "с кэшем и по подписанным утверждениям токена, а также полный запрос к /get-name/")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=1000, help="Количество запросов в каждом прогоне")
+
+    def handle(self, *args, **options):
+        token = prepare_database()
+        report = {}
+        for mode, (backend, cache) in MODES.items():
+            token_cache.clear()
+            user_cache.clear()
+            with override_settings(AUTH_CACHE_ENABLED=cache):
+                report[mode] = self.measure_authenticate(backend(), token, options["iterations"])
+        report["get_name"] = self.measure_get_name(token, options["iterations"])
+        report["speedup"] = round(report["without_cache"]["median_us"] / report["with_cache"]["median_us"], 2)
+        dump_report(report, self.stdout)
+
+    @staticmethod
+    def measure(call, iterations):
+        """Медианное время вызова в микросекундах и количество запросов к базе на вызов"""
+        call()
+        timings = []
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(iterations):
+                start = time.perf_counter()
+                call()
+                timings.append(time.perf_counter() - start)
+        return {
+            "median_us": round(statistics.median(timings) * 1000000, 1),
+            "queries_per_request": round(len(queries) / iterations, 3),
+        }
+
+    def measure_authenticate(self, backend, token, iterations):
+        """Только authenticate на готовом запросе"""
+        request = RequestFactory().get("/get-name/", HTTP_AUTHORIZATION="Token " + token)
+        return self.measure(lambda: backend.authenticate(request), iterations)
+
+    def measure_get_name(self, token, iterations):
+        """Полный запрос через Django к представлению, которое только аутентифицирует пользователя"""
+        client = Client()
+        client.cookies["Token"] = token
+
+        def request():
+            if client.get("/get-name/").status_code != 200:
+                raise AssertionError("Запрос к /get-name/ завершился ошибкой")
+
+        return self.measure(request, iterations)
@@ -0,0 +1,74 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+
+from translate.benchmarks import BENCH_MAIL, BENCH_PASSWORD, prepare_database, summarize, dump_report
+from user import hashing
+
+
+class Command(BaseCommand):
+    help = ("Измеряет пропускную способность входа в зависимости от размера пула хэширования паролей "
+            "и задержку легкого запроса к /get-name/, выполняемого одновременно со всплеском входов")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=64, help="Количество входов в каждом прогоне")
+        parser.add_argument("--concurrency", type=int, default=16, help="Количество одновременных клиентов")
+        parser.add_argument("--workers", default="1,2,4,8", help="Размеры пула хэширования через запятую")
+        parser.add_argument("--iterations", type=int, default=None,
+                            help="Стоимость хэша PBKDF2, по умолчанию AUTH_PASSWORD_ITERATIONS")
+
+    def handle(self, *args, **options):
+        hasher_settings = {"AUTH_PASSWORD_ITERATIONS": options["iterations"]} if options["iterations"] else {}
+        report = {}
+        with override_settings(**hasher_settings):
+            token = prepare_database()
+            # Пароль перехэшируется с текущей стоимостью до замеров
+            Client().post("/login/", {"mail": BENCH_MAIL, "password": BENCH_PASSWORD})
+            for workers in (int(value) for value in options["workers"].split(",")):
+                with override_settings(AUTH_HASH_WORKERS=workers):
+                    hashing.reset()
+                    report["workers_%d" % workers] = self.run(token, options)
+        hashing.reset()
+        dump_report(report, self.stdout)
+
+    @staticmethod
+    def run(token, options):
+        """Всплеск входов и параллельные запросы к /get-name/ одним клиентом"""
+        local = threading.local()
+        latencies = []
+        errors = []
+        done = threading.Event()
+        probe_latencies = []
+
+        def login(_):
+            if not hasattr(local, "client"):
+                local.client = Client()
+            start = time.perf_counter()
+            response = local.client.post("/login/", {"mail": BENCH_MAIL, "password": BENCH_PASSWORD})
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+        def probe():
+            client = Client()
+            client.cookies["Token"] = token
+            while not done.is_set():
+                start = time.perf_counter()
+                client.get("/get-name/")
+                probe_latencies.append(time.perf_counter() - start)
+
+        probe_thread = threading.Thread(target=probe)
+        probe_thread.start()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            list(executor.map(login, range(options["requests"])))
+        elapsed = time.perf_counter() - start
+        done.set()
+        probe_thread.join()
+        result = summarize(latencies, elapsed, len(errors))
+        result["probe"] = summarize(probe_latencies, elapsed)
+        return result
@@ -0,0 +1,29 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from user.namegenerator import Parser, WordTables
+
+
+class Command(BaseCommand):
+    help = "Строит бинарный файл существительных и прилагательных для генерации имен"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=None,
+                            help="База слов, по умолчанию USER_WORDS_DATABASE")
+        parser.add_argument("--fetch", action="store_true", help="Загрузить слова с сайта вместо базы")
+        parser.add_argument("--output", default=None, help="Путь к файлу слов, по умолчанию USER_WORDS_ASSET")
+
+    def handle(self, *args, **options):
+        output = options["output"] or settings.USER_WORDS_ASSET
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        start = time.perf_counter()
+        if options["fetch"]:
+            nouns, adjectives = Parser().get_words()
+        else:
+            tables = WordTables.from_database(options["database"] or settings.USER_WORDS_DATABASE)
+            nouns, adjectives = list(tables.nouns), list(tables.adjectives)
+        count = WordTables.build(nouns, adjectives, output)
+        self.stdout.write("Записано %s слов в %s за %.2f с" % (count, output, time.perf_counter() - start))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from translate.benchmarks import dump_report
+from user import importer
+
+
+class Command(BaseCommand):
+    help = ("Импортирует пользователей из CSV или JSONL с полями mail, password и необязательным username "
+            "(без него имя генерируется): "
+            "пароли хэшируются на всех ядрах, пользователи создаются пачками, отклоненные строки "
+            "выводятся в отчете")
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="Файл пользователей .csv или .jsonl")
+        parser.add_argument("--format", choices=importer.FORMATS, default=None,
+                            help="Формат файла, по умолчанию определяется по расширению")
+        parser.add_argument("--batch-size", type=int, default=None,
+                            help="Размер пачки, по умолчанию USER_IMPORT_BATCH_SIZE")
+
+    def handle(self, *args, **options):
+        format = options["format"] or importer.detect_format(options["source"])
+        if format is None:
+            raise CommandError("Не удалось определить формат файла, укажите --format")
+        try:
+            with open(options["source"], encoding="utf-8-sig", newline="") as file:
+                report = importer.UserImporter(options["batch_size"]).run(importer.read_rows(file, format))
+        finally:
+            importer.reset()
+        dump_report(report, self.stdout)
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from translate.benchmarks import dump_report
+from user.namegenerator import Parser, WordsDatabase, WordTables
+
+
+def read_words(path):
+    """Слова из файла по одному в строке, пустые строки пропускаются"""
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            word = line.strip()
+            if word:
+                yield word
+
+
+class Command(BaseCommand):
+    help = ("Загружает существительные и прилагательные в базу слов одной транзакцией "
+            "и выводит скорость загрузки в строках в секунду")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--nouns", help="Файл существительных, по одному в строке")
+        parser.add_argument("--adjectives", help="Файл прилагательных, по одному в строке")
+        parser.add_argument("--fetch", action="store_true", help="Загрузить слова с сайта вместо файлов")
+        parser.add_argument("--database", default=None, help="База слов, по умолчанию USER_WORDS_DATABASE")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Размер пачки executemany")
+        parser.add_argument("--upsert", action="store_true", help="Перезаписывать слова с существующим id")
+        parser.add_argument("--wal", action="store_true", help="Перевести базу в режим журнала WAL")
+        parser.add_argument("--build-asset", action="store_true",
+                            help="После загрузки построить файл слов USER_WORDS_ASSET")
+
+    def handle(self, *args, **options):
+        if options["fetch"]:
+            nouns, adjectives = Parser().get_words()
+            tables = {"nouns": nouns, "adjectives": adjectives}
+        else:
+            tables = {
+                table_name: read_words(options[table_name])
+                for table_name in ("nouns", "adjectives") if options[table_name]
+            }
+        database = WordsDatabase(options["database"])
+        try:
+            report = database.bulk_load(tables, options["batch_size"], options["upsert"], options["wal"])
+        finally:
+            database.close()
+        if options["build_asset"]:
+            words = WordTables.from_database(database.path)
+            report["asset_words"] = WordTables.build(words.nouns, words.adjectives, settings.USER_WORDS_ASSET)
+        dump_report(report, self.stdout)
@@ -1,6 +1,7 @@
 from django.db import models
 
 import jwt
+import time
 from datetime import datetime
 from datetime import timedelta
 from django.conf import settings
@@ -8,6 +9,8 @@ from django.contrib.auth.models import AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
 from django.contrib.auth.models import BaseUserManager
 
+from . import hashing
+
 class UserManager(BaseUserManager):
     """
     Django требует, чтобы пользовательские `User`
@@ -101,6 +104,14 @@ class MyUser(AbstractBaseUser, PermissionsMixin):
         """
         return self._generate_jwt_token()
 
+    def set_password(self, raw_password):
+        """
+        Хэширует пароль в пуле потоков хэширования, который ограничивает
+        число одновременно вычисляемых хэшей. Поток запроса ждет результата.
+        """
+        self.password = hashing.make_password(raw_password)
+        self._password = raw_password
+
     def get_full_name(self):
         """
         Этот метод требуется Django для таких вещей,
@@ -126,14 +137,23 @@ class MyUser(AbstractBaseUser, PermissionsMixin):
         Создает веб-токен JSON, в котором хранится идентификатор
         этого пользователя и срок его действия
         составляет 60 дней в будущем.
+        Кроме того, в токен подписанными утверждениями записываются имя,
+        активность и права пользователя. Они действительны AUTH_CLAIMS_TTL
+        секунд и позволяют аутентифицировать запрос без загрузки пользователя.
         """
         experied_time = datetime.now() + timedelta(days=60)
 
         experied_seconds = (experied_time - datetime(1970, 1, 1)).total_seconds()
 
+        claims_seconds = time.time() + getattr(settings, 'AUTH_CLAIMS_TTL', 60 * 60)
+
         token = jwt.encode({
             'id': self.pk,
-            'exp': experied_seconds
+            'exp': experied_seconds,
+            'username': self.username,
+            'active': self.is_active,
+            'staff': self.is_staff,
+            'claims_exp': claims_seconds
         }, settings.SECRET_KEY, algorithm='HS256')
 
         return token.decode('utf-8')
\ No newline at end of file
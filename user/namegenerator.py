@@ -1,9 +1,28 @@
+import os
 import re
+import math
+import mmap
+import hashlib
 import random 
+import time
+import struct
 import logging
 import sqlite3
-import requests
+import threading
+from itertools import islice
 from bs4 import BeautifulSoup
+from django.conf import settings
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from translate import upstream
+from .models import MyUser
+
+logger = logging.getLogger(__name__)
+
+WORDS_MAGIC = b"WORDSV01"
+WORDS_HEADER = struct.Struct("<8sII")
+OFFSET = struct.Struct("<I")
 
 class Parser:
     def get_words(self):
@@ -14,7 +33,7 @@ class Parser:
         pattern = {"word": r"<td><b>([a-zA-Z]+) ?</b></td>",
                     "part of speech": r"<td>([a-zA-Z]+)</td>"}
         url = "https://satvocabulary.us/INDEX.ASP?CATEGORY=6000LIST"
-        response = requests.get(url)
+        response = upstream.get(url)
         soup = BeautifulSoup(response.content, "lxml")
         all_lines = [line for line in soup.body.find_all("tr")]
         nouns = []
@@ -30,11 +49,8 @@ class Parser:
         return nouns, adjectives
 
 class WordsDatabase:
-    file_handler = logging.FileHandler(filename="sample.log")
-    file_handler.setLevel(logging.ERROR)
-    logging.root.handlers = [file_handler]
-
-    def __init__(self):
+    def __init__(self, path: str = None):
+        self.path = path or getattr(settings, "USER_WORDS_DATABASE", "words_database.db")
         self.conn = self.create_connection()
         self.create_links_tables()
 
@@ -43,12 +59,12 @@ class WordsDatabase:
         В случае ошибки, записывает информацию о ней в лог-файл и пробрасывает ошибку дальше
           """
         try:
-            conn = sqlite3.connect('words_database.db')
+            conn = sqlite3.connect(self.path)
             if conn is None:
                 raise Exception("Error! Can't create the database connection.")
             return conn
         except Exception as e:
-            logging.error(str(e))
+            logger.error(str(e))
             raise
 
     def create_links_tables(self):
@@ -69,9 +85,8 @@ class WordsDatabase:
             c = self.conn.cursor()
             c.execute(create_nouns_table)
             c.execute(create_adjective_table)
-            print("создал таблицы")
         except Exception as e:
-            logging.error(str(e))
+            logger.error(str(e))
             raise
 
     def insert_data_in_table(self, table_name, id, word):
@@ -84,40 +99,422 @@ class WordsDatabase:
             c.execute(sql, [(id), (word)])
             self.conn.commit()
         except Exception as e:
-            logging.error(str(e))
+            logger.error(str(e))
             raise
 
     def load_words_in_database(self, word_list, table_name):
         """Добавляет в таблицу table_name все значения из списка word_list"""
-        ID = 0
-        print("начал загружать слова")
-        for word in word_list:
-            self.insert_data_in_table(table_name, str(ID), word)
-            print(ID)
-            ID += 1
-        print("закончил загружать слова")
-        
+        return self.bulk_load({table_name: word_list})
+
+    def bulk_load(self, tables, batch_size: int = 1000, upsert: bool = False, wal: bool = False):
+        """Загружает слова в таблицы одной транзакцией
+        tables - словарь {таблица: итерируемые слова}, id слова - его номер в списке. Слова читаются
+        по мере загрузки и вставляются пачками по batch_size через executemany. С upsert слово с уже
+        существующим id перезаписывается, поэтому повторная загрузка не меняет результат, без него
+        повторяющийся id - ошибка, и транзакция откатывается целиком. С wal база переводится в режим
+        журнала WAL. Возвращает количество строк по таблицам, время загрузки и строк в секунду
+        В случае ошибки, записывает информацию о ней в лог-файл и пробрасывает ошибку дальше"""
+        self.tune_for_bulk_load(wal)
+        start = time.perf_counter()
+        report = {}
+        try:
+            with self.conn:
+                for table_name, words in tables.items():
+                    sql = "INSERT INTO " + table_name + " (id, word) VALUES (?, ?)"
+                    if upsert:
+                        sql += " ON CONFLICT(id) DO UPDATE SET word = excluded.word"
+                    rows = ((str(id), word) for id, word in enumerate(words))
+                    report[table_name] = 0
+                    while True:
+                        batch = list(islice(rows, batch_size))
+                        if not batch:
+                            break
+                        self.conn.executemany(sql, batch)
+                        report[table_name] += len(batch)
+        except Exception as e:
+            logger.error(str(e))
+            raise
+        elapsed = time.perf_counter() - start
+        rows = sum(report.values())
+        return {
+            "rows": report,
+            "elapsed_s": round(elapsed, 4),
+            "rows_per_sec": round(rows / elapsed) if elapsed else 0,
+        }
+
+    def tune_for_bulk_load(self, wal: bool = False):
+        """Настраивает подключение для массовой загрузки: транзакция пишется на диск одним
+        fsync при фиксации, временные данные хранятся в памяти, кэш страниц увеличен"""
+        if wal:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA cache_size=-16000")
+
+    def close(self):
+        self.conn.close()
+
 
     def get_data_from_table(self, table_name, id):
         """Получает слово из таблицы table_name по указанному id"""
         try:
-            print("попытка поиска")
             c = self.conn.cursor()
             sql = "SELECT word FROM " + table_name + " WHERE id=?"
             res = c.execute(sql, [(id)]).fetchall()
             return res[0][0]
         except Exception as e:
-            logging.error(str(e))
+            logger.error(str(e))
             raise
 
+class WordList:
+    """Неизменяемый список слов поверх буфера байтов и таблицы смещений
+    Слово с индексом i - байты от offsets[i] до offsets[i + 1], доступ по индексу O(1)"""
+    __slots__ = ("_data", "_offsets")
+
+    def __init__(self, data, offsets):
+        self._data = data
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int):
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return str(self._data[self._offsets[index]:self._offsets[index + 1]], "utf-8")
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+
+class WordTables:
+    """Таблицы существительных и прилагательных для генерации имен
+    Загружаются один раз из бинарного файла, который строит команда build_words: заголовок,
+    таблицы смещений существительных и прилагательных и слова подряд в utf-8. Файл отображается
+    в память и разделяется процессами. Если файла нет, слова один раз читаются из words_database.db"""
+
+    def __init__(self, nouns: WordList, adjectives: WordList, close=None):
+        self.nouns = nouns
+        self.adjectives = adjectives
+        self._close = close
+
+    @classmethod
+    def build(cls, nouns, adjectives, path: str):
+        """Записывает списки слов в бинарный файл path, возвращает количество слов"""
+        nouns = [word.encode("utf-8") for word in nouns]
+        adjectives = [word.encode("utf-8") for word in adjectives]
+        offset = WORDS_HEADER.size + OFFSET.size * (len(nouns) + len(adjectives) + 2)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(WORDS_HEADER.pack(WORDS_MAGIC, len(nouns), len(adjectives)))
+            for words in (nouns, adjectives):
+                for word in words:
+                    file.write(OFFSET.pack(offset))
+                    offset += len(word)
+                file.write(OFFSET.pack(offset))
+            for word in nouns + adjectives:
+                file.write(word)
+        os.replace(tmp_path, path)
+        return len(nouns) + len(adjectives)
+
+    @classmethod
+    def load(cls, path: str):
+        """Отображает в память файл, построенный build"""
+        with open(path, "rb") as file:
+            mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, nouns_count, adjectives_count = WORDS_HEADER.unpack_from(mm, 0)
+        if magic != WORDS_MAGIC:
+            mm.close()
+            raise ValueError("%s не является файлом слов" % path)
+        end = WORDS_HEADER.size + OFFSET.size * (nouns_count + adjectives_count + 2)
+        offsets = memoryview(mm)[WORDS_HEADER.size:end].cast("I")
+        nouns = WordList(mm, offsets[:nouns_count + 1])
+        adjectives = WordList(mm, offsets[nouns_count + 1:])
+
+        def close():
+            for view in (nouns._offsets, adjectives._offsets, offsets):
+                view.release()
+            mm.close()
+
+        return cls(nouns, adjectives, close)
+
+    @classmethod
+    def from_words(cls, nouns, adjectives):
+        """Таблицы в памяти процесса из списков слов"""
+        return cls(cls._pack(nouns), cls._pack(adjectives))
+
+    @staticmethod
+    def _pack(words):
+        data = bytearray()
+        offsets = [0]
+        for word in words:
+            data += word.encode("utf-8")
+            offsets.append(len(data))
+        return WordList(bytes(data), memoryview(struct.pack("<%dI" % len(offsets), *offsets)).cast("I"))
+
+    @classmethod
+    def from_database(cls, path: str):
+        """Читает слова из базы words_database.db в порядке id"""
+        conn = sqlite3.connect(path)
+        try:
+            words = [
+                [row[0] for row in conn.execute("SELECT word FROM %s ORDER BY CAST(id AS INTEGER)" % table_name)]
+                for table_name in ("nouns", "adjectives")
+            ]
+        finally:
+            conn.close()
+        return cls.from_words(*words)
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+
+
+class FeistelPermutation:
+    """Псевдослучайная перестановка чисел 0..size-1, заданная ключом
+    Сеть Фейстеля шифрует числа в диапазоне ближайшей сверху четной степени двойки, значения
+    за пределами size шифруются повторно (cycle walking), пока не попадут в диапазон. Диапазон
+    не больше 4 * size, поэтому повторов в среднем меньше четырех, перестановка хранит только ключ"""
+    rounds = 4
+
+    def __init__(self, size: int, key: bytes):
+        self.size = size
+        bits = max(2, (size - 1).bit_length())
+        self.half = (bits + 1) // 2
+        self.mask = (1 << self.half) - 1
+        self.key = key
+
+    def _round(self, number: int, value: int):
+        digest = hashlib.blake2b(value.to_bytes(8, "little"), digest_size=8, key=self.key, salt=bytes([number]))
+        return int.from_bytes(digest.digest(), "little") & self.mask
+
+    def _encrypt(self, value: int):
+        left, right = value >> self.half, value & self.mask
+        for number in range(self.rounds):
+            left, right = right, left ^ self._round(number, right)
+        return (left << self.half) | right
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index: int):
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        value = self._encrypt(index)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+
+class BloomFilter:
+    """Фильтр Блума: проверка принадлежности строки множеству за O(1) без хранения самих строк
+    Ложноотрицательных ответов нет, ложноположительные - с вероятностью около error_rate,
+    пока в фильтре не больше capacity строк"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.capacity = max(1, capacity)
+        self.size = max(64, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Двойное хэширование: k позиций из двух независимых 64-битных хэшей
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + number * second) % self.size for number in range(self.hashes))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+_word_tables = None
+_word_tables_lock = threading.Lock()
+
+
+def get_word_tables():
+    """Возвращает общие для процесса таблицы слов из USER_WORDS_ASSET
+    или из USER_WORDS_DATABASE, если файл слов не построен"""
+    global _word_tables
+    if _word_tables is None:
+        with _word_tables_lock:
+            if _word_tables is None:
+                path = getattr(settings, "USER_WORDS_ASSET", None)
+                if path and os.path.exists(path):
+                    _word_tables = WordTables.load(path)
+                else:
+                    path = getattr(settings, "USER_WORDS_DATABASE", "words_database.db")
+                    _word_tables = WordTables.from_database(path)
+    return _word_tables
+
+
+def reset():
+    """Закрывает загруженные таблицы слов, следующий вызов загрузит их заново"""
+    global _word_tables
+    with _word_tables_lock:
+        if _word_tables is not None:
+            _word_tables.close()
+            _word_tables = None
+    unique_names.reset()
+    taken_names.reset()
+
+
+class TakenNames:
+    """Фильтр Блума по именам существующих пользователей
+    Строится одним запросом к базе при первой проверке и пополняется при сохранении пользователя,
+    когда пользователей становится больше его емкости, перестраивается"""
+
+    def __init__(self):
+        self._filter = None
+        self._lock = threading.Lock()
+
+    def _build(self):
+        usernames = MyUser.objects.values_list("username", flat=True)
+        bloom = BloomFilter(
+            max(1024, 2 * usernames.count()), getattr(settings, "USER_NAME_BLOOM_ERROR_RATE", 0.001)
+        )
+        for username in usernames.iterator():
+            bloom.add(username)
+        return bloom
+
+    def add(self, name: str):
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(name)
+                if self._filter.count > self._filter.capacity:
+                    self._filter = None
+
+    def reset(self):
+        with self._lock:
+            self._filter = None
+
+    def __contains__(self, name: str):
+        with self._lock:
+            if self._filter is None:
+                self._filter = self._build()
+            return name in self._filter
+
+
+taken_names = TakenNames()
+
+
+@receiver(post_save, sender=MyUser)
+def add_taken_name(sender, instance, **kwargs):
+    """Добавляет имя сохраненного пользователя в фильтр занятых имен"""
+    taken_names.add(instance.username)
+
+
+class NameCursor:
+    """Общий для процессов курсор обхода перестановки имен в базе USER_NAME_CURSOR_DATABASE
+    Хранит ключ перестановки, размер пространства имен и следующую позицию. Процесс забирает
+    позиции блоками в транзакции BEGIN IMMEDIATE, поэтому блоки разных процессов не пересекаются.
+    Когда пространство пройдено или изменился размер словаря, выбирается новый ключ"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def reserve(self, size: int, count: int):
+        """Возвращает ключ перестановки и диапазон зарезервированных позиций"""
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS name_cursor ("
+                         "id INTEGER PRIMARY KEY CHECK (id = 0), key BLOB, size INTEGER, position INTEGER)")
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT key, size, position FROM name_cursor WHERE id = 0").fetchone()
+            if row is None or row[1] != size or row[2] >= size:
+                key, position = os.urandom(16), 0
+            else:
+                key, _, position = row
+            end = min(size, position + count)
+            conn.execute("INSERT OR REPLACE INTO name_cursor (id, key, size, position) VALUES (0, ?, ?, ?)",
+                         (key, size, end))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return bytes(key), range(position, end)
+
+
+class UniqueNameGenerator:
+    """Генерация неповторяющихся имен
+    Пространство имен прилагательное x существительное обходится по псевдослучайной перестановке
+    без повторов, позиции забираются у общего курсора блоками по USER_NAME_BLOCK_SIZE, поэтому
+    обращение к курсору - одно на блок. Занятые имена отсеиваются фильтром Блума без запросов к базе"""
+
+    def __init__(self):
+        self._permutation = None
+        self._positions = iter(())
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self._permutation = None
+            self._positions = iter(())
+
+    def _next_position(self, tables):
+        position = next(self._positions, None)
+        if position is None:
+            size = len(tables.adjectives) * len(tables.nouns)
+            path = getattr(settings, "USER_NAME_CURSOR_DATABASE", None) \
+                or getattr(settings, "USER_WORDS_DATABASE", "words_database.db")
+            key, positions = NameCursor(path).reserve(size, getattr(settings, "USER_NAME_BLOCK_SIZE", 256))
+            if self._permutation is None or self._permutation.key != key or self._permutation.size != size:
+                self._permutation = FeistelPermutation(size, key)
+            self._positions = iter(positions)
+            position = next(self._positions)
+        return self._permutation[position]
+
+    def gen(self, count: int = 1):
+        """Возвращает count новых имен, которых нет среди имен пользователей
+        Если таблицы слов пусты или свободных имен не осталось, выбрасывает ValueError"""
+        tables = get_word_tables()
+        size = len(tables.adjectives) * len(tables.nouns)
+        if size == 0:
+            raise ValueError("Таблицы слов пусты, загрузите слова командой build_words или load_words")
+        names = []
+        with self._lock:
+            skipped = 0
+            while len(names) < count:
+                adjective, noun = divmod(self._next_position(tables), len(tables.nouns))
+                name = tables.adjectives[adjective] + tables.nouns[noun]
+                if name in taken_names:
+                    skipped += 1
+                    if skipped >= size:
+                        raise ValueError("Свободных имен не осталось")
+                    continue
+                taken_names.add(name)
+                names.append(name)
+        return names
+
+
+unique_names = UniqueNameGenerator()
+
+
 class NameGeneration:
-    """Генерация имени"""
+    """Генерация имени
+    Слова берутся из загруженных один раз таблиц, поэтому генерация не обращается к диску"""
     @staticmethod
     def gen():
         """Генерирует случайное имя из прилагательного и существительного"""
-        wordDB = WordsDatabase()
-        noun_id = random.randint(0, 2445)
-        adjective_id = random.randint(0, 1914)
-        name = wordDB.get_data_from_table("adjectives", adjective_id)
-        name += wordDB.get_data_from_table("nouns", noun_id)
-        return name
\ No newline at end of file
+        tables = get_word_tables()
+        name = tables.adjectives[random.randrange(len(tables.adjectives))]
+        name += tables.nouns[random.randrange(len(tables.nouns))]
+        return name
+
+    @staticmethod
+    def gen_many(count: int):
+        """Генерирует count случайных имен за один вызов"""
+        tables = get_word_tables()
+        adjectives = random.choices(range(len(tables.adjectives)), k=count)
+        nouns = random.choices(range(len(tables.nouns)), k=count)
+        return [tables.adjectives[adjective] + tables.nouns[noun] for adjective, noun in zip(adjectives, nouns)]
+
+    @staticmethod
+    def gen_unique(count: int = 1):
+        """Генерирует count неповторяющихся имен, не занятых пользователями"""
+        return unique_names.gen(count)
\ No newline at end of file
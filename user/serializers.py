@@ -1,23 +1,31 @@
-from django.contrib.auth import authenticate
+from .hashing import authenticate
 from rest_framework import serializers
 from .models import MyUser
+from .namegenerator import NameGeneration
 import re
 
 
 class RegistrationSerializer(serializers.ModelSerializer):
     """
     Creates a new user.
-    Email, username, and password are required.
+    Email and password are required. If no username is given, a unique
+    one is generated.
     Returns a JSON web token.
     """
 
     def validate(self, data):
         """
-        Check that the start is before the stop.
+        Check the password and generate a username if it is missing.
         """
         if not re.match(r"^(?=.*[a-z])(?=.*[A-Z])(?=.*[0-9]).*$", data['password']):
             raise serializers.ValidationError("Password incorrect")
 
+        if not data.get('username'):
+            try:
+                data['username'] = NameGeneration.gen_unique()[0]
+            except ValueError as ex:
+                raise serializers.ValidationError(str(ex))
+
         return data
 
     # The password must be validated and should not be read by the client
@@ -33,6 +41,8 @@ class RegistrationSerializer(serializers.ModelSerializer):
         write_only=True,
     )
 
+    username = serializers.CharField(max_length=30, required=False)
+
     # The client should not be able to send a token along with a registration
     # request. Making `token` read-only handles that for us.
     token = serializers.CharField(max_length=255, read_only=True)
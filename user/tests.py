@@ -1,6 +1,22 @@
 from rest_framework.test import APITestCase as TestCase
+import os
+import sys
+import subprocess
+import sqlite3
+import tempfile
+import threading
+from unittest import mock
+from rest_framework import exceptions
+from django.test import RequestFactory, SimpleTestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import override_settings
 
 from .models import MyUser as User
+from . import hashing, namegenerator, importer
+from .namegenerator import NameGeneration, WordTables, WordsDatabase, FeistelPermutation, BloomFilter, \
+    UniqueNameGenerator
+from .backends import JWTAuthentication, ClaimsJWTAuthentication, TokenPrincipal, token_cache, user_cache, \
+    deny_list
 
 # Create your tests here.
 
@@ -71,3 +87,330 @@ class UserListViewTest(TestCase):
         resp = self.signup('Username7@mail.ru', 'Username7', 'Password')
         self.assertEqual(resp.status_code, 403)
 
+
+class AuthenticationCacheTest(TestCase):
+
+    def setUp(self):
+        """Настройка контекста для теста"""
+        token_cache.clear()
+        user_cache.clear()
+        deny_list.clear()
+        self.user = User.objects.create_user('Cached@mail.ru', 'Cached', 'Password1')
+        self.request = RequestFactory().get('/get-name/', HTTP_AUTHORIZATION='Token ' + self.user.token)
+
+    def test_cached_authentication(self):
+        """Тестирование аутентификации без запросов к базе после первого запроса"""
+        JWTAuthentication().authenticate(self.request)
+        with self.assertNumQueries(0):
+            user, _ = JWTAuthentication().authenticate(self.request)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_cached_user_copies(self):
+        """Тестирование выдачи отдельного экземпляра пользователя из кэша на каждый запрос"""
+        JWTAuthentication().authenticate(self.request)
+        first, _ = JWTAuthentication().authenticate(self.request)
+        second, _ = JWTAuthentication().authenticate(self.request)
+        self.assertIsNot(first, second)
+        self.assertEqual(first.mail, second.mail)
+
+    def test_deactivated_user(self):
+        """Тестирование сброса кэша при изменении пользователя"""
+        JWTAuthentication().authenticate(self.request)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            JWTAuthentication().authenticate(self.request)
+
+
+class ClaimsAuthenticationTest(TestCase):
+
+    def setUp(self):
+        """Настройка контекста для теста"""
+        token_cache.clear()
+        user_cache.clear()
+        deny_list.clear()
+        self.user = User.objects.create_user('Claims@mail.ru', 'Claims', 'Password1')
+        self.client.cookies['Token'] = self.user.token
+
+    def test_get_name_without_queries(self):
+        """Тестирование получения имени пользователя из утверждений токена без запросов к базе"""
+        deny_list.refresh()
+        with self.assertNumQueries(0):
+            resp = self.client.get('/get-name/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data, 'Claims')
+
+    @override_settings(AUTH_DENY_LIST_REFRESH=0)
+    def test_stale_deny_list_refreshed_in_background(self):
+        """Тестирование обновления устаревшего списка отключенных пользователей в фоновом потоке"""
+        deny_list.refresh()
+        done = threading.Event()
+        threads = []
+
+        def refresh():
+            threads.append(threading.current_thread().name)
+            done.set()
+
+        with mock.patch.object(deny_list, 'refresh', refresh), self.assertNumQueries(0):
+            resp = self.client.get('/get-name/')
+            self.assertTrue(done.wait(5))
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(threads[0].startswith('deny-list-refresh'))
+
+    def test_principal_loads_user(self):
+        """Тестирование загрузки пользователя при обращении к полю, которого нет в утверждениях"""
+        request = RequestFactory().get('/get-name/', HTTP_AUTHORIZATION='Token ' + self.user.token)
+        principal, _ = ClaimsJWTAuthentication().authenticate(request)
+        self.assertIsInstance(principal, TokenPrincipal)
+        self.assertEqual(principal.mail, 'Claims@mail.ru')
+
+    def test_deactivated_user(self):
+        """Тестирование отказа по токену с действительными утверждениями для отключенного пользователя"""
+        self.user.is_active = False
+        self.user.save()
+        resp = self.client.get('/get-name/')
+        self.assertEqual(resp.status_code, 403)
+
+    @override_settings(AUTH_CLAIMS_TTL=-1)
+    def test_expired_claims(self):
+        """Тестирование загрузки пользователя, если утверждения токена устарели"""
+        request = RequestFactory().get('/get-name/', HTTP_AUTHORIZATION='Token ' + self.user.token)
+        user, _ = ClaimsJWTAuthentication().authenticate(request)
+        self.assertIsInstance(user, User)
+
+
+class PasswordHashingTest(TestCase):
+
+    def test_hash_in_pool(self):
+        """Тестирование хэширования пароля при регистрации в пуле хэширования"""
+        threads = []
+        make_password = hashing.hashers.make_password
+
+        def record(password):
+            threads.append(threading.current_thread().name)
+            return make_password(password)
+
+        with mock.patch.object(hashing.hashers, 'make_password', record):
+            User.objects.create_user('Hashed@mail.ru', 'Hashed', 'Password1')
+        self.assertTrue(threads[0].startswith('password-hash'))
+
+    def test_rehash_on_login(self):
+        """Тестирование перехэширования пароля с новой стоимостью при входе"""
+        with override_settings(AUTH_PASSWORD_ITERATIONS=1000):
+            user = User.objects.create_user('Rehash@mail.ru', 'Rehash', 'Password1')
+        self.assertIn('$1000$', user.password)
+        with override_settings(AUTH_PASSWORD_ITERATIONS=2000):
+            resp = self.client.post('/login/', data={'mail': 'Rehash@mail.ru', 'password': 'Password1'})
+        self.assertEqual(resp.status_code, 200)
+        user.refresh_from_db()
+        self.assertIn('$2000$', user.password)
+
+
+class NameGenerationTest(SimpleTestCase):
+    nouns = ["Cat", "Dog", "Fox"]
+    adjectives = ["Red", "Quick"]
+
+    def setUp(self):
+        """Настройка контекста для теста"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "words.bin")
+        WordTables.build(self.nouns, self.adjectives, self.path)
+        namegenerator.reset()
+        self.addCleanup(namegenerator.reset)
+
+    def test_word_tables(self):
+        """Тестирование чтения слов из бинарного файла"""
+        tables = WordTables.load(self.path)
+        self.addCleanup(tables.close)
+        self.assertEqual(list(tables.nouns), self.nouns)
+        self.assertEqual(list(tables.adjectives), self.adjectives)
+        with self.assertRaises(IndexError):
+            tables.nouns[3]
+
+    def test_gen_without_io(self):
+        """Тестирование генерации имен без обращения к базе слов"""
+        with override_settings(USER_WORDS_ASSET=self.path):
+            NameGeneration.gen()
+            with mock.patch.object(sqlite3, "connect") as connect, mock.patch("builtins.open") as open_file:
+                names = [NameGeneration.gen()] + NameGeneration.gen_many(50)
+        connect.assert_not_called()
+        open_file.assert_not_called()
+        self.assertEqual(len(names), 51)
+        combinations = {adjective + noun for adjective in self.adjectives for noun in self.nouns}
+        self.assertTrue(set(names) <= combinations)
+
+
+class WordsDatabaseTest(SimpleTestCase):
+
+    def setUp(self):
+        """Настройка контекста для теста"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.database = WordsDatabase(os.path.join(directory.name, "words.db"))
+        self.addCleanup(self.database.close)
+        self.nouns = ["noun%s" % number for number in range(2500)]
+
+    def count(self, table_name):
+        return self.database.conn.execute("SELECT COUNT(*) FROM " + table_name).fetchone()[0]
+
+    def test_bulk_load(self):
+        """Тестирование загрузки слов пачками из итератора"""
+        report = self.database.bulk_load({"nouns": iter(self.nouns), "adjectives": ["Red"]}, batch_size=1000)
+        self.assertEqual(report["rows"], {"nouns": 2500, "adjectives": 1})
+        self.assertEqual(self.count("nouns"), 2500)
+        self.assertEqual(self.database.get_data_from_table("nouns", "2499"), "noun2499")
+
+    def test_upsert(self):
+        """Тестирование повторной загрузки с перезаписью и отката загрузки с повторяющимися id"""
+        self.database.bulk_load({"nouns": self.nouns})
+        self.database.bulk_load({"nouns": ["Cat"]}, upsert=True)
+        self.assertEqual(self.count("nouns"), 2500)
+        self.assertEqual(self.database.get_data_from_table("nouns", "0"), "Cat")
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.database.bulk_load({"adjectives": ["Red"], "nouns": ["Dog"]})
+        self.assertEqual(self.count("adjectives"), 0)
+
+
+class UniqueNameGenerationTest(TestCase):
+
+    def setUp(self):
+        """Настройка контекста для теста"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        asset = os.path.join(directory.name, "words.bin")
+        WordTables.build(["Cat", "Dog", "Fox"], ["Red", "Quick"], asset)
+        settings = override_settings(
+            USER_WORDS_ASSET=asset, USER_NAME_CURSOR_DATABASE=os.path.join(directory.name, "cursor.db"),
+            USER_NAME_BLOCK_SIZE=2
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        namegenerator.reset()
+        self.addCleanup(namegenerator.reset)
+
+    def test_feistel_permutation(self):
+        """Тестирование перестановки: каждое число диапазона встречается ровно один раз"""
+        for size in (1, 2, 6, 1000, 4659):
+            permutation = FeistelPermutation(size, b"key")
+            self.assertEqual(sorted(permutation[index] for index in range(size)), list(range(size)))
+
+    def test_bloom_filter(self):
+        """Тестирование фильтра Блума: добавленные строки всегда найдены, ложных срабатываний мало"""
+        bloom = BloomFilter(1000, 0.01)
+        for number in range(1000):
+            bloom.add("name%s" % number)
+        self.assertTrue(all("name%s" % number in bloom for number in range(1000)))
+        false_positives = sum("other%s" % number in bloom for number in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_unique_names(self):
+        """Тестирование неповторяющихся имен, не занятых пользователями, без запросов к базе на имя"""
+        User.objects.create_user('Taken@mail.ru', 'RedCat', 'Password1')
+        first = NameGeneration.gen_unique(2)
+        with self.assertNumQueries(0):
+            # Второй генератор с тем же курсором продолжает обход, а не начинает его заново
+            second = UniqueNameGenerator().gen(3)
+        names = first + second
+        self.assertEqual(len(set(names)), 5)
+        self.assertNotIn('RedCat', names)
+        with self.assertRaises(ValueError):
+            NameGeneration.gen_unique()
+
+    def test_empty_tables(self):
+        """Тестирование понятной ошибки, если таблицы слов пусты"""
+        asset = os.path.join(self.directory, "empty.bin")
+        WordTables.build([], [], asset)
+        with override_settings(USER_WORDS_ASSET=asset):
+            namegenerator.reset()
+            with self.assertRaisesRegex(ValueError, "Таблицы слов пусты"):
+                NameGeneration.gen_unique()
+
+    def test_registration_generates_name(self):
+        """Тестирование регистрации и импорта без имени: имя генерируется без повторов"""
+        serializer = RegistrationSerializer(data={'mail': 'Noname@mail.ru', 'password': 'Password1'})
+        serializer.is_valid(raise_exception=True)
+        user = serializer.save()
+        rows = importer.read_bytes(b"mail,password\nNoname1@mail.ru,Password1\nNoname2@mail.ru,Password2\n", "csv")
+        with override_settings(AUTH_PASSWORD_ITERATIONS=1000):
+            report = importer.UserImporter(processes=False).run(rows)
+        self.assertEqual(report["created"], 2)
+        names = set(User.objects.values_list('username', flat=True))
+        self.assertEqual(len(names), 3)
+        self.assertIn(user.username, names)
+        self.assertTrue(names <= {adjective + noun for adjective in ("Red", "Quick") for noun in ("Cat", "Dog", "Fox")})
+
+
+@override_settings(USER_IMPORT_WORKERS=2, AUTH_PASSWORD_ITERATIONS=1000)
+class ImportUsersTest(TestCase):
+    rows = (
+        "mail,username,password\n"
+        "Import1@mail.ru,Import1,Password1\n"
+        "Import2@mail.ru,Import2,password\n"
+        "Import1@mail.ru,Import3,Password3\n"
+        "Existing@mail.ru,Import4,Password4\n"
+        "Import5@mail.ru,Import5,Password5\n"
+    )
+
+    def setUp(self):
+        """Настройка контекста для теста"""
+        self.addCleanup(importer.reset)
+        User.objects.create_user('Existing@mail.ru', 'Existing', 'Password1')
+
+    def test_import_csv(self):
+        """Тестирование импорта с отклонением некорректных и повторяющихся строк"""
+        rows = importer.read_bytes(self.rows.encode("utf-8"), "csv")
+        report = importer.UserImporter(batch_size=2).run(rows)
+        self.assertEqual(report["created"], 2)
+        self.assertEqual([row["line"] for row in report["rejected"]], [3, 4, 5])
+        user = User.objects.get(mail='Import5@mail.ru')
+        self.assertTrue(user.check_password('Password5'))
+
+    def test_import_jsonl(self):
+        """Тестирование импорта JSONL с некорректной строкой"""
+        data = (b'{"mail": "Json@mail.ru", "username": "Json", "password": "Password1"}\nnot json\n'
+                b'{"mail": "Error@mail.ru", "username": "Error", "password": "Password1", "error": "none"}\n')
+        report = importer.UserImporter().run(importer.read_bytes(data, "jsonl"))
+        self.assertEqual(report["created"], 2)
+        self.assertEqual(report["rejected"], [{"line": 2, "errors": {"row": ["Некорректная строка JSON"]}}])
+
+    def test_import_api(self):
+        """Тестирование импорта через API, доступного только администраторам"""
+        upload = SimpleUploadedFile("users.csv", self.rows.encode("utf-8"))
+        self.client.cookies['Token'] = User.objects.get(mail='Existing@mail.ru').token
+        resp = self.client.post('/import-users/', {'file': upload})
+        self.assertEqual(resp.status_code, 403)
+        self.client.cookies['Token'] = User.objects.create_user('Admin@mail.ru', 'Admin', 'Password1', is_staff=True).token
+        upload.seek(0)
+        resp = self.client.post('/import-users/', {'file': upload})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["created"], 2)
+
+    def test_import_api_body(self):
+        """Тестирование импорта из тела запроса, которое читается по строкам"""
+        self.client.cookies['Token'] = User.objects.create_user('Admin@mail.ru', 'Admin', 'Password1', is_staff=True).token
+        resp = self.client.generic('POST', '/import-users/', ("\ufeff" + self.rows).encode("utf-8"),
+                                   content_type='text/csv')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data["created"], 2)
+        self.assertEqual([row["line"] for row in resp.data["rejected"]], [3, 4, 5])
+        resp = self.client.generic('POST', '/import-users/', b'', content_type='application/json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertIsNone(importer._executor)
+
+    @override_settings(USER_IMPORT_API_MAX_SIZE=64)
+    def test_import_api_size_limit(self):
+        """Тестирование отклонения большого запроса импорта через API"""
+        self.client.cookies['Token'] = User.objects.create_user('Admin@mail.ru', 'Admin', 'Password1', is_staff=True).token
+        resp = self.client.generic('POST', '/import-users/', self.rows.encode("utf-8"), content_type='text/csv')
+        self.assertEqual(resp.status_code, 413)
+        self.assertFalse(User.objects.filter(mail='Import1@mail.ru').exists())
+
+    def test_import_keeps_root_logging(self):
+        """Тестирование импорта модуля генерации имен без замены обработчиков корневого логгера"""
+        code = ("import logging, django; django.setup(); handlers = list(logging.root.handlers); "
+                "import user.namegenerator; assert logging.root.handlers == handlers, logging.root.handlers")
+        subprocess.run([sys.executable, "-c", code], check=True, env=dict(
+            os.environ, DJANGO_SETTINGS_MODULE="Backend_ChinaTranslator.settings"
+        ))
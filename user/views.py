@@ -1,15 +1,18 @@
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView, exception_handler
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
+from rest_framework.parsers import MultiPartParser
 from rest_framework.exceptions import NotAuthenticated, ValidationError
 
+from django.conf import settings
 from django.db.utils import IntegrityError
 
 from .models import MyUser
-from .backends import JWTAuthentication
+from .backends import ClaimsJWTAuthentication
 from .serializers import LoginSerializer
 from .serializers import RegistrationSerializer
+from . import importer
 
 
 def custom_exception_handler(exc, context):
@@ -76,11 +79,45 @@ class LoginAPIView(APIView):
         return response
 
 class GetUserNameAPIView(APIView):
-    permission_classes = [AllowAny]
+    """Имя пользователя берется из подписанных утверждений токена без запроса к базе
+    Доступен авторизованным пользователям"""
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [IsAuthenticated]
 
     def get(self, request):
+        """Обработка get-запроса
+        Возвращает имя пользователя, которому принадлежит токен"""
+        return Response(request.user.username, status=status.HTTP_200_OK)
+
+
+class ImportUsersAPIView(APIView):
+    """Импорт небольшого числа пользователей из CSV или JSONL
+    Файлы больше USER_IMPORT_API_MAX_SIZE байт импортируются командой import_users
+    Доступен администраторам"""
+    permission_classes = [IsAdminUser]
+    parser_classes = [MultiPartParser]
+    content_types = {"text/csv": "csv", "application/x-ndjson": "jsonl", "application/jsonl": "jsonl"}
+
+    def post(self, request):
         """Обработка post-запроса
-        Проверяет наличие пользователя с переданными в json данными
-        Если такой пользователь сущетсвует, то возвращает json с токеном"""
-        user, _ = JWTAuthentication().authenticate(request)
-        return Response(user.username, status=status.HTTP_200_OK)
+        Принимает файл в поле file формы (формат по расширению) или тело запроса с типом
+        text/csv или application/x-ndjson. Возвращает количество созданных пользователей
+        и отклоненные строки с ошибками. Если формат не распознан, возвращает ошибку со статусом 400,
+        если запрос больше USER_IMPORT_API_MAX_SIZE байт - со статусом 413"""
+        # Импорт выполняется в запросе без пула процессов, поэтому размер запроса ограничен
+        max_size = getattr(settings, "USER_IMPORT_API_MAX_SIZE", 16 * 1024)
+        if int(request.META.get("CONTENT_LENGTH") or 0) > max_size:
+            return Response("Запрос больше %d байт, используйте команду import_users" % max_size,
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        # Файл и тело запроса читаются по строкам по мере импорта, а не целиком в память:
+        # загруженный файл большого размера Django хранит во временном файле на диске
+        content_type = request.content_type.split(";")[0].strip()
+        if content_type == "multipart/form-data":
+            upload = request.FILES.get("file")
+            format, lines = (importer.detect_format(upload.name), upload) if upload else (None, None)
+        else:
+            format, lines = self.content_types.get(content_type), request.stream
+        if format is None or lines is None:
+            return Response("Ожидается файл .csv или .jsonl", status=status.HTTP_400_BAD_REQUEST)
+        report = importer.UserImporter(processes=False).run(importer.read_lines(lines, format))
+        return Response(report, status=status.HTTP_200_OK)